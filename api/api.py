@@ -1,44 +1,516 @@
-from flask import Flask, request, abort
+"""
+A coin node: the REST routes and the websocket peer protocol (see p2p.py)
+served from one asyncio process that shares the block chain directly.
+Changes to the chain (appending mined blocks, validating and connecting
+peers' blocks) run on a single worker thread, so they never stall the event
+loop and never happen at the same time. Mining itself is a background job,
+see jobs.py.
+"""
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import os
+from typing import AsyncIterator, List, Optional, Tuple
 
-from coin.block import BlockChain
+from aiohttp import web
 
-app = Flask(__name__)
-app.config["DEBUG"] = True
+from coin import codec, metrics
+from coin.block import Block, BlockChain
+from coin.mempool import Mempool
+from coin.sync import LocalNode
+from coin.transaction import Transaction, transactions_from_dicts
+from jobs import MiningJobs
+from p2p import PeerPool
 
+# Number of processes used for the nonce search, 1 keeps the serial search.
+MINING_WORKERS = int(os.environ.get("MINING_WORKERS", 1))
+# Number of processes verifying the signatures of each connected block.
+VALIDATION_WORKERS = int(os.environ.get("VALIDATION_WORKERS", 1))
+# Directory of the on disk block store, the chain is in memory only if unset.
+COIN_DATA_DIR = os.environ.get("COIN_DATA_DIR")
+# Number of serialized blocks kept for /blocks.
+BLOCK_CACHE_SIZE = int(os.environ.get("BLOCK_CACHE_SIZE", 4096))
+# Comma separated websocket urls of the peers to stay connected to, eg;
+# ws://10.0.0.2:5000/ws
+PEERS: List[str] = [url for url in os.environ.get("PEERS", "").split(",") if url]
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", 5000))
+# Bytes of serialized blocks gathered before each write of a streamed response.
+STREAM_CHUNK_SIZE = 64 * 1024
+# Serve sampling profiles at /debug/profile, off unless set.
+COIN_PROFILING = os.environ.get("COIN_PROFILING") == "1"
+MAX_PROFILE_SECONDS = 60.
 
-block_chain: BlockChain = BlockChain()
 
+if COIN_DATA_DIR:
+    block_chain: BlockChain = BlockChain.open(
+        COIN_DATA_DIR, validation_workers=VALIDATION_WORKERS
+    )
+else:
+    block_chain = BlockChain(validation_workers=VALIDATION_WORKERS)
+node: LocalNode = LocalNode(block_chain)
+mempool = Mempool(block_chain)
+block_chain.listeners.append(mempool.chain_changed)
+# Everything that changes the chain runs here, one thing at a time.
+chain_executor = ThreadPoolExecutor(max_workers=1)
+peers = PeerPool(node, executor=chain_executor)
+mining_jobs = MiningJobs(block_chain, chain_executor, workers=MINING_WORKERS)
+# Our new blocks go out to peers and theirs make our mining work stale.
+mining_jobs.listeners.append(lambda block: peers.announce())
+peers.listeners.append(lambda connection: mining_jobs.tip_changed())
+routes = web.RouteTableDef()
 
-@app.route("/", methods=["GET"])
-def home():
-    return """ <h1>Crypto API</h1>"""
+BLOCKS_RESPONSE_SECONDS = metrics.Histogram(
+    "coin_api_blocks_response_seconds", "Time to serialize and send each /blocks response."
+)
+metrics.Gauge("coin_chain_height", "Height of our tip.", function=lambda: block_chain.length - 1)
+metrics.Gauge(
+    "coin_chain_work", "Cumulative work of our chain.",
+    function=lambda: block_chain.cummulative_difficulty
+)
+metrics.Gauge("coin_peers", "Open peer connections.", function=lambda: len(peers.connections))
 
 
-@app.route("/blocks", methods=["GET"])
-def blocks():
-    return block_chain.get_json()
+async def run_on_chain(function, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(
+        chain_executor, partial(function, *args, **kwargs)
+    )
 
 
-@app.route("/make_blocks", methods=["POST"])
-def make_blocks():
-    if not request.json or "data" not in request.json:
-        abort(400)
-    block_data: str = request.json['data']
-    block_chain.generate_new_block(block_data)
-    return "success", 201
+@routes.get("/")
+async def home(request: web.Request):
+    return web.Response(text=""" <h1>Crypto API</h1>""", content_type="text/html")
 
-# To send a request: r = requests.post("http://127.0.0.1:5000/mine_blocks",
-# json={"data": "llama"})
 
+class BlockCache:
+    """
+    Serialized blocks keyed by hash and format. A block never changes once
+    appended, so entries can't go stale; a reorg just stops asking for them.
+    Only used on chain_executor, next to the chain it serializes.
+    """
+    def __init__(self, maxsize: int):
+        self.maxsize: int = maxsize
+        self._serialized: "OrderedDict[Tuple[bytes, bool], bytes]" = OrderedDict()
 
-@app.route("/replace_chain", methods=["POST"])
-def replace_blocks():
-    global block_chain
-    if not request.json or "chain" not in request.json:
-        abort(400)
-    block_chain = BlockChain(json=request.json)
-    return "Success", 201
+    def get(self, block: Block, binary: bool) -> bytes:
+        key = (block.hash_digest, binary)
+        serialized = self._serialized.get(key)
+        if serialized is None:
+            if binary:
+                serialized = codec.encode_block_body(block)
+            else:
+                serialized = block.get_json().encode()
+            self._serialized[key] = serialized
+            if len(self._serialized) > self.maxsize:
+                self._serialized.popitem(last=False)
+        else:
+            self._serialized.move_to_end(key)
+        return serialized
+
+
+block_cache = BlockCache(BLOCK_CACHE_SIZE)
+
+
+def _accept_quality(accept: str, mimetype: str) -> float:
+    """Quality the Accept header gives `mimetype`, the most specific range wins."""
+    main_type = mimetype.split("/")[0]
+    best: Tuple[int, float] = (-1, 0.)
+    for media_range in accept.split(","):
+        params = media_range.split(";")
+        range_type = params[0].strip().lower()
+        quality = 1.
+        for param in params[1:]:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.
+        if range_type == mimetype:
+            specificity = 2
+        elif range_type == main_type + "/*":
+            specificity = 1
+        elif range_type == "*/*":
+            specificity = 0
+        else:
+            continue
+        best = max(best, (specificity, quality))
+    return best[1]
+
+
+def wants_binary(request: web.Request) -> bool:
+    """Binary is only sent to clients that prefer it over JSON."""
+    accept = request.headers.get("Accept")
+    if not accept:
+        return False
+    return _accept_quality(accept, codec.MIME_TYPE) > _accept_quality(accept, "application/json")
+
+
+def _etag_matches(request: web.Request, etag: str) -> bool:
+    if_none_match = request.headers.get("If-None-Match", "")
+    return any(
+        tag.strip() in (f'"{etag}"', f'W/"{etag}"', "*")
+        for tag in if_none_match.split(",")
+    )
+
+
+class ChainChanged(Exception):
+    """The blocks of a response were replaced while it was being sent."""
+
+
+async def blocks_response(
+    request: web.Request, chunks: AsyncIterator[bytes], etag: str, binary: bool
+) -> web.StreamResponse:
+    """
+    The hash of the last block sent commits to every block before it, so it
+    makes a strong ETag for any range ending there.
+    """
+    etag += "-bin" if binary else "-json"
+    headers = {"ETag": f'"{etag}"', "Vary": "Accept"}
+    if _etag_matches(request, etag):
+        return web.Response(status=304, headers=headers)
+    response = web.StreamResponse(headers=headers)
+    response.content_type = codec.MIME_TYPE if binary else "application/json"
+    with BLOCKS_RESPONSE_SECONDS.time():
+        await response.prepare(request)
+        try:
+            async for chunk in chunks:
+                await response.write(chunk)
+        except ChainChanged:
+            # Too late for an error status, the client just sees the body
+            # cut short rather than a mix of two branches.
+            if request.transport is not None:
+                request.transport.close()
+            return response
+        await response.write_eof()
+    return response
+
+
+def serialize_blocks(
+    start: int, stop: int, binary: bool, last_digest: bytes
+) -> Tuple[bytes, int]:
+    """
+    Blocks from `start` (up to stop - 1) serialized, JSON ones separated by
+    commas, until about STREAM_CHUNK_SIZE bytes, and the height to go on
+    from. Runs on chain_executor, as it reads the chain. Raises ChainChanged
+    once the block at stop - 1 is no longer `last_digest`; until then, it
+    commits to the blocks the response started with.
+    """
+    if block_chain.length < stop or block_chain.chain[stop - 1].hash_digest != last_digest:
+        raise ChainChanged()
+    chunks: List[bytes] = []
+    size = 0
+    height = start
+    while height < stop and size < STREAM_CHUNK_SIZE:
+        if chunks and not binary:
+            chunks.append(b", ")
+        chunk = block_cache.get(block_chain.chain[height], binary)
+        chunks.append(chunk)
+        size += len(chunk)
+        height += 1
+    return b"".join(chunks), height
+
+
+async def stream_blocks(
+    prefix: bytes, start: int, stop: int, binary: bool, last_digest: bytes, suffix: bytes
+) -> AsyncIterator[bytes]:
+    """
+    Serialized blocks start..stop - 1 between `prefix` and `suffix`, read a
+    chunk at a time on chain_executor, see serialize_blocks.
+    """
+    yield prefix
+    height = start
+    while height < stop:
+        if height > start and not binary:
+            yield b", "
+        chunk, height = await run_on_chain(
+            serialize_blocks, height, stop, binary, last_digest
+        )
+        yield chunk
+    yield suffix
+
+
+def block_chain_envelope(binary: bool) -> Tuple[bytes, bytes, int, bytes]:
+    """
+    What goes around the blocks for the same bytes as get_json or
+    encode_block_chain, the chain's length and its tip's digest. Runs on
+    chain_executor.
+    """
+    if binary:
+        prefix, suffix = codec.encode_block_chain_header(block_chain), b""
+    else:
+        prefix = (
+            '{"_cummulative_difficulty": %d, "block_generation_interval": %d, "chain": ['
+            % (block_chain.cummulative_difficulty, block_chain.block_generation_interval)
+        ).encode()
+        suffix = (
+            '], "difficulty_adjustment_interval": %d}'
+            % block_chain.difficulty_adjustment_interval
+        ).encode()
+    return prefix, suffix, block_chain.length, block_chain.latest_block.hash_digest
+
+
+def block_range_end(start: int, to: Optional[int]) -> Tuple[int, Optional[bytes]]:
+    """
+    The height after the last block of the range from `start` to `to` and
+    that block's digest, None when the range is empty. Runs on
+    chain_executor.
+    """
+    latest_index = block_chain.latest_block.index
+    stop = min(latest_index if to is None else to, latest_index) + 1
+    if start < 0 or start >= stop:
+        return stop, None
+    return stop, block_chain.chain[stop - 1].hash_digest
+
+
+def height_arg(request: web.Request, name: str) -> Optional[int]:
+    value: Optional[str] = request.query.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"{name} must be a block height.")
+
+
+@routes.get("/blocks")
+async def blocks(request: web.Request):
+    """
+    The whole chain, or with ?from=&to= the blocks between those heights
+    (inclusive, either may be left out) as a list.
+    """
+    binary = wants_binary(request)
+    if "from" not in request.query and "to" not in request.query:
+        prefix, suffix, length, last_digest = await run_on_chain(block_chain_envelope, binary)
+        return await blocks_response(
+            request,
+            stream_blocks(prefix, 0, length, binary, last_digest, suffix),
+            f"chain-{last_digest.hex()}",
+            binary
+        )
+    start = height_arg(request, "from") or 0
+    stop, last_digest = await run_on_chain(block_range_end, start, height_arg(request, "to"))
+    if last_digest is None:
+        raise web.HTTPBadRequest(text="Empty block range.")
+    if binary:
+        prefix, suffix = codec.encode_block_list_header(stop - start), b""
+    else:
+        prefix, suffix = b"[", b"]"
+    return await blocks_response(
+        request,
+        stream_blocks(prefix, start, stop, binary, last_digest, suffix),
+        f"{start}-{last_digest.hex()}",
+        binary
+    )
+
+
+def serialize_block(height: Optional[int], binary: bool) -> Optional[Tuple[str, bytes]]:
+    """
+    The hash and serialization of the block at `height`, or of the latest
+    with None; None when there is no such block. Runs on chain_executor.
+    """
+    if height is None:
+        block = block_chain.latest_block
+    elif height < block_chain.length:
+        block = block_chain.chain[height]
+    else:
+        return None
+    serialized = block_cache.get(block, binary)
+    if binary:
+        # The cache holds bodies, as they appear in chains and lists.
+        serialized = codec.encode_block_header() + serialized
+    return block.hashed_data, serialized
+
+
+async def single_block_response(request: web.Request, height: Optional[int]):
+    binary = wants_binary(request)
+    found = await run_on_chain(serialize_block, height, binary)
+    if found is None:
+        raise web.HTTPNotFound()
+    hashed_data, serialized = found
+
+    async def chunks() -> AsyncIterator[bytes]:
+        yield serialized
+    return await blocks_response(request, chunks(), hashed_data, binary)
+
+
+@routes.get(r"/blocks/{height:\d+}")
+async def block_at_height(request: web.Request):
+    return await single_block_response(request, int(request.match_info["height"]))
+
+
+@routes.get("/blocks/latest")
+async def latest_block(request: web.Request):
+    return await single_block_response(request, None)
+
+
+async def json_body(request: web.Request, *keys: str) -> dict:
+    """A JSON object with at least one of `keys`."""
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest()
+    if not isinstance(body, dict) or not any(key in body for key in keys):
+        raise web.HTTPBadRequest()
+    return body
+
+
+def block_template(coinbase_address: str) -> List[Transaction]:
+    """The mempool's block for our tip. Runs on chain_executor."""
+    return mempool.block_template(coinbase_address, block_chain.latest_block.index + 1)
+
+
+@routes.post("/transactions")
+async def submit_transactions(request: web.Request):
+    """
+    Add transactions (dicts as in Transaction.to_dict) to the mempool, for
+    /make_blocks jobs with a coinbase_address to mine. Answers 400 with the
+    reasons if any were rejected, the others are still added.
+    """
+    try:
+        transactions = transactions_from_dicts(
+            (await json_body(request, "transactions"))["transactions"]
+        )
+    except ValueError as e:
+        raise web.HTTPBadRequest(text=str(e))
+    errors = await run_on_chain(
+        lambda: [mempool.add(transaction) for transaction in transactions]
+    )
+    errors = [error for error in errors if error]
+    if errors:
+        raise web.HTTPBadRequest(text="\n".join(errors))
+    return web.json_response(
+        {"transaction_ids": [t.transaction_id for t in transactions]}, status=201
+    )
+
+
+@routes.post("/make_blocks")
+async def make_blocks(request: web.Request):
+    """
+    Queue a mining job for a block of the given transactions (dicts as in
+    Transaction.to_dict), or with a coinbase_address instead, for a block of
+    the best pending transactions paying its reward to that address. Its
+    progress is at /jobs/<job_id>.
+    """
+    body = await json_body(request, "transactions", "coinbase_address")
+    if "coinbase_address" in body:
+        if not isinstance(body["coinbase_address"], str):
+            raise web.HTTPBadRequest()
+        job = mining_jobs.submit([], partial(block_template, body["coinbase_address"]))
+    else:
+        try:
+            transactions = transactions_from_dicts(body["transactions"])
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        job = mining_jobs.submit(transactions)
+    return web.json_response(
+        job.to_dict(), status=202, headers={"Location": f"/jobs/{job.job_id}"}
+    )
+
+# To send a request: r = requests.post("http://127.0.0.1:5000/make_blocks",
+# json={"transactions": [get_coinbase_transaction(address, height).to_dict()]})
+# or json={"coinbase_address": address} to mine the mempool.
+
+
+@routes.get("/jobs/{job_id}")
+async def job_status(request: web.Request):
+    job = mining_jobs.get(request.match_info["job_id"])
+    if job is None:
+        raise web.HTTPNotFound()
+    return web.json_response(job.to_dict())
+
+
+@routes.post("/replace_chain")
+async def replace_blocks(request: web.Request):
+    if request.content_type == codec.MIME_TYPE:
+        # Loading a chain is CPU bound, like everything else done to one.
+        data = await request.read()
+        try:
+            new_chain = await run_on_chain(codec.decode_block_chain, data)
+        except ValueError:
+            raise web.HTTPBadRequest()
+    else:
+        body = await json_body(request, "chain")
+        try:
+            new_chain = await run_on_chain(BlockChain, json=body)
+        except (KeyError, TypeError, ValueError):
+            raise web.HTTPBadRequest()
+    try:
+        error = await run_on_chain(block_chain.replace_chain, new_chain.chain)
+    except (KeyError, TypeError, ValueError):
+        # The blocks are only decoded as replace_chain reaches them, see
+        # LazyChain.
+        raise web.HTTPBadRequest()
+    if error:
+        raise web.HTTPBadRequest(text=error)
+    mining_jobs.tip_changed()
+    peers.announce()
+    return web.Response(text="Success", status=201)
+
+
+@routes.get("/tip")
+async def tip(request: web.Request):
+    return web.json_response(await run_on_chain(node.tip))
+
+
+@routes.get("/metrics")
+async def metrics_text(request: web.Request):
+    """Prometheus scrape endpoint."""
+    return web.Response(
+        body=metrics.render().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
+
+
+@routes.get("/debug/profile")
+async def debug_profile(request: web.Request):
+    """
+    Sample every thread for ?seconds= (1 by default) and return the collapsed
+    stacks, for flame graph tools. Only served with COIN_PROFILING=1.
+    """
+    if not COIN_PROFILING:
+        raise web.HTTPNotFound()
+    try:
+        seconds = min(float(request.query.get("seconds", 1.)), MAX_PROFILE_SECONDS)
+    except ValueError:
+        raise web.HTTPBadRequest(text="seconds must be a number.")
+    profiler = await asyncio.get_running_loop().run_in_executor(
+        None, metrics.profile, seconds
+    )
+    return web.Response(text=profiler.collapsed())
+
+
+@routes.get("/ws")
+async def peer_socket(request: web.Request):
+    """Inbound peers, see p2p.py."""
+    websocket = web.WebSocketResponse()
+    await websocket.prepare(request)
+    await peers.serve(websocket, request.remote or "peer")
+    return websocket
+
+
+async def start_node(app: web.Application):
+    mining_jobs.start()
+    peers.start(PEERS)
+
+
+async def stop_node(app: web.Application):
+    await mining_jobs.close()
+    await peers.close()
+    # So the next start loads the unspent outputs rather than replaying.
+    await run_on_chain(block_chain.write_snapshot)
+    await run_on_chain(block_chain.close)
+    chain_executor.shutdown(wait=False)
+
+
+def make_app() -> web.Application:
+    app = web.Application()
+    app.add_routes(routes)
+    app.on_startup.append(start_node)
+    app.on_shutdown.append(stop_node)
+    return app
 
 
 if __name__ == "__main__":
-    app.run()
+    web.run_app(make_app(), host=HOST, port=PORT)
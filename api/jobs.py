@@ -0,0 +1,186 @@
+"""
+Mining as background jobs. /make_blocks queues a job and returns its id
+straight away; jobs are mined one at a time on their own thread, and the
+search is stopped and restarted on the new tip whenever the chain's latest
+block changes underneath it, so no hashes are spent on stale work.
+"""
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+import threading
+import time
+from typing import Callable, List, Optional
+import uuid
+
+from coin.block import Block, BlockChain
+from coin.transaction import Transaction
+
+
+# Finished jobs kept around for status queries.
+MAX_FINISHED_JOBS = 1000
+
+QUEUED = "queued"
+MINING = "mining"
+DONE = "done"
+FAILED = "failed"
+
+
+class MiningJob:
+    """
+    A block of `transactions`, or of whatever `template` returns for the
+    tip the search starts on (eg; the mempool's best transactions under a
+    coinbase for that height, see Mempool.block_template).
+    """
+    def __init__(
+        self,
+        transactions: List[Transaction],
+        template: Optional[Callable[[], List[Transaction]]] = None
+    ):
+        self.job_id: str = uuid.uuid4().hex
+        self.transactions: List[Transaction] = transactions
+        self.template: Optional[Callable[[], List[Transaction]]] = template
+        self.status: str = QUEUED
+        # Number of times the search was restarted on a new tip.
+        self.restarts: int = 0
+        self.created: float = time.time()
+        self.finished: Optional[float] = None
+        self.height: Optional[int] = None
+        self.hashed_data: Optional[str] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "transaction_ids": [t.transaction_id for t in self.transactions],
+            "status": self.status,
+            "restarts": self.restarts,
+            "created": self.created,
+            "finished": self.finished,
+            "height": self.height,
+            "hashed_data": self.hashed_data,
+            "error": self.error,
+        }
+
+
+class MiningJobs:
+    """
+    Queue of mining jobs. The nonce search runs on a thread of its own, not
+    on `chain_executor`, so the chain keeps taking peers' blocks meanwhile;
+    only appending the found block goes through `chain_executor`.
+    """
+    def __init__(
+        self,
+        block_chain: BlockChain,
+        chain_executor: Executor,
+        workers: int = 1
+    ):
+        self.block_chain: BlockChain = block_chain
+        self.chain_executor: Executor = chain_executor
+        self.workers: int = workers
+        # Called with each block we mine, after it is appended.
+        self.listeners: List[Callable[[Block], None]] = []
+        self._jobs: "OrderedDict[str, MiningJob]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._miner = ThreadPoolExecutor(max_workers=1)
+        # Set to stop the search in progress.
+        self._stop: threading.Event = threading.Event()
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def close(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._miner.shutdown(wait=False)
+
+    def submit(
+        self,
+        transactions: List[Transaction],
+        template: Optional[Callable[[], List[Transaction]]] = None
+    ) -> MiningJob:
+        job = MiningJob(transactions, template)
+        self._jobs[job.job_id] = job
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[MiningJob]:
+        return self._jobs.get(job_id)
+
+    def tip_changed(self):
+        """The latest block changed, drop the search on the old one."""
+        self._stop.set()
+
+    async def _run(self):
+        while True:
+            job: MiningJob = await self._queue.get()
+            try:
+                await self._mine(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Only this job is lost, the queue carries on.
+                self._fail(job, f"{type(e).__name__}: {e}")
+            self._forget_finished()
+
+    async def _mine(self, job: MiningJob):
+        loop = asyncio.get_running_loop()
+        job.status = MINING
+        while True:
+            if job.template is not None:
+                job.transactions = await loop.run_in_executor(
+                    self.chain_executor, job.template
+                )
+            # Checked against every tip the search starts on, so no proof of
+            # work is spent on a block that would be rejected.
+            error = await loop.run_in_executor(
+                self.chain_executor,
+                self.block_chain.validate_next_transactions,
+                job.transactions
+            )
+            if error:
+                self._fail(job, error)
+                return
+            self._stop = threading.Event()
+            block = await loop.run_in_executor(self._miner, partial(
+                self.block_chain.mine_block, job.transactions, self.workers, self._stop
+            ))
+            if block is None:
+                job.restarts += 1
+                continue
+            error = await loop.run_in_executor(
+                self.chain_executor, self.block_chain.add_block, block
+            )
+            if error is None:
+                break
+            tip = await loop.run_in_executor(
+                self.chain_executor, lambda: self.block_chain.latest_block.hashed_data
+            )
+            if block.previous_hash != tip:
+                # The tip moved after the nonce was found.
+                job.restarts += 1
+                continue
+            self._fail(job, error)
+            return
+        job.status = DONE
+        job.height = block.index
+        job.hashed_data = block.hashed_data
+        job.finished = time.time()
+        for listener in self.listeners:
+            listener(block)
+
+    def _fail(self, job: MiningJob, error: str):
+        job.status = FAILED
+        job.error = error
+        job.finished = time.time()
+
+    def _forget_finished(self):
+        finished = [
+            job_id for job_id, job in self._jobs.items() if job.status in (DONE, FAILED)
+        ]
+        for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job_id]
@@ -0,0 +1,157 @@
+"""
+Websocket peers of a node, inbound (the /ws route in api.py) and outbound
+(PEERS). Every connection is kept open and carries one sync session (see
+coin.sync) at a time, started by whichever side has news: a new tip of its
+own, or blocks it just got from another peer.
+"""
+import asyncio
+from concurrent.futures import Executor
+from typing import Callable, List, Optional, Set, Union
+
+import aiohttp
+
+from coin.sync import LocalNode, SyncSession
+
+
+RECONNECT_DELAY = 1.
+MAX_RECONNECT_DELAY = 60.
+
+Message = Union[str, bytes]
+
+
+class PeerConnection:
+    """
+    One open websocket. A single task reads it into a queue, so a session
+    can be started either by a message from the peer or by announce()
+    without two readers racing for the socket.
+    """
+    def __init__(self, pool: "PeerPool", websocket, name: str):
+        self.pool: PeerPool = pool
+        self.websocket = websocket
+        self.name: str = name
+        self._messages: "asyncio.Queue[Optional[Message]]" = asyncio.Queue()
+        self._announce: asyncio.Event = asyncio.Event()
+
+    def announce(self):
+        """Start a session with the peer once the current one (if any) ends."""
+        self._announce.set()
+
+    async def send(self, message: Message):
+        if isinstance(message, bytes):
+            await self.websocket.send_bytes(message)
+        else:
+            await self.websocket.send_str(message)
+
+    async def recv(self) -> Message:
+        message = await self._messages.get()
+        if message is None:
+            raise ConnectionError(f"Peer {self.name} disconnected.")
+        return message
+
+    async def _read(self):
+        try:
+            async for message in self.websocket:
+                if message.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                    self._messages.put_nowait(message.data)
+        finally:
+            self._messages.put_nowait(None)
+
+    async def _next_session(self) -> Optional[Message]:
+        """
+        Wait until either side starts a session. Returns the peer's opening
+        message, None when we start it.
+        """
+        if not self._messages.empty():
+            return self._messages.get_nowait()
+        if self._announce.is_set():
+            return None
+        message = asyncio.ensure_future(self._messages.get())
+        announce = asyncio.ensure_future(self._announce.wait())
+        done, pending = await asyncio.wait(
+            {message, announce}, return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in pending:
+            task.cancel()
+        if message in done:
+            return message.result()
+        return None
+
+    async def serve(self):
+        """Run sessions until the socket closes."""
+        reader = asyncio.ensure_future(self._read())
+        # Compare tips as soon as we are connected.
+        self.announce()
+        try:
+            while True:
+                first_message = await self._next_session()
+                self._announce.clear()
+                session = SyncSession(self.pool.node, self, executor=self.pool.executor)
+                await session.run(first_message)
+                if session.connected:
+                    self.pool.blocks_connected(self)
+        except ConnectionError:
+            pass
+        finally:
+            reader.cancel()
+            await self.websocket.close()
+
+
+class PeerPool:
+    """
+    The node's peer connections. Outbound ones are reconnected, with
+    backoff, whenever they drop.
+    """
+    def __init__(self, node: LocalNode, executor: Optional[Executor] = None):
+        self.node: LocalNode = node
+        self.executor: Optional[Executor] = executor
+        self.connections: Set[PeerConnection] = set()
+        # Called with the connection blocks came from, after connecting them.
+        self.listeners: List[Callable[[PeerConnection], None]] = []
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def serve(self, websocket, name: str):
+        connection = PeerConnection(self, websocket, name)
+        self.connections.add(connection)
+        try:
+            await connection.serve()
+        finally:
+            self.connections.discard(connection)
+
+    def announce(self, exclude: Optional[PeerConnection] = None):
+        """Tell every peer but `exclude` about our tip."""
+        for connection in self.connections:
+            if connection is not exclude:
+                connection.announce()
+
+    def blocks_connected(self, source: PeerConnection):
+        # Relay, the peer we got them from already has them.
+        self.announce(exclude=source)
+        for listener in self.listeners:
+            listener(source)
+
+    async def _connect_forever(self, url: str):
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                async with self._session.ws_connect(url) as websocket:
+                    delay = RECONNECT_DELAY
+                    await self.serve(websocket, url)
+            except (aiohttp.ClientError, OSError):
+                pass
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def start(self, urls: List[str]):
+        """Keep a connection open to each of `urls`."""
+        self._session = aiohttp.ClientSession()
+        self._tasks = [asyncio.ensure_future(self._connect_forever(url)) for url in urls]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for connection in list(self.connections):
+            await connection.websocket.close()
+        if self._session is not None:
+            await self._session.close()
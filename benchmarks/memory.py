@@ -0,0 +1,97 @@
+"""
+Memory used by unspent outputs, the dict backed representation with hex ids
+the node used to have against the slotted one with raw digests
+(coin.transaction.UnspentTxOut), both alone and indexed by outpoint.
+
+    python benchmarks/memory.py [--outputs N]
+"""
+import argparse
+import gc
+import random
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from coin.transaction import UnspentTxOut
+
+
+class LegacyUnspentTxOut:
+    """UnspentTxOut as it was: a plain object holding the hex id."""
+    def __init__(self, tx_out_id: str, tx_out_index: int, address: str, amount: float):
+        self.tx_out_id = tx_out_id
+        self.tx_out_index = tx_out_index
+        self.address = address
+        self.amount = amount
+
+
+def make_outputs(count: int, seed: int = 0) -> List[Tuple[str, int, str, float]]:
+    rng = random.Random(seed)
+    # Many outputs share an address, as they do on a real chain.
+    addresses = ["MFYwEAYHKoZIzj0CAQ" + "%0102x" % rng.getrandbits(408) for _ in range(1000)]
+    return [
+        ("%064x" % rng.getrandbits(256), rng.randint(0, 3), rng.choice(addresses), float(rng.randint(1, 50)))
+        for _ in range(count)
+    ]
+
+
+def _own_copy(text: str) -> str:
+    """
+    A new string, as decoding a block gives every output its own id, rather
+    than sharing the one in `outputs` (which isn't counted).
+    """
+    return text.encode().decode()
+
+
+def measure(build: Callable[[], object]) -> int:
+    """Bytes still allocated by what `build` returns."""
+    gc.collect()
+    tracemalloc.start()
+    built = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del built
+    return size
+
+
+def compare(outputs: List[Tuple[str, int, str, float]]) -> List[Tuple[str, int, int]]:
+    def legacy_index() -> Dict[Tuple[str, int], LegacyUnspentTxOut]:
+        index = {}
+        for output in outputs:
+            u_tx_out = LegacyUnspentTxOut(_own_copy(output[0]), *output[1:])
+            index[(u_tx_out.tx_out_id, u_tx_out.tx_out_index)] = u_tx_out
+        return index
+
+    def slotted_index() -> Dict[Tuple[bytes, int], UnspentTxOut]:
+        # Keyed the way UnspentTxOutSet keys them, without its address index.
+        index = {}
+        for output in outputs:
+            u_tx_out = UnspentTxOut(*output)
+            index[(u_tx_out.tx_out_digest, u_tx_out.tx_out_index)] = u_tx_out
+        return index
+
+    return [
+        (
+            "objects",
+            measure(lambda: [LegacyUnspentTxOut(_own_copy(o[0]), *o[1:]) for o in outputs]),
+            measure(lambda: [UnspentTxOut(*o) for o in outputs]),
+        ),
+        (
+            "indexed by outpoint",
+            measure(legacy_index),
+            measure(slotted_index),
+        ),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--outputs", type=int, default=1_000_000)
+    args = parser.parse_args()
+    outputs = make_outputs(args.outputs)
+    print(f"{args.outputs} unspent outputs")
+    print(f"{'':22}{'legacy MB':>11}{'slotted MB':>12}{'ratio':>8}")
+    for name, legacy, slotted in compare(outputs):
+        print(f"{name:22}{legacy / 2 ** 20:>11.1f}{slotted / 2 ** 20:>12.1f}{legacy / slotted:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
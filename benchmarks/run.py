@@ -0,0 +1,381 @@
+"""
+Benchmark suite for the hot paths of a node: mining, unspent output
+updates, transaction signing, coin selection, batch payments, chain
+validation, reorgs, startup and chain (de)serialization.
+
+Everything runs offline from fixed seeds, so two runs on the same machine
+do the same work. Results are printed and can be written as JSON; given a
+baseline (a previous --output) every benchmark more than --tolerance slower
+than it is flagged and the exit status is 1.
+
+    python benchmarks/run.py [--quick] [--only NAME] [--output FILE] [--baseline FILE]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+from coin.block import Block, BlockChain
+from coin.mining import MiningKernel
+from coin.selection import COIN_SELECTORS
+from coin.signing import get_signer
+from coin.snapshot import SNAPSHOT_DIRECTORY
+from coin.transaction import (
+    Transaction,
+    TxIn,
+    TxOut,
+    UnspentTxOut,
+    UnspentTxOutSet,
+    get_coinbase_transaction,
+    signature_cache,
+    update_unspent_tx_outs,
+)
+from coin.wallet import create_batch_transactions, create_transaction, private_key_from_seed
+
+
+SEED = 1234
+# Milliseconds, well in the past so every timestamp is valid.
+CHAIN_START_TIME = 1_600_000_000_000.
+DEFAULT_TOLERANCE = 0.1
+
+BENCHMARKS: Dict[str, Callable[[bool], List[dict]]] = {}
+
+
+def benchmark(name: str):
+    def register(fn: Callable[[bool], List[dict]]):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+def best_of(fn: Callable, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def result(name: str, seconds: float, operations: int, **params) -> dict:
+    return {
+        "name": name,
+        "seconds": seconds,
+        "operations": operations,
+        "ops_per_second": operations / seconds if seconds else None,
+        "params": params,
+    }
+
+
+def make_valid_chain(length: int, seed: int = SEED) -> BlockChain:
+    """
+    A chain that passes validation, mined at the genesis difficulty, each
+    block holding a coinbase to a random address. Blocks are spaced
+    block_generation_interval apart so the difficulty never retargets.
+    """
+    block_chain = BlockChain()
+    extend_valid_chain(block_chain, length, seed)
+    return block_chain
+
+
+def extend_valid_chain(block_chain: BlockChain, length: int, seed: int = SEED):
+    """Mine blocks onto `block_chain` as make_valid_chain does until it is `length` long."""
+    rng = random.Random(seed)
+    for index in range(block_chain.length, length):
+        previous = block_chain.latest_block
+        transactions = [get_coinbase_transaction("%032x" % rng.getrandbits(128), index)]
+        block_time = CHAIN_START_TIME + index * block_chain.block_generation_interval
+        difficulty = block_chain.get_difficulty()
+        merkle_root = transactions[0].transaction_digest
+        nonce = MiningKernel(
+            index, merkle_root, previous.hash_digest, difficulty, block_time
+        ).search()
+        error = block_chain.add_block(
+            Block(index, transactions, previous.hashed_data, difficulty, nonce, time=block_time)
+        )
+        assert error is None, error
+
+
+def make_unspent_tx_outs(count: int, address: str, seed: int = SEED) -> UnspentTxOutSet:
+    rng = random.Random(seed)
+    return UnspentTxOutSet(
+        UnspentTxOut("%064x" % rng.getrandbits(256), 0, address, float(rng.randint(1, 50)))
+        for _ in range(count)
+    )
+
+
+class _FixedDifficultyChain(BlockChain):
+    def __init__(self, difficulty: int):
+        super().__init__()
+        self.fixed_difficulty = difficulty
+
+    def get_difficulty(self):
+        return self.fixed_difficulty
+
+    def _unix_milli(self) -> float:
+        # Fixed block times, so every run hashes the same headers and the
+        # nonces (ie; the work done) are the same from run to run.
+        return CHAIN_START_TIME + self.length * self.block_generation_interval
+
+    def is_valid_timestamp(self, new_block: Block, previous_block: Block) -> bool:
+        return True
+
+
+@benchmark("mining")
+def bench_mining(quick: bool) -> List[dict]:
+    """generate_new_block at a fixed difficulty, as hashes per second."""
+    difficulty = 10 if quick else 14
+    blocks = 4 if quick else 8
+    block_chain = _FixedDifficultyChain(difficulty)
+    start = time.perf_counter()
+    for i in range(blocks):
+        block_chain.generate_new_block([get_coinbase_transaction("miner", i + 1)])
+    seconds = time.perf_counter() - start
+    # The serial search tries nonces from 0, so the nonce is the attempt count.
+    hashes = sum(block.nonce + 1 for block in block_chain.chain[1:])
+    return [result("mining.hashrate", seconds, hashes, difficulty=difficulty, blocks=blocks)]
+
+
+@benchmark("utxo")
+def bench_update_unspent_tx_outs(quick: bool) -> List[dict]:
+    """update_unspent_tx_outs with a 100 transaction block, at growing set sizes."""
+    results = []
+    for size in ([1_000, 10_000] if quick else [1_000, 10_000, 100_000]):
+        rng = random.Random(SEED)
+        unspent_tx_outs = make_unspent_tx_outs(size, "owner")
+        spent = rng.sample(list(unspent_tx_outs), 100)
+        transactions = [
+            Transaction(
+                [TxIn(u_tx_out.tx_out_id, u_tx_out.tx_out_index, "")],
+                [TxOut("receiver", u_tx_out.amount)]
+            )
+            for u_tx_out in spent
+        ]
+        seconds = best_of(lambda: update_unspent_tx_outs(transactions, unspent_tx_outs))
+        results.append(result(f"utxo.update.{size}", seconds, len(transactions), size=size))
+    return results
+
+
+@benchmark("signing")
+def bench_signing(quick: bool) -> List[dict]:
+    """create_transaction (coin selection and signing) from a funded address."""
+    count = 50 if quick else 200
+    private_key = private_key_from_seed(SEED)
+    address = get_signer(private_key).public_key
+    unspent_tx_outs = make_unspent_tx_outs(1_000, address)
+
+    def create_all():
+        signature_cache.clear()
+        for i in range(count):
+            create_transaction("receiver", float(1 + i % 20), private_key, unspent_tx_outs)
+
+    seconds = best_of(create_all)
+    return [result("wallet.create_transaction", seconds, count, count=count)]
+
+
+@benchmark("selection")
+def bench_selection(quick: bool) -> List[dict]:
+    """
+    Each coin selection strategy paying growing amounts from a wallet of many
+    small outputs, with the mean number of inputs it picked.
+    """
+    size = 10_000 if quick else 100_000
+    unspent_tx_outs = make_unspent_tx_outs(size, "sender")
+    outputs = unspent_tx_outs.amount_index("sender")
+    amounts = [float(amount) for amount in (7, 49, 120, 333, 1_000, 2_501)]
+    results = []
+    for name, select_coins in COIN_SELECTORS.items():
+        inputs = [len(select_coins(amount, outputs)) for amount in amounts]
+        seconds = best_of(lambda: [select_coins(amount, outputs) for amount in amounts])
+        results.append(result(
+            f"selection.{name}",
+            seconds,
+            len(amounts),
+            size=size,
+            mean_inputs=sum(inputs) / len(inputs)
+        ))
+    return results
+
+
+@benchmark("batch")
+def bench_batch(quick: bool) -> List[dict]:
+    """A payout to many addresses, one transaction each against batched."""
+    count = 50 if quick else 500
+    private_key = private_key_from_seed(SEED)
+    address = get_signer(private_key).public_key
+    unspent_tx_outs = make_unspent_tx_outs(10_000, address)
+    payments = [(f"receiver-{i}", float(1 + i % 20)) for i in range(count)]
+
+    def create_each():
+        signature_cache.clear()
+        for receiver_address, amount in payments:
+            create_transaction(receiver_address, amount, private_key, unspent_tx_outs)
+
+    def create_batch():
+        signature_cache.clear()
+        create_batch_transactions(payments, private_key, unspent_tx_outs)
+
+    return [
+        result("payout.each", best_of(create_each), count, count=count),
+        result("payout.batch", best_of(create_batch), count, count=count),
+    ]
+
+
+@benchmark("validation")
+def bench_validation(quick: bool) -> List[dict]:
+    """chain_is_valid of a whole chain from genesis, at growing heights."""
+    results = []
+    for height in ([100, 500] if quick else [100, 1_000, 5_000]):
+        chain = make_valid_chain(height).chain
+        block_chain = BlockChain()
+        assert block_chain.chain_is_valid(chain)
+        seconds = best_of(lambda: block_chain.chain_is_valid(chain))
+        results.append(result(f"chain.validate.{height}", seconds, height, height=height))
+    return results
+
+
+@benchmark("reorg")
+def bench_reorg(quick: bool) -> List[dict]:
+    """connect_blocks of a branch replacing the last few blocks, at growing heights."""
+    depth = 3
+    results = []
+    for height in ([500, 2_000] if quick else [1_000, 5_000]):
+        base = make_valid_chain(height)
+        fork_point = height - depth - 1
+        branch_chain = BlockChain()
+        branch_chain.chain = base.chain[:fork_point + 1]
+        branch_chain.reindex()
+        extend_valid_chain(branch_chain, height + 1, seed=SEED + 1)
+        branch = branch_chain.chain[fork_point + 1:]
+
+        def reorg() -> float:
+            block_chain = BlockChain()
+            block_chain.chain = list(base.chain)
+            block_chain.reindex()
+            start = time.perf_counter()
+            error = block_chain.connect_blocks(fork_point, branch)
+            seconds = time.perf_counter() - start
+            assert error is None, error
+            return seconds
+
+        seconds = min(reorg() for _ in range(3))
+        results.append(result(f"chain.reorg.{height}", seconds, len(branch), height=height, depth=depth))
+    return results
+
+
+@benchmark("startup")
+def bench_startup(quick: bool) -> List[dict]:
+    """BlockChain.open of a stored chain, replaying every block and from a snapshot."""
+    height = 1_000 if quick else 5_000
+    blocks = make_valid_chain(height).chain
+    with tempfile.TemporaryDirectory() as directory:
+        block_chain = BlockChain.open(directory)
+        for block in blocks[1:]:
+            error = block_chain.add_block(block)
+            assert error is None, error
+        for name in os.listdir(os.path.join(directory, SNAPSHOT_DIRECTORY)):
+            os.remove(os.path.join(directory, SNAPSHOT_DIRECTORY, name))
+        replay = best_of(lambda: BlockChain.open(directory).close())
+        block_chain.write_snapshot()
+        snapshot = best_of(lambda: BlockChain.open(directory).close())
+        block_chain.close()
+    return [
+        result("chain.open.replay", replay, height, height=height),
+        result("chain.open.snapshot", snapshot, height, height=height),
+    ]
+
+
+@benchmark("serialization")
+def bench_serialization(quick: bool) -> List[dict]:
+    """get_json and rebuilding the chain from it."""
+    height = 500 if quick else 5_000
+    block_chain = make_valid_chain(height)
+    chain_json = block_chain.get_json()
+    return [
+        result("chain.get_json", best_of(block_chain.get_json), height, height=height),
+        result(
+            "chain.from_json",
+            best_of(lambda: BlockChain(json=json.loads(chain_json))),
+            height,
+            height=height
+        ),
+    ]
+
+
+def run(names: List[str], quick: bool) -> dict:
+    results = []
+    for name in names:
+        print(f"running {name}...", file=sys.stderr)
+        results += BENCHMARKS[name](quick)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": SEED,
+            "quick": quick,
+            "time": time.time(),
+        },
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Names of the benchmarks over `tolerance` slower than in `baseline`."""
+    before = {r["name"]: r for r in baseline["results"]}
+    regressions = []
+    for r in report["results"]:
+        previous: Optional[dict] = before.get(r["name"])
+        if previous is None or previous["params"] != r["params"]:
+            r["change"] = None
+            continue
+        if not r["ops_per_second"] or not previous["ops_per_second"]:
+            # Too quick to time, nothing to compare.
+            r["change"] = None
+            continue
+        # Relative change in throughput, negative is slower.
+        r["change"] = r["ops_per_second"] / previous["ops_per_second"] - 1
+        if r["change"] < -tolerance:
+            regressions.append(r["name"])
+    return regressions
+
+
+def print_report(report: dict, regressions: List[str]):
+    print(f"{'':28}{'seconds':>10}{'ops/s':>14}{'change':>9}")
+    for r in report["results"]:
+        change = r.get("change")
+        change_text = f"{change:>+8.1%}" if change is not None else f"{'':>8}"
+        flag = "  REGRESSION" if r["name"] in regressions else ""
+        ops = r["ops_per_second"]
+        ops_text = f"{ops:>14.1f}" if ops is not None else f"{'':>14}"
+        print(f"{r['name']:28}{r['seconds']:>10.4f}{ops_text} {change_text}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="smaller sizes, for a fast check")
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS), help="run just these")
+    parser.add_argument("--output", help="write the results as JSON here")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="slowdown flagged as a regression, 0.1 is 10%%")
+    args = parser.parse_args()
+
+    report = run(args.only or list(BENCHMARKS), args.quick)
+    regressions: List[str] = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+    print_report(report, regressions)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Compare the binary codec (coin.codec) with the JSON path for encode/decode
+speed and size.
+
+    python benchmarks/serialization.py [--blocks N] [--transactions N]
+"""
+import argparse
+import json
+import random
+import time
+from typing import Callable, List, Tuple
+
+from coin import codec
+from coin.block import Block, BlockChain
+from coin.transaction import Transaction, TxIn, TxOut
+
+
+def make_block_chain(length: int, seed: int = 0) -> BlockChain:
+    """A chain of `length` blocks of random transactions, mined at difficulty 0."""
+    block_chain = BlockChain()
+    for index in range(1, length):
+        previous = block_chain.latest_block
+        transactions = make_transactions(random.Random(seed + index).randint(1, 4), seed + index)
+        block_chain.chain.append(
+            Block(index, transactions, previous.hashed_data, 0, 0, time=previous.time + 1000.)
+        )
+    block_chain.reindex()
+    return block_chain
+
+
+def make_transactions(count: int, seed: int = 0) -> List[Transaction]:
+    rng = random.Random(seed)
+    transactions = []
+    for _ in range(count):
+        tx_ins = [
+            TxIn("%064x" % rng.getrandbits(256), rng.randint(0, 3), "MEUCIQ" + "A" * 90)
+            for _ in range(rng.randint(1, 3))
+        ]
+        tx_outs = [TxOut("MFYwEAYHKoZIzj0CAQ" + "B" * 102, float(rng.randint(1, 50)))]
+        transactions.append(Transaction(tx_ins, tx_outs))
+    return transactions
+
+
+def timed(fn: Callable, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def compare(block_chain: BlockChain, transactions: List[Transaction]) -> List[Tuple]:
+    rows = []
+    json_chain = block_chain.get_json()
+    binary_chain = codec.encode_block_chain(block_chain)
+    rows.append((
+        "chain encode",
+        timed(block_chain.get_json),
+        timed(lambda: codec.encode_block_chain(block_chain)),
+        len(json_chain.encode()),
+        len(binary_chain),
+    ))
+    # Every block decoded, the loaded chains below only decode blocks as
+    # they are reached.
+    rows.append((
+        "chain parse",
+        timed(lambda: [Block.from_dict(b) for b in json.loads(json_chain)["chain"]]),
+        timed(lambda: list(codec.decode_block_chain(binary_chain).chain)),
+        None,
+        None,
+    ))
+    rows.append((
+        "chain decode",
+        timed(lambda: BlockChain(json=json.loads(json_chain))),
+        timed(lambda: codec.decode_block_chain(binary_chain)),
+        None,
+        None,
+    ))
+
+    def to_json(tx: Transaction) -> str:
+        return tx.get_json()
+
+    def from_json(data: str) -> Transaction:
+        return Transaction.from_dict(json.loads(data))
+
+    json_txs = [to_json(tx) for tx in transactions]
+    binary_txs = [codec.encode_transaction(tx) for tx in transactions]
+    rows.append((
+        "transactions encode",
+        timed(lambda: [to_json(tx) for tx in transactions]),
+        timed(lambda: [codec.encode_transaction(tx) for tx in transactions]),
+        sum(len(t.encode()) for t in json_txs),
+        sum(len(t) for t in binary_txs),
+    ))
+    rows.append((
+        "transactions decode",
+        timed(lambda: [from_json(t) for t in json_txs]),
+        timed(lambda: [codec.decode_transaction(t) for t in binary_txs]),
+        None,
+        None,
+    ))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--blocks", type=int, default=2000)
+    parser.add_argument("--transactions", type=int, default=5000)
+    args = parser.parse_args()
+    rows = compare(make_block_chain(args.blocks), make_transactions(args.transactions))
+    print(f"{'':22}{'json s':>10}{'binary s':>10}{'speedup':>9}{'json B':>11}{'binary B':>11}")
+    for name, json_s, binary_s, json_size, binary_size in rows:
+        sizes = f"{json_size:>11}{binary_size:>11}" if json_size else ""
+        print(f"{name:22}{json_s:>10.4f}{binary_s:>10.4f}{json_s / binary_s:>8.1f}x{sizes}")
+
+
+if __name__ == "__main__":
+    main()
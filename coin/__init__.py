@@ -15,6 +15,14 @@ except ModuleNotFoundError:
 
 __version__ = "0.0.0"
 
+from . import merkle
 from . import block
+from . import mining
+from . import signing
 from . import transaction
+from . import selection
 from . import wallet
+from . import codec
+from . import store
+from . import mempool
+from . import metrics
@@ -1,50 +1,188 @@
 from hashlib import sha256
-import math
-from typing import List, Optional
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple, Union
 import json
+import os
+import struct
 
 from datetime import datetime
+from time import perf_counter
+
+from coin import merkle, metrics
+from coin.mining import (
+    MAX_DIFFICULTY,
+    NONCE,
+    MiningKernel,
+    difficulty_target,
+    header_prefix,
+    is_valid_difficulty,
+    parallel_nonce_search,
+)
+from coin.snapshot import SNAPSHOT_DIRECTORY, SNAPSHOT_INTERVAL, SnapshotStore
+from coin.transaction import Transaction, UnspentTxOutSet, UTXO_SET_SIZE, validate_transactions
+
+
+MINING_HASHES = metrics.Counter("coin_mining_hashes_total", "Nonces tried by the miner.")
+MINING_HASHRATE = metrics.Gauge(
+    "coin_mining_hashrate", "Nonces per second of the last successful search."
+)
+MINING_SECONDS = metrics.Histogram(
+    "coin_mining_seconds",
+    "Time to find each mined block's nonce.",
+    buckets=(0.01, 0.1, 0.5, 1., 5., 10., 30., 60., 300., 600.)
+)
+NONCE_ATTEMPTS = metrics.Histogram(
+    "coin_block_nonce_attempts",
+    "Nonces tried per mined block.",
+    buckets=tuple(4 ** power for power in range(1, 14))
+)
+BLOCKS_VALIDATED = metrics.Counter("coin_blocks_validated_total", "Blocks validated.")
+BLOCK_VALIDATION_SECONDS = metrics.Histogram(
+    "coin_block_validation_seconds", "Time to validate each batch of blocks."
+)
+BLOCKS_DISCONNECTED = metrics.Counter(
+    "coin_blocks_disconnected_total", "Blocks rolled back by reorgs."
+)
+UNSPENT_REBUILDS = metrics.Counter(
+    "coin_unspent_tx_outs_rebuilds_total",
+    "Reorgs deeper than the undo journal, which rebuilt the unspent outputs from genesis."
+)
+
+
+def block_work(difficulty: int) -> int:
+    """
+    Expected number of hashes needed to mine a block at `difficulty`, which
+    must have been checked with is_valid_difficulty.
+    """
+    return 2 ** max(difficulty, 0)
 
 
 class Block:
+    """
+    A block holds a list of transactions, committed to by their merkle root.
+    The block's hash covers only the fixed size header (see
+    coin.mining.header_prefix), so hashing a block costs the same whatever it
+    holds. Hashes are kept as raw 32 byte digests (hash_digest,
+    previous_digest, merkle_root); hashed_data and previous_hash are their
+    hex, as seen in JSON.
+    """
+    __slots__ = (
+        "index", "transactions", "previous_digest", "merkle_root", "time",
+        "difficulty", "nonce", "hash_digest"
+    )
+
     def __init__(
             self,
             index: int,
-            data: str,
+            transactions: List[Transaction],
             previous_hash: Optional[str],
             difficulty: int,
-            nonce: int
+            nonce: int,
+            time: Optional[float] = None,
+            merkle_root: Optional[bytes] = None,
+            hash_digest: Optional[bytes] = None
     ):
+        """
+        `merkle_root` saves recomputing the root of a template whose
+        MerkleTree the miner keeps, and `hash_digest` hashing a header whose
+        hash is already known; both are checked when the block is validated.
+        """
         assert type(index) == int
         self.index: int = index
         # TODO: how to validate type of hash
-        if previous_hash:
-            self.previous_hash: str = previous_hash
-        else:
-            self.previous_hash = ''
-        if data == "genesis block":
-            self.time: int = 0
+        self.previous_digest: bytes = bytes.fromhex(previous_hash or '')
+        if time is not None:
+            self.time: float = time
+        elif index == 0:
+            self.time = 0
         else:
             self.time = self._unix_milli()
-        assert type(data) == str
-        self.data: str = data
+        assert type(transactions) == list
+        self.transactions: List[Transaction] = transactions
+        if merkle_root is None:
+            merkle_root = self._calculate_merkle_root()
+        self.merkle_root: bytes = merkle_root
         self.difficulty: int = difficulty
         self.nonce: int = nonce
-        self.hashed_data: str = self._calculate_sha()
+        if hash_digest is None:
+            hash_digest = self._calculate_digest()
+        self.hash_digest: bytes = hash_digest
+
+    @classmethod
+    def from_digests(
+        cls,
+        index: int,
+        transactions: List[Transaction],
+        previous_digest: bytes,
+        difficulty: int,
+        nonce: int,
+        time: float,
+        merkle_root: bytes,
+        hash_digest: bytes
+    ) -> "Block":
+        """
+        Skips the hex round trip for blocks whose hashes are raw digests
+        already, eg; decoded by coin.codec. As with from_dict, the hashes are
+        only checked when the block is validated.
+        """
+        block = cls.__new__(cls)
+        block.index = index
+        block.previous_digest = previous_digest
+        block.time = time
+        block.transactions = transactions
+        block.merkle_root = merkle_root
+        block.difficulty = difficulty
+        block.nonce = nonce
+        block.hash_digest = hash_digest
+        return block
+
+    @property
+    def hashed_data(self) -> str:
+        return self.hash_digest.hex()
+
+    @hashed_data.setter
+    def hashed_data(self, hashed_data: str):
+        self.hash_digest = bytes.fromhex(hashed_data)
+
+    @property
+    def previous_hash(self) -> str:
+        return self.previous_digest.hex()
+
+    @previous_hash.setter
+    def previous_hash(self, previous_hash: str):
+        self.previous_digest = bytes.fromhex(previous_hash)
 
     def calculate_sha(self):
         return self._calculate_sha()
 
     def _calculate_sha(self):
-        body = (
-            str(self.nonce)
-            + str(self.index)
-            + self.previous_hash
-            + str(self.time)
-            + self.data
-            + str(self.difficulty)
+        return self._calculate_digest().hex()
+
+    def _calculate_digest(self) -> bytes:
+        return sha256(
+            header_prefix(
+                self.index, self.previous_digest, self.merkle_root, self.time, self.difficulty
+            )
+            + NONCE.pack(self.nonce)
+        ).digest()
+
+    def _calculate_merkle_root(self) -> bytes:
+        return merkle.merkle_root(
+            transaction.transaction_digest for transaction in self.transactions
         )
-        return sha256(body.encode()).hexdigest()
+
+    @staticmethod
+    def header_digest(header: dict) -> bytes:
+        """The hash of the block `header` (see get_header) belongs to."""
+        return sha256(
+            header_prefix(
+                header["index"],
+                bytes.fromhex(header["previous_hash"]),
+                bytes.fromhex(header["merkle_root"]),
+                header["time"],
+                header["difficulty"]
+            )
+            + NONCE.pack(header["nonce"])
+        ).digest()
 
     @staticmethod
     def _unix_milli():
@@ -53,101 +191,776 @@ class Block:
         return (time - epoch).total_seconds() * 1000.0
 
     def get_json(self):
-        return json.dumps(self, default=lambda o: o.__dict__, sort_keys=True)
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "index": self.index,
+            "previous_hash": self.previous_hash,
+            "merkle_root": self.merkle_root.hex(),
+            "time": self.time,
+            "transactions": [transaction.to_dict() for transaction in self.transactions],
+            "difficulty": self.difficulty,
+            "nonce": self.nonce,
+            "hashed_data": self.hashed_data,
+        }
+
+    def get_header(self) -> dict:
+        """Everything but the transactions, for peers to check linkage and work."""
+        return {
+            "index": self.index,
+            "previous_hash": self.previous_hash,
+            "merkle_root": self.merkle_root.hex(),
+            "time": self.time,
+            "difficulty": self.difficulty,
+            "nonce": self.nonce,
+            "hashed_data": self.hashed_data,
+        }
+
+    @classmethod
+    def from_dict(cls, b: dict) -> "Block":
+        """
+        Raises ValueError when a transaction id doesn't match its contents or
+        the difficulty is out of range. The binary decoder (coin.codec) hands over Transaction objects rather
+        than their dicts. The time, hash and merkle root are taken as given
+        and only checked when the block is validated.
+        """
+        if not is_valid_difficulty(b["difficulty"]):
+            raise ValueError(f"Block {b['index']} has invalid difficulty.")
+        return cls(
+            b["index"],
+            [
+                t if isinstance(t, Transaction) else Transaction.from_dict(t)
+                for t in b["transactions"]
+            ],
+            b["previous_hash"],
+            b["difficulty"],
+            b["nonce"],
+            time=b["time"],
+            merkle_root=bytes.fromhex(b["merkle_root"]) if "merkle_root" in b else None,
+            hash_digest=bytes.fromhex(b["hashed_data"]) if "hashed_data" in b else None
+        )
+
+
+class LazyChain:
+    """
+    List like view of serialized blocks, used as BlockChain.chain for chains
+    loaded from JSON or the binary encoding (see coin.codec). A block is
+    only decoded (by `decode`, Block.from_dict for block dicts) the first
+    time it is accessed, so loading a chain costs one parse, and replacing
+    ours with it only decodes the blocks that finding the fork point and
+    validating the ones past it touch. The (time, difficulty) of every block
+    the BlockChain index needs are taken from `summaries`, or read straight
+    from the block dicts.
+    """
+    def __init__(
+        self,
+        raw_blocks: Iterable[Any],
+        decode: Callable[[Any], Block] = Block.from_dict,
+        summaries: Optional[List[Tuple[float, int]]] = None
+    ):
+        self._raw: List[Any] = list(raw_blocks)
+        self._blocks: List[Optional[Block]] = [None] * len(self._raw)
+        self._decode: Callable[[Any], Block] = decode
+        if summaries is None:
+            summaries = [(raw["time"], raw["difficulty"]) for raw in self._raw]
+        self._summaries: List[Tuple[float, int]] = summaries
+
+    def _get(self, height: int) -> Block:
+        """Raises ValueError when the block at `height` is malformed."""
+        block = self._blocks[height]
+        if block is None:
+            try:
+                block = self._blocks[height] = self._decode(self._raw[height])
+            except (KeyError, TypeError, AssertionError) as e:
+                raise ValueError(f"Block {height} is malformed.") from e
+            # Nothing left to decode it from.
+            self._raw[height] = None
+        return block
+
+    def summaries(self) -> List[Tuple[float, int]]:
+        """(time, difficulty) of every block by height, without decoding them."""
+        return self._summaries
+
+    def __getitem__(self, item: Union[int, slice]):
+        if isinstance(item, slice):
+            return [self._get(height) for height in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("LazyChain index out of range")
+        return self._get(item)
+
+    def __delitem__(self, item: slice):
+        del self._raw[item]
+        del self._blocks[item]
+        del self._summaries[item]
+
+    def append(self, block: Block):
+        self._raw.append(None)
+        self._blocks.append(block)
+        self._summaries.append((block.time, block.difficulty))
+
+    def extend(self, blocks: Iterable[Block]):
+        for block in blocks:
+            self.append(block)
+
+    def __iter__(self) -> Iterator[Block]:
+        for height in range(len(self)):
+            yield self._get(height)
+
+    def __len__(self) -> int:
+        return len(self._blocks)
 
 
 class BlockChain:
-    def __init__(self, json=None):
+    """
+    Next to the blocks, the chain keeps an index of per-height values: the
+    cumulative work up to each height (a prefix sum of block_work, so the
+    work of any range of blocks is a subtraction) and each block's time and
+    difficulty, which is all retargeting needs. It is extended on append,
+    cut back on a reorg and rebuilt on load.
+
+    The chain also keeps the unspent outputs of its transactions. Connecting
+    a block validates its transactions against them and journals what
+    applying them changed (see coin.store.UndoJournal), so a reorg only rolls
+    back the blocks it disconnects.
+
+    A chain built from `json` (a dict as given by to_dict) keeps its blocks
+    serialized in a LazyChain, and its unspent outputs are only replayed the
+    first time they are needed. A peer's chain is usually only read from
+    past the fork point, see replace_chain.
+
+    With `validation_workers` above 1 the signatures of each connected
+    block are verified across that many processes (see
+    coin.transaction.verify_signatures).
+
+    `listeners` are called with the blocks disconnected and the blocks
+    connected by every change to the chain, once it is made; eg; a
+    coin.mempool.Mempool drops the transactions that were mined.
+    """
+    def __init__(self, json=None, validation_workers: int = 1):
+        # TODO: Hack to avoid circular dependency.
+        from coin.store import UndoJournal
+        self._undo = UndoJournal()
+        # Only a store backed chain writes snapshots, see open.
+        self._snapshots: Optional[SnapshotStore] = None
+        self._snapshot_height: int = 0
+        self._unspent_tx_outs: Optional[UnspentTxOutSet] = None
+        self.validation_workers: int = validation_workers
+        self.listeners: List[Callable[[List[Block], List[Block]], None]] = []
         if json:
             for k, v in json.items():
                 if k == "chain":
-                    blocks: List[Block] = ([
-                        Block(
-                            b["index"],
-                            b["data"],
-                            b["previous_hash"],
-                            b["difficulty"],
-                            b["nonce"]
-                        ) for b in v
-                    ])
-                    v = blocks
+                    if not isinstance(v, LazyChain):
+                        v = LazyChain(v)
+                elif k == "_cummulative_difficulty":
+                    # Recomputed from the blocks, see reindex.
+                    continue
                 setattr(self, k, v)
+            self._work: List[int] = []
+            self._times: List[float] = []
+            self._difficulties: List[int] = []
+            self._index_summaries(self.chain.summaries())
         else:
-            self.chain: List[Block] = [Block(0, "genesis block", None, 5, 0)]
+            self.chain: List[Block] = [Block(0, [], None, 5, 0)]
             self.difficulty_adjustment_interval = 10
             self.block_generation_interval = 10
-            self._cummulative_difficulty = 0
+            self.reindex()
+
+    @property
+    def unspent_tx_outs(self) -> UnspentTxOutSet:
+        if self._unspent_tx_outs is None:
+            self._rebuild_unspent_tx_outs(self.length - 1)
+        return self._unspent_tx_outs
+
+    def reindex(self):
+        """
+        Rebuild the per-height index and the unspent outputs from self.chain,
+        eg; after assigning a new list of blocks to it directly. The blocks'
+        transactions are trusted, as the blocks themselves are.
+        """
+        self._work: List[int] = []
+        self._times: List[float] = []
+        self._difficulties: List[int] = []
+        self._index_blocks(self.chain)
+        self._undo.truncate(0)
+        self._rebuild_unspent_tx_outs(self.length - 1)
+
+    def _index_blocks(self, blocks: Iterable[Block]):
+        self._index_summaries((block.time, block.difficulty) for block in blocks)
+
+    def _index_summaries(self, summaries: Iterable[Tuple[float, int]]):
+        """
+        Index blocks given by their (time, difficulty). Raises ValueError
+        when a difficulty is out of range.
+        """
+        for time, difficulty in summaries:
+            if not is_valid_difficulty(difficulty):
+                raise ValueError(f"Block {len(self._work)} has invalid difficulty.")
+            if self._work:
+                self._work.append(self._work[-1] + block_work(difficulty))
+            else:
+                # Genesis doesn't count, nobody had to mine it.
+                self._work.append(0)
+            self._times.append(time)
+            self._difficulties.append(difficulty)
+
+    def _truncate_index(self, length: int):
+        del self._work[length:]
+        del self._times[length:]
+        del self._difficulties[length:]
+
+    @classmethod
+    def open(cls, directory: str, validation_workers: int = 1) -> "BlockChain":
+        """
+        Block chain backed by the BlockStore in `directory` (created with a
+        genesis block if empty). Blocks are read from disk as they are
+        accessed and new ones are appended to the store. The unspent outputs
+        come from the newest snapshot of them still on our chain, with only
+        the blocks after it replayed (see coin.snapshot).
+        """
+        # TODO: Hack to avoid circular dependency.
+        from coin.store import UNDO_DIRECTORY, BlockStore, StoredChain, UndoJournal
+        block_chain = cls(validation_workers=validation_workers)
+        store = BlockStore(directory)
+        if not len(store):
+            store.append(block_chain.chain[0])
+        block_chain.chain = StoredChain(store)
+        # From the store's index, without reading any block.
+        block_chain._work, block_chain._times, block_chain._difficulties = (
+            [list(column) for column in zip(*store.summaries())]
+        )
+        block_chain._undo = UndoJournal(os.path.join(directory, UNDO_DIRECTORY))
+        block_chain._undo.truncate(block_chain.length)
+        block_chain._snapshots = SnapshotStore(os.path.join(directory, SNAPSHOT_DIRECTORY))
+        block_chain._rebuild_unspent_tx_outs(block_chain.length - 1)
+        return block_chain
+
+    def _newest_snapshot(self, height: int) -> Optional[Tuple[int, bytes, UnspentTxOutSet]]:
+        """The newest snapshot of a block of ours at or below `height`."""
+        if self._snapshots is None:
+            return None
+        for snapshot_height in self._snapshots.heights():
+            if snapshot_height > height:
+                continue
+            # The header is enough to skip snapshots of blocks we no longer
+            # have, eg; taken just before a reorg.
+            header = self._snapshots.header(snapshot_height)
+            if header is None or header[1] != self.chain[snapshot_height].hash_digest:
+                continue
+            snapshot = self._snapshots.load(snapshot_height)
+            if snapshot is not None:
+                return snapshot
+        return None
+
+    def _rebuild_unspent_tx_outs(self, height: int):
+        """
+        Unspent outputs of our blocks up to `height`, replayed from the newest
+        usable snapshot (see coin.snapshot) or else from genesis. Undo data
+        missing from the journal is recorded on the way.
+        """
+        snapshot = self._newest_snapshot(height)
+        if snapshot is None:
+            first = 0
+            self._unspent_tx_outs = UnspentTxOutSet()
+        else:
+            first = snapshot[0] + 1
+            self._unspent_tx_outs = snapshot[2]
+            self._snapshot_height = snapshot[0]
+        for block_height in range(first, height + 1):
+            # By height, a store backed chain reads one block at a time.
+            block = self.chain[block_height]
+            undo = self.unspent_tx_outs.apply_transactions(block.transactions)
+            if (
+                block.index > height - self._undo.retention
+                and self._undo.get(block.index, block.hash_digest) is None
+            ):
+                self._undo.record(block.index, block.hash_digest, undo)
+        UTXO_SET_SIZE.set(len(self.unspent_tx_outs))
+
+    def generate_new_block(self, transactions: List[Transaction], workers: int = 1):
+        """
+        Search for a nonce that satisfies the current difficulty and append the
+        resulting block. With more than one worker the nonce space is split
+        across a process pool (see coin.mining); the default single worker
+        keeps the deterministic serial search.
+        """
+        new_block = self.mine_block(transactions, workers=workers)
+        error = self.add_block(new_block)
+        if error:
+            raise ValueError(error)
 
-    def generate_new_block(self, block_data: str):
+    def mine_block(
+        self,
+        transactions: List[Transaction],
+        workers: int = 1,
+        stop_event=None,
+        merkle_root: Optional[bytes] = None
+    ) -> Optional[Block]:
+        """
+        Search for the block following our current tip without appending it,
+        see add_block. Returns None if `stop_event` is set before a nonce is
+        found, eg; because the tip moved and the work went stale. Pass the
+        root of a MerkleTree kept alongside a growing template as
+        `merkle_root` to skip computing it here.
+        """
         index: int = self.latest_block.index + 1
         previous_hash = self.latest_block.hashed_data
+        previous_digest = self.latest_block.hash_digest
         difficulty = self.get_difficulty()
-        nonce = 0
-        done = False
-        while not done:
-            # TODO: Makes sense to calculate the has outside of the class, in
-            # the case here, I wouldn't have to initiate a new object every
-            # time.
-            new_block: Block = Block(index, block_data, previous_hash, difficulty, nonce)
-            if self.hash_matches_difficulty(new_block.hashed_data, difficulty):
-                done = True
-            else:
-                nonce += 1
-        assert self._block_is_valid(new_block, self.latest_block)
-        self.chain.append(new_block)
-        self._cummulative_difficulty += 2**difficulty
-
-    def _block_is_valid(self, new_block: Block, old_block: Block):
-        assert new_block.index == old_block.index + 1
-        assert new_block.previous_hash == old_block.hashed_data
-        assert new_block.hashed_data == new_block.calculate_sha()
+        if merkle_root is None:
+            merkle_root = merkle.merkle_root(
+                transaction.transaction_digest for transaction in transactions
+            )
+        # The timestamp is fixed for the whole search so that only the nonce
+        # varies between attempts (and between workers).
+        time = self._unix_milli()
+        start = perf_counter()
+        if workers > 1:
+            nonce = parallel_nonce_search(
+                index, merkle_root, previous_digest, difficulty, time, workers,
+                cancel_event=stop_event
+            )
+        else:
+            kernel = MiningKernel(index, merkle_root, previous_digest, difficulty, time)
+            nonce = kernel.search(stop_event=stop_event)
+        if nonce is None:
+            return None
+        seconds = perf_counter() - start
+        # Nonces are tried from 0 up (interleaved across pool workers), so
+        # this is the number of attempts, give or take the other workers'.
+        attempts = nonce + 1
+        MINING_HASHES.inc(attempts)
+        NONCE_ATTEMPTS.observe(attempts)
+        MINING_SECONDS.observe(seconds)
+        if seconds > 0:
+            MINING_HASHRATE.set(attempts / seconds)
+        return Block(
+            index, transactions, previous_hash, difficulty, nonce, time=time,
+            merkle_root=merkle_root
+        )
+
+    def validate_next_transactions(self, transactions: List[Transaction]) -> Optional[str]:
+        """
+        Check `transactions` as those of a block following our tip, eg;
+        before searching for its nonce. Returns an error message, None when
+        they are valid.
+        """
+        return validate_transactions(
+            transactions,
+            self.unspent_tx_outs,
+            workers=self.validation_workers,
+            block_index=self.latest_block.index + 1
+        )
+
+    def add_block(self, new_block: Block) -> Optional[str]:
+        """
+        Append a block mined on our tip, once it and its transactions are
+        valid. Returns an error message, None when the block was appended.
+        """
+        difficulty = self.get_difficulty()
+        error = self._validate_block(new_block, self.latest_block, difficulty)
+        if error:
+            return error
+        error = self._connect_transactions(new_block)
+        if error:
+            return error
+        try:
+            self.chain.append(new_block)
+        except Exception:
+            # The block isn't ours after all, nor are its transactions.
+            self._disconnect_transactions(new_block)
+            raise
+        self._index_blocks([new_block])
+        self._snapshot_if_due()
+        self._notify([], [new_block])
+        return None
+
+    def _connect_transactions(self, block: Block) -> Optional[str]:
+        """
+        Validate the block's transactions against our unspent outputs and
+        apply them, journaling how to undo that. Returns an error message,
+        None when they were applied.
+        """
+        error = validate_transactions(
+            block.transactions,
+            self.unspent_tx_outs,
+            workers=self.validation_workers,
+            block_index=block.index
+        )
+        if error:
+            return error
+        for transaction in block.transactions:
+            for i in range(len(transaction.tx_outs)):
+                if self.unspent_tx_outs.find_outpoint(transaction.transaction_digest, i):
+                    return f"Transaction {transaction.transaction_id} is already unspent."
+        self._apply_transactions(block)
+        return None
+
+    def _apply_transactions(self, block: Block):
+        undo = self.unspent_tx_outs.apply_transactions(block.transactions)
+        self._undo.record(block.index, block.hash_digest, undo)
+        UTXO_SET_SIZE.set(len(self.unspent_tx_outs))
+
+    def _disconnect_transactions(self, block: Block) -> bool:
+        """Undo the block's transactions, False if its undo data is gone."""
+        undo = self._undo.get(block.index, block.hash_digest)
+        if undo is None:
+            return False
+        self.unspent_tx_outs.undo_transactions(undo)
+        self._undo.discard(block.index)
         return True
 
-    def chain_is_valid(self, chain: List[Block]):
-        prev_block: Optional[Block] = None
-        for block in chain:
-            if prev_block:
-                assert self._block_is_valid(block, prev_block)
-            else:
-                assert block.hashed_data == self.chain[0].hashed_data
-            prev_block = block
+    def _validate_block(
+        self,
+        new_block: Block,
+        previous_block: Block,
+        difficulty: int
+    ) -> Optional[str]:
+        """Returns an error message, None when the block is valid."""
+        if new_block.index != previous_block.index + 1:
+            return f"Block {new_block.index} does not follow {previous_block.index}."
+        if new_block.previous_digest != previous_block.hash_digest:
+            return f"Block {new_block.index} does not link to the previous block."
+        try:
+            digest = new_block._calculate_digest()
+        except (struct.error, TypeError):
+            return f"Block {new_block.index} has a malformed header."
+        if new_block.hash_digest != digest:
+            return f"Block {new_block.index} hash does not match its header."
+        if new_block.difficulty != difficulty:
+            return f"Block {new_block.index} has difficulty {new_block.difficulty}, expected {difficulty}."
+        target = difficulty_target(difficulty)
+        if target is not None and new_block.hash_digest >= target:
+            return f"Block {new_block.index} hash does not satisfy its difficulty."
+        if not self.is_valid_timestamp(new_block, previous_block):
+            return f"Block {new_block.index} has an invalid timestamp."
+        # Last, the header checks are cheaper. Distinct transactions also
+        # rule out a second transaction list with the same root (padding an
+        # odd level with a copy of its last node).
+        transaction_digests = {t.transaction_digest for t in new_block.transactions}
+        if len(transaction_digests) != len(new_block.transactions):
+            return f"Block {new_block.index} has duplicate transactions."
+        if new_block.merkle_root != new_block._calculate_merkle_root():
+            return f"Block {new_block.index} merkle root does not match its transactions."
+        # Anything the store couldn't write, eg; text that isn't UTF-8, is
+        # turned away before the unspent outputs are touched.
+        if not self._is_encodable(new_block):
+            return f"Block {new_block.index} can't be encoded."
+        return None
+
+    @staticmethod
+    def _is_encodable(block: Block) -> bool:
+        # TODO: Hack to avoid circular dependency.
+        from coin.codec import encode_block_body
+        try:
+            encode_block_body(block)
+        except (struct.error, TypeError, ValueError, OverflowError):
+            return False
         return True
 
+    def find_fork_point(self, chain: List[Block]) -> int:
+        """
+        Height of the last block `chain` shares with ours, comparing
+        hashed_data, or -1 when not even the genesis blocks match. Blocks are
+        hash linked so the shared part is a prefix and can be binary searched.
+        """
+        low = 0
+        high = min(len(chain), self.length) - 1
+        if high < 0 or chain[0].hash_digest != self.chain[0].hash_digest:
+            return -1
+        while low < high:
+            mid = (low + high + 1) // 2
+            if chain[mid].hash_digest == self.chain[mid].hash_digest:
+                low = mid
+            else:
+                high = mid - 1
+        return low
+
+    def validate_chain(self, chain: List[Block]) -> Optional[str]:
+        """
+        Validate `chain` against ours. Everything up to the common ancestor
+        has already been validated as part of our chain and is trusted, so
+        only the divergent suffix is checked: linkage, hashes, difficulty and
+        timestamps. Returns an error message, None when the chain is valid.
+        """
+        fork_point = self.find_fork_point(chain)
+        return self._validate_blocks(fork_point, chain[fork_point + 1:])
+
+    def _validate_blocks(self, fork_point: int, blocks: List[Block]) -> Optional[str]:
+        """Validate `blocks` as the successors of our block at `fork_point`."""
+        BLOCKS_VALIDATED.inc(len(blocks))
+        with BLOCK_VALIDATION_SECONDS.time():
+            return self._validate_blocks_untimed(fork_point, blocks)
+
+    def _validate_blocks_untimed(self, fork_point: int, blocks: List[Block]) -> Optional[str]:
+        if fork_point < 0:
+            return "Genesis block does not match."
+
+        # Our index is used for the trusted prefix.
+        def time_at(height: int) -> float:
+            if height <= fork_point:
+                return self._times[height]
+            return blocks[height - fork_point - 1].time
+
+        def difficulty_at(height: int) -> int:
+            if height <= fork_point:
+                return self._difficulties[height]
+            return blocks[height - fork_point - 1].difficulty
+
+        previous_block = self.chain[fork_point]
+        for height, block in enumerate(blocks, fork_point + 1):
+            error = self._validate_block(
+                block,
+                previous_block,
+                self._required_difficulty(time_at, difficulty_at, height)
+            )
+            if error:
+                return error
+            previous_block = block
+        return None
+
+    def chain_is_valid(self, chain: List[Block]) -> bool:
+        return self.validate_chain(chain) is None
+
+    def replace_chain(self, chain: List[Block]) -> Optional[str]:
+        """
+        Validate `chain` and switch to it, keeping our blocks up to the fork
+        point, if it has more work than ours (see connect_blocks). Returns an
+        error message, None when the chain was replaced.
+        """
+        fork_point = self.find_fork_point(chain)
+        if fork_point < 0:
+            return "Genesis block does not match."
+        return self.connect_blocks(fork_point, chain[fork_point + 1:])
+
+    def connect_blocks(self, fork_point: int, blocks: List[Block]) -> Optional[str]:
+        """
+        Validate `blocks`, the successors of our block at `fork_point`, and
+        switch to them if that adds work: always when they extend our tip,
+        otherwise only when they carry more work than the blocks of ours they
+        replace. Returns an error message, None when the blocks were connected.
+        """
+        if not 0 <= fork_point < self.length:
+            return f"Unknown fork point {fork_point}."
+        # The cheap check first: our side of the comparison is one lookup in
+        # the work index, and a branch without more work isn't worth
+        # validating.
+        for block in blocks:
+            if not is_valid_difficulty(block.difficulty):
+                return f"Block {block.index} has invalid difficulty."
+        added_work = sum(block_work(b.difficulty) for b in blocks)
+        if added_work <= self.work_after(fork_point):
+            return "Blocks do not add work to the chain."
+        error = self._validate_blocks(fork_point, blocks)
+        if error:
+            return error
+        disconnected = self.chain[fork_point + 1:]
+        error = self._reorganize_unspent_tx_outs(fork_point, disconnected, blocks)
+        if error:
+            return error
+        try:
+            self._switch_to(fork_point, blocks)
+        except Exception:
+            # Eg; the store failed part way, our branch goes back as it was.
+            del self.chain[fork_point + 1:]
+            self.chain.extend(disconnected)
+            self._restore_unspent_tx_outs(fork_point, disconnected, blocks)
+            raise
+        self._snapshot_if_due()
+        self._notify(disconnected, blocks)
+        return None
+
+    def _notify(self, disconnected: List[Block], connected: List[Block]):
+        for listener in self.listeners:
+            listener(disconnected, connected)
+
+    def _reorganize_unspent_tx_outs(
+        self,
+        fork_point: int,
+        disconnected: List[Block],
+        blocks: List[Block]
+    ) -> Optional[str]:
+        """
+        Roll our unspent outputs back to `fork_point` with the undo journal
+        and connect the transactions of `blocks`, so the work done is in
+        proportion to the depth of the reorg. Only a reorg deeper than the
+        journal keeps replays from genesis. If a block's transactions are
+        invalid everything is put back and the error message returned.
+        """
+        for block in reversed(disconnected):
+            if not self._disconnect_transactions(block):
+                UNSPENT_REBUILDS.inc()
+                self._undo.truncate(fork_point + 1)
+                self._rebuild_unspent_tx_outs(fork_point)
+                break
+        BLOCKS_DISCONNECTED.inc(len(disconnected))
+        connected: List[Block] = []
+        for block in blocks:
+            error = self._connect_transactions(block)
+            if error:
+                self._restore_unspent_tx_outs(fork_point, disconnected, connected)
+                return error
+            connected.append(block)
+        return None
+
+    def _restore_unspent_tx_outs(
+        self,
+        fork_point: int,
+        disconnected: List[Block],
+        connected: List[Block]
+    ):
+        """Undo the `connected` blocks and reapply our `disconnected` ones."""
+        for block in reversed(connected):
+            if not self._disconnect_transactions(block):
+                self._rebuild_unspent_tx_outs(fork_point)
+                break
+        for block in disconnected:
+            self._apply_transactions(block)
+
+    def _snapshot_if_due(self):
+        if (
+            self._snapshots is not None
+            and self.length - 1 - self._snapshot_height >= SNAPSHOT_INTERVAL
+        ):
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        """
+        Snapshot our unspent outputs at the tip, for open to start from. Only
+        a store backed chain has somewhere to keep them.
+        """
+        if self._snapshots is None:
+            return
+        self._snapshots.write(
+            self.length - 1, self.latest_block.hash_digest, self.unspent_tx_outs
+        )
+        self._snapshot_height = self.length - 1
+
+    def close(self):
+        """Flush and close the store of a chain from open, if it has one."""
+        # TODO: Hack to avoid circular dependency.
+        from coin.store import StoredChain
+        if isinstance(self.chain, StoredChain):
+            self.chain.close()
+
+    def _switch_to(self, fork_point: int, blocks: List[Block]):
+        # In place, so a store backed chain is truncated and appended to.
+        del self.chain[fork_point + 1:]
+        self.chain.extend(blocks)
+        self._truncate_index(fork_point + 1)
+        self._index_blocks(blocks)
+
+    def work_at(self, height: int) -> int:
+        """Cumulative work of our chain up to `height`."""
+        return self._work[height]
+
+    def work_after(self, height: int) -> int:
+        """Work of our blocks after `height`."""
+        return self._work[-1] - self._work[height]
+
+    def get_locator(self) -> List[Tuple[int, str]]:
+        """
+        (height, hash) of our blocks, every block for the ten nearest the tip
+        and then exponentially sparser back to genesis. A peer finds our fork
+        point by taking the first entry it also has.
+        """
+        locator: List[Tuple[int, str]] = []
+        height = self.length - 1
+        step = 1
+        while height > 0:
+            locator.append((height, self.chain[height].hashed_data))
+            if len(locator) >= 10:
+                step *= 2
+            height -= step
+        locator.append((0, self.chain[0].hashed_data))
+        return locator
+
+    def find_locator_fork(self, locator: List[Tuple[int, str]]) -> int:
+        """Height of the first locator entry in our chain, -1 if none is."""
+        for height, hashed_data in locator:
+            if 0 <= height < self.length and self.chain[height].hashed_data == hashed_data:
+                return height
+        return -1
+
+    def get_headers(self, start: int, count: int) -> List[dict]:
+        return [
+            self.chain[height].get_header()
+            for height in range(start, min(start + count, self.length))
+        ]
+
     @staticmethod
     def hash_matches_difficulty(hashed_data: str, difficulty: int):
-        num_bits = int(len(hashed_data) * math.log2(16))
-        hash_in_binary = bin(int(hashed_data, 16))[2:].zfill(num_bits)
-        return hash_in_binary[:difficulty] == "0" * difficulty
+        # Eg; a peer's header, no hash satisfies a difficulty out of range.
+        if not is_valid_difficulty(difficulty):
+            return False
+        num_bits = len(hashed_data) * 4
+        return int(hashed_data, 16) >> (num_bits - difficulty) == 0
 
     def get_difficulty(self):
-        get_difficulty = self.latest_block.index % self.difficulty_adjustment_interval == 0
-        if get_difficulty and self.latest_block.index != 0:
-            return self.get_adjusted_difficulty()
-        else:
-            return self.latest_block.difficulty
+        return self._required_difficulty(
+            self._times.__getitem__, self._difficulties.__getitem__, self.length
+        )
 
     def get_adjusted_difficulty(self):
+        return self._adjusted_difficulty(
+            self._times.__getitem__, self._difficulties.__getitem__, self.length
+        )
+
+    def _required_difficulty(
+        self,
+        time_at: Callable[[int], float],
+        difficulty_at: Callable[[int], int],
+        height: int
+    ) -> int:
+        """Difficulty the block at `height` must have, given the blocks before it."""
+        latest_index = height - 1
+        get_difficulty = latest_index % self.difficulty_adjustment_interval == 0
+        if get_difficulty and latest_index != 0:
+            return self._adjusted_difficulty(time_at, difficulty_at, height)
+        else:
+            return difficulty_at(latest_index)
+
+    def _adjusted_difficulty(
+        self,
+        time_at: Callable[[int], float],
+        difficulty_at: Callable[[int], int],
+        height: int
+    ) -> int:
         # TODO: Possible bug for when this fires.
-        prev_adjustment_block = self.chain[self.length - self.difficulty_adjustment_interval]
+        prev_adjustment_height = height - self.difficulty_adjustment_interval
+        prev_adjustment_difficulty = difficulty_at(prev_adjustment_height)
         time_expected = self.difficulty_adjustment_interval * self.block_generation_interval
-        time_taken = self.latest_block.time - prev_adjustment_block.time
+        time_taken = time_at(height - 1) - time_at(prev_adjustment_height)
+        # Kept in range, blocks outside it are rejected.
         if time_taken < time_expected / 2:
-            return prev_adjustment_block.difficulty + 1
+            return min(prev_adjustment_difficulty + 1, MAX_DIFFICULTY)
         elif time_taken > time_expected * 2:
-            return prev_adjustment_block.difficulty - 1
+            return max(prev_adjustment_difficulty - 1, 0)
         else:
-            return prev_adjustment_block.difficulty
+            return prev_adjustment_difficulty
 
     @property
     def cummulative_difficulty(self):
-        return self._cummulative_difficulty
+        return self._work[-1]
 
-    def is_valid_timestamp(self, new_block: Block, previous_block: Block):
-        assert previous_block.time - 6000 < new_block.time
-        assert new_block.time - 6000 < self._unix_milli()
+    def is_valid_timestamp(self, new_block: Block, previous_block: Block) -> bool:
+        return (
+            previous_block.time - 6000 < new_block.time
+            and new_block.time - 6000 < self._unix_milli()
+        )
 
     def get_json(self):
-        return json.dumps(self, default=lambda o: o.__dict__, sort_keys=True)
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "chain": [block.to_dict() for block in self.chain],
+            "difficulty_adjustment_interval": self.difficulty_adjustment_interval,
+            "block_generation_interval": self.block_generation_interval,
+            "_cummulative_difficulty": self.cummulative_difficulty,
+        }
 
     @staticmethod
     def _unix_milli():
@@ -0,0 +1,533 @@
+"""
+Compact binary encoding for blocks, chains and transactions.
+
+Every encoded message starts with MAGIC, the format VERSION and a kind byte.
+Hashes are stored as raw bytes, numbers as fixed size little endian fields
+and strings and lists are length prefixed, so a decoder can walk a
+memoryview without slicing copies of the buffer. JSON (get_json) is still
+the format for humans.
+"""
+import struct
+from typing import List, Optional, Tuple
+
+from coin.block import Block, BlockChain, LazyChain
+from coin.mining import is_valid_difficulty
+from coin.transaction import (
+    BlockUndo,
+    Transaction,
+    TxIn,
+    TxOut,
+    UnspentTxOut,
+    is_valid_amount,
+)
+
+
+MAGIC = b"CN"
+VERSION = 2
+MIME_TYPE = "application/octet-stream"
+
+KIND_BLOCK = 1
+KIND_BLOCK_CHAIN = 2
+KIND_TRANSACTION = 3
+KIND_TX_IN = 4
+KIND_TX_OUT = 5
+KIND_UNSPENT_TX_OUT = 6
+KIND_BLOCK_LIST = 7
+KIND_BLOCK_UNDO = 8
+
+_HEADER = struct.Struct("<2sBB")
+_U8 = struct.Struct("<B")
+_U32 = struct.Struct("<I")
+_NONE_LENGTH = 0xFFFFFFFF
+# index, time, difficulty, nonce.
+_BLOCK_FIELDS = struct.Struct("<QdiQ")
+# interval, generation interval.
+_BLOCK_CHAIN_FIELDS = struct.Struct("<II")
+_TX_OUT_INDEX = struct.Struct("<I")
+# tx out index, signature length.
+_TX_IN_FIELDS = struct.Struct("<II")
+_AMOUNT = struct.Struct("<d")
+
+
+class _Writer:
+    def __init__(self, kind: Optional[int]):
+        # No kind for bodies that are embedded in a larger message.
+        self.parts: List[bytes] = []
+        if kind is not None:
+            self.parts.append(_HEADER.pack(MAGIC, VERSION, kind))
+
+    def hash(self, hex_digest: str):
+        self.digest(bytes.fromhex(hex_digest))
+
+    def digest(self, raw: bytes):
+        self.parts.append(_U8.pack(len(raw)) + raw)
+
+    def text(self, value: Optional[str]):
+        if value is None:
+            self.parts.append(_U32.pack(_NONE_LENGTH))
+            return
+        raw = value.encode()
+        self.parts.append(_U32.pack(len(raw)) + raw)
+
+    def big_int(self, value: int):
+        raw = value.to_bytes((value.bit_length() + 7) // 8, "big")
+        self.parts.append(_U8.pack(len(raw)) + raw)
+
+    def pack(self, fmt: struct.Struct, *values):
+        self.parts.append(fmt.pack(*values))
+
+    def getvalue(self) -> bytes:
+        return b"".join(self.parts)
+
+
+class _Reader:
+    """Reads fields straight out of a memoryview, tracking the offset."""
+    def __init__(self, data: bytes, kind: Optional[int]):
+        self.view = memoryview(data)
+        self.offset = 0
+        if kind is None:
+            # A body cut out of a larger message, without a header.
+            return
+        magic, version, found_kind = self.unpack(_HEADER)
+        if magic != MAGIC:
+            raise ValueError("Not a binary coin message.")
+        if version != VERSION:
+            raise ValueError(f"Unsupported binary format version {version}.")
+        if found_kind != kind:
+            raise ValueError(f"Expected message kind {kind}, found {found_kind}.")
+
+    def unpack(self, fmt: struct.Struct) -> tuple:
+        try:
+            values = fmt.unpack_from(self.view, self.offset)
+        except struct.error as e:
+            raise ValueError("Truncated binary message.") from e
+        self.offset += fmt.size
+        return values
+
+    def _bytes(self, length: int) -> memoryview:
+        end = self.offset + length
+        if end > len(self.view):
+            raise ValueError("Truncated binary message.")
+        chunk = self.view[self.offset:end]
+        self.offset = end
+        return chunk
+
+    def digest(self) -> bytes:
+        length, = self.unpack(_U8)
+        return bytes(self._bytes(length))
+
+    def text(self) -> Optional[str]:
+        length, = self.unpack(_U32)
+        if length == _NONE_LENGTH:
+            return None
+        return str(self._bytes(length), "utf-8")
+
+    def big_int(self) -> int:
+        length, = self.unpack(_U8)
+        return int.from_bytes(self._bytes(length), "big")
+
+    def done(self):
+        if self.offset != len(self.view):
+            raise ValueError("Trailing bytes after binary message.")
+
+
+def is_binary(data: bytes) -> bool:
+    return data[:len(MAGIC)] == MAGIC
+
+
+# Blocks.
+
+def _write_block(writer: _Writer, block: Block):
+    writer.pack(_BLOCK_FIELDS, block.index, block.time, block.difficulty, block.nonce)
+    writer.digest(block.previous_digest)
+    writer.digest(block.merkle_root)
+    writer.pack(_U32, len(block.transactions))
+    for transaction in block.transactions:
+        _write_transaction(writer, transaction)
+    writer.digest(block.hash_digest)
+
+
+def _read_block(reader: _Reader) -> Block:
+    # The header is inlined rather than going through the reader's helpers,
+    # decoding whole chains spends most of its time here.
+    view = reader.view
+    offset = reader.offset
+    try:
+        index, time, difficulty, nonce = _BLOCK_FIELDS.unpack_from(view, offset)
+        offset += _BLOCK_FIELDS.size
+        length = view[offset]
+        previous_digest = bytes(view[offset + 1:offset + 1 + length])
+        offset += 1 + length
+        length = view[offset]
+        merkle_root = bytes(view[offset + 1:offset + 1 + length])
+        offset += 1 + length
+        count, = _U32.unpack_from(view, offset)
+        offset += 4
+    except (IndexError, struct.error) as e:
+        raise ValueError("Truncated binary message.") from e
+    if offset > len(view):
+        raise ValueError("Truncated binary message.")
+    if not is_valid_difficulty(difficulty):
+        raise ValueError(f"Block {index} has invalid difficulty.")
+    reader.offset = offset
+    transactions = [_read_transaction(reader) for _ in range(count)]
+    return Block.from_digests(
+        index,
+        transactions,
+        previous_digest,
+        difficulty,
+        nonce,
+        time,
+        merkle_root,
+        reader.digest()
+    )
+
+
+def _skim_block(view: memoryview, offset: int) -> Tuple[int, float, int]:
+    """
+    (end offset, time, difficulty) of the block body at `offset`, stepping
+    over its transactions without decoding them.
+    """
+    try:
+        _, time, difficulty, _ = _BLOCK_FIELDS.unpack_from(view, offset)
+        offset += _BLOCK_FIELDS.size
+        # Previous hash and merkle root.
+        offset += 1 + view[offset]
+        offset += 1 + view[offset]
+        count, = _U32.unpack_from(view, offset)
+        offset += _U32.size
+        for _ in range(count):
+            tx_in_count, = _U32.unpack_from(view, offset)
+            offset += _U32.size
+            for _ in range(tx_in_count):
+                offset += 1 + view[offset] + _TX_OUT_INDEX.size
+                length, = _U32.unpack_from(view, offset)
+                offset += _U32.size
+                if length != _NONE_LENGTH:
+                    offset += length
+            tx_out_count, = _U32.unpack_from(view, offset)
+            offset += _U32.size
+            for _ in range(tx_out_count):
+                length, = _U32.unpack_from(view, offset)
+                offset += _U32.size + length + _AMOUNT.size
+            # Transaction id.
+            offset += 1 + view[offset]
+        # Block hash.
+        offset += 1 + view[offset]
+    except (IndexError, struct.error) as e:
+        raise ValueError("Truncated binary message.") from e
+    if offset > len(view):
+        raise ValueError("Truncated binary message.")
+    return offset, time, difficulty
+
+
+def encode_block_body(block: Block) -> bytes:
+    """A block without the message header, as it appears inside chains and lists."""
+    writer = _Writer(None)
+    _write_block(writer, block)
+    return writer.getvalue()
+
+
+def encode_block_header() -> bytes:
+    """Followed by an encode_block_body makes a block."""
+    return _HEADER.pack(MAGIC, VERSION, KIND_BLOCK)
+
+
+def encode_block(block: Block) -> bytes:
+    return encode_block_header() + encode_block_body(block)
+
+
+def decode_block_body(data: bytes) -> Block:
+    """A block encoded by encode_block_body."""
+    reader = _Reader(data, None)
+    block = _read_block(reader)
+    reader.done()
+    return block
+
+
+def decode_block(data: bytes) -> Block:
+    reader = _Reader(data, KIND_BLOCK)
+    block = _read_block(reader)
+    reader.done()
+    return block
+
+
+def encode_block_list_header(count: int) -> bytes:
+    """Followed by `count` encode_block_body's makes a block list."""
+    return _HEADER.pack(MAGIC, VERSION, KIND_BLOCK_LIST) + _U32.pack(count)
+
+
+def encode_block_list(blocks: List[Block]) -> bytes:
+    return encode_block_list_header(len(blocks)) + b"".join(
+        encode_block_body(block) for block in blocks
+    )
+
+
+def decode_block_list(data: bytes) -> List[Block]:
+    reader = _Reader(data, KIND_BLOCK_LIST)
+    count, = reader.unpack(_U32)
+    blocks = [_read_block(reader) for _ in range(count)]
+    reader.done()
+    return blocks
+
+
+def encode_block_chain_header(block_chain: BlockChain) -> bytes:
+    """Followed by the encode_block_body of every block makes a block chain."""
+    writer = _Writer(KIND_BLOCK_CHAIN)
+    writer.pack(
+        _BLOCK_CHAIN_FIELDS,
+        block_chain.difficulty_adjustment_interval,
+        block_chain.block_generation_interval
+    )
+    writer.big_int(block_chain.cummulative_difficulty)
+    writer.pack(_U32, block_chain.length)
+    return writer.getvalue()
+
+
+def encode_block_chain(block_chain: BlockChain) -> bytes:
+    return encode_block_chain_header(block_chain) + b"".join(
+        encode_block_body(block) for block in block_chain.chain
+    )
+
+
+def _block_dict(block: Block) -> dict:
+    # Block.to_dict, keeping the Transaction objects, which Block.from_dict
+    # takes as they are.
+    return {
+        "index": block.index,
+        "time": block.time,
+        "difficulty": block.difficulty,
+        "nonce": block.nonce,
+        "previous_hash": block.previous_hash,
+        "merkle_root": block.merkle_root.hex(),
+        "transactions": block.transactions,
+        "hashed_data": block.hashed_data,
+    }
+
+
+def decode_block_chain_dict(data: bytes) -> dict:
+    """
+    The dict BlockChain.to_dict gives, ie; what BlockChain(json=) takes, but
+    with the blocks' transactions already decoded.
+    """
+    reader = _Reader(data, KIND_BLOCK_CHAIN)
+    interval, generation_interval = reader.unpack(_BLOCK_CHAIN_FIELDS)
+    cummulative_difficulty = reader.big_int()
+    length, = reader.unpack(_U32)
+    blocks = [_block_dict(_read_block(reader)) for _ in range(length)]
+    reader.done()
+    return {
+        "chain": blocks,
+        "difficulty_adjustment_interval": interval,
+        "block_generation_interval": generation_interval,
+        "_cummulative_difficulty": cummulative_difficulty,
+    }
+
+
+def decode_block_chain(data: bytes) -> BlockChain:
+    """
+    The chain with its blocks left encoded until they are accessed (see
+    LazyChain), only their lengths, times and difficulties are read here.
+    """
+    reader = _Reader(data, KIND_BLOCK_CHAIN)
+    interval, generation_interval = reader.unpack(_BLOCK_CHAIN_FIELDS)
+    cummulative_difficulty = reader.big_int()
+    length, = reader.unpack(_U32)
+    bodies: List[memoryview] = []
+    summaries: List[Tuple[float, int]] = []
+    for _ in range(length):
+        end, time, difficulty = _skim_block(reader.view, reader.offset)
+        bodies.append(reader.view[reader.offset:end])
+        summaries.append((time, difficulty))
+        reader.offset = end
+    reader.done()
+    return BlockChain(json={
+        "chain": LazyChain(bodies, decode_block_body, summaries),
+        "difficulty_adjustment_interval": interval,
+        "block_generation_interval": generation_interval,
+        "_cummulative_difficulty": cummulative_difficulty,
+    })
+
+
+# Transactions.
+
+def _write_tx_in(writer: _Writer, tx_in: TxIn):
+    writer.digest(tx_in.tx_out_digest)
+    writer.pack(_TX_OUT_INDEX, tx_in.tx_out_index)
+    writer.text(tx_in.signature)
+
+
+def _read_tx_in(reader: _Reader) -> TxIn:
+    tx_out_digest = reader.digest()
+    tx_out_index, = reader.unpack(_TX_OUT_INDEX)
+    return TxIn.from_digest(tx_out_digest, tx_out_index, reader.text())
+
+
+def _write_tx_out(writer: _Writer, tx_out: TxOut):
+    writer.text(tx_out.address)
+    writer.pack(_AMOUNT, tx_out.amount)
+
+
+def _read_tx_out(reader: _Reader) -> TxOut:
+    address = reader.text()
+    amount, = reader.unpack(_AMOUNT)
+    if address is None:
+        raise ValueError("Output without an address.")
+    if not is_valid_amount(amount):
+        raise ValueError(f"Invalid output amount {amount}.")
+    return TxOut(address, amount)
+
+
+def _write_transaction(writer: _Writer, transaction: Transaction):
+    writer.pack(_U32, len(transaction.tx_ins))
+    for tx_in in transaction.tx_ins:
+        _write_tx_in(writer, tx_in)
+    writer.pack(_U32, len(transaction.tx_outs))
+    for tx_out in transaction.tx_outs:
+        _write_tx_out(writer, tx_out)
+    writer.digest(transaction.transaction_digest)
+
+
+def _read_transaction(reader: _Reader) -> Transaction:
+    # Inlined like _read_block, transactions are most of a block. Digests
+    # are sliced straight out of the view, and the id is compared as bytes.
+    view = reader.view
+    offset = reader.offset
+    try:
+        tx_in_count, = _U32.unpack_from(view, offset)
+        offset += 4
+        tx_ins: List[TxIn] = []
+        for _ in range(tx_in_count):
+            length = view[offset]
+            tx_out_digest = bytes(view[offset + 1:offset + 1 + length])
+            offset += 1 + length
+            tx_out_index, length = _TX_IN_FIELDS.unpack_from(view, offset)
+            offset += _TX_IN_FIELDS.size
+            signature = None
+            if length != _NONE_LENGTH:
+                signature = str(view[offset:offset + length], "utf-8")
+                offset += length
+            tx_ins.append(TxIn.from_digest(tx_out_digest, tx_out_index, signature))
+        tx_out_count, = _U32.unpack_from(view, offset)
+        offset += 4
+        tx_outs: List[TxOut] = []
+        for _ in range(tx_out_count):
+            length, = _U32.unpack_from(view, offset)
+            offset += 4
+            address = str(view[offset:offset + length], "utf-8")
+            offset += length
+            amount, = _AMOUNT.unpack_from(view, offset)
+            offset += _AMOUNT.size
+            if not is_valid_amount(amount):
+                raise ValueError(f"Invalid output amount {amount}.")
+            tx_outs.append(TxOut(address, amount))
+        length = view[offset]
+        transaction_digest = view[offset + 1:offset + 1 + length]
+        offset += 1 + length
+    except (IndexError, struct.error) as e:
+        raise ValueError("Truncated binary message.") from e
+    if offset > len(view):
+        raise ValueError("Truncated binary message.")
+    reader.offset = offset
+    transaction = Transaction(tx_ins, tx_outs)
+    if transaction.transaction_digest != transaction_digest:
+        raise ValueError("Transaction id does not match its contents.")
+    return transaction
+
+
+def encode_transaction(transaction: Transaction) -> bytes:
+    writer = _Writer(KIND_TRANSACTION)
+    _write_transaction(writer, transaction)
+    return writer.getvalue()
+
+
+def decode_transaction(data: bytes) -> Transaction:
+    reader = _Reader(data, KIND_TRANSACTION)
+    transaction = _read_transaction(reader)
+    reader.done()
+    return transaction
+
+
+def encode_tx_in(tx_in: TxIn) -> bytes:
+    writer = _Writer(KIND_TX_IN)
+    _write_tx_in(writer, tx_in)
+    return writer.getvalue()
+
+
+def decode_tx_in(data: bytes) -> TxIn:
+    reader = _Reader(data, KIND_TX_IN)
+    tx_in = _read_tx_in(reader)
+    reader.done()
+    return tx_in
+
+
+def encode_tx_out(tx_out: TxOut) -> bytes:
+    writer = _Writer(KIND_TX_OUT)
+    _write_tx_out(writer, tx_out)
+    return writer.getvalue()
+
+
+def decode_tx_out(data: bytes) -> TxOut:
+    reader = _Reader(data, KIND_TX_OUT)
+    tx_out = _read_tx_out(reader)
+    reader.done()
+    return tx_out
+
+
+def _write_unspent_tx_out(writer: _Writer, u_tx_out: UnspentTxOut):
+    writer.digest(u_tx_out.tx_out_digest)
+    writer.pack(_TX_OUT_INDEX, u_tx_out.tx_out_index)
+    writer.text(u_tx_out.address)
+    writer.pack(_AMOUNT, u_tx_out.amount)
+
+
+def _read_unspent_tx_out(reader: _Reader) -> UnspentTxOut:
+    tx_out_digest = reader.digest()
+    tx_out_index, = reader.unpack(_TX_OUT_INDEX)
+    address = reader.text()
+    amount, = reader.unpack(_AMOUNT)
+    if address is None:
+        raise ValueError("Unspent output without an address.")
+    return UnspentTxOut.from_digest(tx_out_digest, tx_out_index, address, amount)
+
+
+def encode_unspent_tx_out(u_tx_out: UnspentTxOut) -> bytes:
+    writer = _Writer(KIND_UNSPENT_TX_OUT)
+    _write_unspent_tx_out(writer, u_tx_out)
+    return writer.getvalue()
+
+
+def decode_unspent_tx_out(data: bytes) -> UnspentTxOut:
+    reader = _Reader(data, KIND_UNSPENT_TX_OUT)
+    u_tx_out = _read_unspent_tx_out(reader)
+    reader.done()
+    return u_tx_out
+
+
+def encode_block_undo(block_digest: bytes, undo: BlockUndo) -> bytes:
+    """The undo data of the block hashing to `block_digest`."""
+    writer = _Writer(KIND_BLOCK_UNDO)
+    writer.digest(block_digest)
+    writer.pack(_U32, len(undo.spent))
+    for u_tx_out in undo.spent:
+        _write_unspent_tx_out(writer, u_tx_out)
+    writer.pack(_U32, len(undo.created))
+    for tx_out_digest, tx_out_index in undo.created:
+        writer.digest(tx_out_digest)
+        writer.pack(_TX_OUT_INDEX, tx_out_index)
+    return writer.getvalue()
+
+
+def decode_block_undo(data: bytes) -> Tuple[bytes, BlockUndo]:
+    reader = _Reader(data, KIND_BLOCK_UNDO)
+    block_digest = reader.digest()
+    spent_count, = reader.unpack(_U32)
+    spent = [_read_unspent_tx_out(reader) for _ in range(spent_count)]
+    created_count, = reader.unpack(_U32)
+    created = []
+    for _ in range(created_count):
+        tx_out_digest = reader.digest()
+        tx_out_index, = reader.unpack(_TX_OUT_INDEX)
+        created.append((tx_out_digest, tx_out_index))
+    reader.done()
+    return block_digest, BlockUndo(spent, created)
@@ -0,0 +1,190 @@
+"""
+Pending transactions waiting to be mined.
+"""
+import heapq
+from itertools import count
+from typing import Dict, List, Optional, Tuple
+
+from coin import codec
+from coin.block import Block, BlockChain
+from coin.transaction import (
+    Transaction,
+    UnspentTxOutSet,
+    get_coinbase_transaction,
+    is_coinbase_transaction,
+    validate_transactions,
+)
+
+
+# Serialized bytes of pending transactions kept before the worst are evicted.
+MAX_MEMPOOL_BYTES = 64 * 1024 * 1024
+
+
+class _Entry:
+    def __init__(self, transaction: Transaction, fee: float, size: int, sequence: int):
+        self.transaction: Transaction = transaction
+        self.fee: float = fee
+        self.size: int = size
+        self.sequence: int = sequence
+        # Fee per serialized byte, then first come first served.
+        self.priority: Tuple[float, int] = (-fee / size, sequence)
+
+
+class Mempool:
+    """
+    Valid transactions not yet in a block of `block_chain`, each spending
+    its unspent outputs. Those are read through the chain, which replaces
+    the set on a rebuild. Add chain_changed to the chain's listeners to keep
+    the pool in step with it.
+
+    Transactions are deduped by transaction_id, and every outpoint
+    (tx_out_id, tx_out_index) a pending transaction spends is indexed, so a
+    double spend is rejected in O(1) before any signature is checked. The
+    highest fee per byte is mined first. Past `max_bytes` the lowest priority
+    transactions are evicted; both orders are heaps whose stale entries are
+    skipped lazily, keeping add and remove O(log n).
+    """
+    def __init__(self, block_chain: BlockChain, max_bytes: int = MAX_MEMPOOL_BYTES):
+        self.block_chain: BlockChain = block_chain
+        self.max_bytes: int = max_bytes
+        self.size_bytes: int = 0
+        self._entries: Dict[str, _Entry] = {}
+        self._spent: Dict[Tuple[bytes, int], str] = {}
+        self._best: List[Tuple[Tuple[float, int], str]] = []
+        self._worst: List[Tuple[Tuple[float, int], str]] = []
+        self._sequence = count()
+
+    @property
+    def unspent_tx_outs(self) -> UnspentTxOutSet:
+        return self.block_chain.unspent_tx_outs
+
+    def add(self, transaction: Transaction) -> Optional[str]:
+        """Returns an error message, None when the transaction was added."""
+        transaction_id: str = transaction.transaction_id
+        if transaction_id in self._entries:
+            return f"Transaction {transaction_id} is already pending."
+        if is_coinbase_transaction(transaction):
+            return f"Coinbase transaction {transaction_id} can't be relayed."
+        for tx_in in transaction.tx_ins:
+            conflict = self._spent.get((tx_in.tx_out_digest, tx_in.tx_out_index))
+            if conflict is not None:
+                return f"Transaction {transaction_id} conflicts with pending {conflict}."
+        error = validate_transactions([transaction], self.unspent_tx_outs)
+        if error:
+            return error
+        fee = sum(
+            self.unspent_tx_outs.find_outpoint(tx_in.tx_out_digest, tx_in.tx_out_index).amount
+            for tx_in in transaction.tx_ins
+        ) - sum(tx_out.amount for tx_out in transaction.tx_outs)
+        entry = _Entry(
+            transaction,
+            max(fee, 0.),
+            len(codec.encode_transaction(transaction)),
+            next(self._sequence)
+        )
+        self._entries[transaction_id] = entry
+        for tx_in in transaction.tx_ins:
+            self._spent[(tx_in.tx_out_digest, tx_in.tx_out_index)] = transaction_id
+        heapq.heappush(self._best, (entry.priority, transaction_id))
+        fee_rate, sequence = entry.priority
+        heapq.heappush(self._worst, ((-fee_rate, -sequence), transaction_id))
+        self.size_bytes += entry.size
+        self._evict()
+        if transaction_id not in self._entries:
+            return f"Transaction {transaction_id} pays too little to fit in the mempool."
+        return None
+
+    def _evict(self):
+        while self.size_bytes > self.max_bytes and self._worst:
+            (fee_rate, sequence), transaction_id = heapq.heappop(self._worst)
+            entry = self._entries.get(transaction_id)
+            # Stale, eg; the transaction was removed and added again.
+            if entry is not None and entry.priority == (-fee_rate, -sequence):
+                self.remove(transaction_id)
+
+    def remove(self, transaction_id: str) -> Optional[Transaction]:
+        entry = self._entries.pop(transaction_id, None)
+        if entry is None:
+            return None
+        for tx_in in entry.transaction.tx_ins:
+            del self._spent[(tx_in.tx_out_digest, tx_in.tx_out_index)]
+        self.size_bytes -= entry.size
+        # Heap entries are dropped lazily, but not allowed to pile up.
+        if len(self._best) > 2 * len(self._entries) + 64:
+            self._best = [e for e in self._best if e[1] in self._entries]
+            heapq.heapify(self._best)
+            self._worst = [e for e in self._worst if e[1] in self._entries]
+            heapq.heapify(self._worst)
+        return entry.transaction
+
+    def remove_for_block(self, transactions: List[Transaction]):
+        """
+        Drop the transactions of a newly connected block and every pending
+        one that spends an output they spent.
+        """
+        for transaction in transactions:
+            self.remove(transaction.transaction_id)
+            for tx_in in transaction.tx_ins:
+                conflict = self._spent.get((tx_in.tx_out_digest, tx_in.tx_out_index))
+                if conflict is not None:
+                    self.remove(conflict)
+
+    def chain_changed(self, disconnected: List[Block], connected: List[Block]):
+        """
+        BlockChain listener. Drops what the connected blocks mined or spent.
+        After a reorg the transactions of the disconnected blocks come back
+        if they are still valid, and pending ones spending outputs that went
+        with those blocks are dropped.
+        """
+        for block in connected:
+            self.remove_for_block(block.transactions)
+        if not disconnected:
+            return
+        unspent_tx_outs = self.unspent_tx_outs
+        for entry in list(self._entries.values()):
+            if not all(
+                unspent_tx_outs.find_outpoint(tx_in.tx_out_digest, tx_in.tx_out_index)
+                for tx_in in entry.transaction.tx_ins
+            ):
+                self.remove(entry.transaction.transaction_id)
+        for block in disconnected:
+            for transaction in block.transactions:
+                if not is_coinbase_transaction(transaction):
+                    # Fails for those the new branch also mined.
+                    self.add(transaction)
+
+    def block_template(
+        self,
+        coinbase_address: str,
+        block_index: int,
+        max_transactions: Optional[int] = None
+    ) -> List[Transaction]:
+        """
+        The coinbase followed by pending transactions, best first, that still
+        spend unspent outputs. Pending transactions never share an outpoint,
+        so the template is conflict free. See BlockChain.mine_block, and
+        coin.merkle.MerkleTree for keeping its root while it grows.
+        """
+        template: List[Transaction] = [get_coinbase_transaction(coinbase_address, block_index)]
+        for priority, transaction_id in sorted(self._best):
+            if max_transactions is not None and len(template) - 1 >= max_transactions:
+                break
+            entry = self._entries.get(transaction_id)
+            if entry is None or entry.priority != priority:
+                continue
+            if all(
+                self.unspent_tx_outs.find_outpoint(tx_in.tx_out_digest, tx_in.tx_out_index)
+                for tx_in in entry.transaction.tx_ins
+            ):
+                template.append(entry.transaction)
+        return template
+
+    def get(self, transaction_id: str) -> Optional[Transaction]:
+        entry = self._entries.get(transaction_id)
+        return entry.transaction if entry else None
+
+    def __contains__(self, transaction_id: str) -> bool:
+        return transaction_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
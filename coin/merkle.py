@@ -0,0 +1,91 @@
+"""
+Merkle trees over transaction digests, which is how a block header commits to
+its transactions.
+
+Pairs are hashed with sha256(left + right), and a level with an odd number of
+nodes pairs its last node with itself. One leaf is its own root and no leaves
+give EMPTY_ROOT.
+"""
+from hashlib import sha256
+from typing import Iterable, List, Optional
+
+
+EMPTY_ROOT = bytes(32)
+
+
+def _hash_pair(left: bytes, right: bytes) -> bytes:
+    return sha256(left + right).digest()
+
+
+class MerkleTree:
+    """
+    Incremental Merkle tree. Only the roots of the complete subtrees built so
+    far are kept, one per level at most (like the bits of a counter), so
+    append is amortized O(1), root is O(log n) and nothing is rehashed when a
+    miner adds transactions to a block template.
+    """
+    def __init__(self, leaves: Iterable[bytes] = ()):
+        # _pending[level] is the root of a complete 2 ** level leaf subtree
+        # waiting for its right sibling.
+        self._pending: List[Optional[bytes]] = []
+        self._count: int = 0
+        self.extend(leaves)
+
+    def append(self, leaf: bytes):
+        node = leaf
+        level = 0
+        while level < len(self._pending) and self._pending[level] is not None:
+            node = _hash_pair(self._pending[level], node)
+            self._pending[level] = None
+            level += 1
+        if level == len(self._pending):
+            self._pending.append(node)
+        else:
+            self._pending[level] = node
+        self._count += 1
+
+    def extend(self, leaves: Iterable[bytes]):
+        for leaf in leaves:
+            self.append(leaf)
+
+    def root(self) -> bytes:
+        if not self._count:
+            return EMPTY_ROOT
+        top = self._count.bit_length() - 1
+        # The rightmost node of the current level, None below the lowest
+        # pending subtree.
+        node: Optional[bytes] = None
+        for level in range(top + 1):
+            pending = self._pending[level]
+            if node is None:
+                if pending is None:
+                    continue
+                if level == top:
+                    return pending
+                node = _hash_pair(pending, pending)
+            elif pending is None:
+                node = _hash_pair(node, node)
+            else:
+                node = _hash_pair(pending, node)
+        return node
+
+    def copy(self) -> "MerkleTree":
+        tree = MerkleTree()
+        tree._pending = list(self._pending)
+        tree._count = self._count
+        return tree
+
+    def __len__(self) -> int:
+        return self._count
+
+
+def merkle_root(leaves: Iterable[bytes]) -> bytes:
+    """Root of the tree over `leaves`, level by level."""
+    level: List[bytes] = list(leaves)
+    if not level:
+        return EMPTY_ROOT
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [_hash_pair(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+    return level[0]
@@ -0,0 +1,224 @@
+"""
+Runtime metrics for the hot paths: counters, gauges and latency histograms,
+rendered in the Prometheus text format (see render), plus a sampling
+profiler.
+
+Metrics are module level objects registered on creation, eg;
+
+    BLOCKS_VALIDATED = Counter("coin_blocks_validated_total", "Blocks validated.")
+    BLOCKS_VALIDATED.inc()
+
+They are on unless COIN_METRICS=0. When off every update is a single flag
+check, and the instrumented code only updates them per block, transaction
+batch, request or signature cache lookup, never per hash.
+"""
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import Counter as _StackCounter
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+# Latency buckets in seconds.
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.
+)
+PROFILE_INTERVAL = 0.005
+
+_enabled: bool = os.environ.get("COIN_METRICS", "1") != "0"
+REGISTRY: Dict[str, "_Metric"] = {}
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+class _Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str):
+        self.name: str = name
+        self.documentation: str = documentation
+        self._lock = threading.Lock()
+        REGISTRY[name] = self
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """The metric's lines in the text format, after HELP and TYPE."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(_Metric):
+    """Monotonic count, only ever increased with inc."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self.value: float = 0
+
+    def inc(self, amount: float = 1):
+        if _enabled:
+            with self._lock:
+                self.value += amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {_format(self.value)}"]
+
+
+class Gauge(_Metric):
+    """Current value, set directly or read from `function` at render time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation)
+        self.function: Optional[Callable[[], float]] = function
+        self.value: float = 0
+
+    def set(self, value: float):
+        if _enabled:
+            self.value = value
+
+    def samples(self) -> List[str]:
+        value = self.function() if self.function else self.value
+        return [f"{self.name} {_format(value)}"]
+
+
+class _Timer:
+    def __init__(self, histogram: "Histogram"):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets: List[float] = sorted(buckets)
+        self._counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.sum: float = 0.
+        self.count: int = 0
+
+    def observe(self, value: float):
+        if not _enabled:
+            return
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[position] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """Context manager observing the seconds spent in its block."""
+        return _Timer(self) if _enabled else _NULL_TIMER
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + [float("inf")], counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else _format(bound)
+            lines.append(f'{self.name}_bucket{{le="{le}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {_format(total)}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+
+def _format(value: float) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in REGISTRY.values()) + "\n"
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every other thread each `interval` seconds from a
+    background thread and counts them, ie; a statistical profile with no cost
+    to the profiled code beyond the GIL the sampler takes. collapsed() gives
+    the "frame;frame;frame count" lines flame graph tools read.
+    """
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval: float = interval
+        self.stacks: _StackCounter = _StackCounter()
+        self.samples: int = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own_thread = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "\n".join(
+            f"{stack} {count}" for stack, count in self.stacks.most_common()
+        ) + "\n"
+
+
+def profile(seconds: float, interval: float = PROFILE_INTERVAL) -> SamplingProfiler:
+    """Run a SamplingProfiler for `seconds` (blocking) and return it."""
+    profiler = SamplingProfiler(interval)
+    profiler.start()
+    time.sleep(seconds)
+    profiler.stop()
+    return profiler
@@ -0,0 +1,161 @@
+from hashlib import sha256
+import multiprocessing
+import struct
+from typing import Optional, Tuple
+
+
+# How many nonces are tried between checks of the stop event.
+STOP_CHECK_INTERVAL = 1024
+# Seconds between checks of the cancel event while pool workers search.
+CANCEL_POLL_INTERVAL = 0.1
+
+# The proof of work hashes this fixed size block header: index, previous
+# block hash, merkle root of the transactions, time and difficulty, with the
+# nonce last so everything before it can be hashed once per search.
+HEADER_PREFIX = struct.Struct("<Q32s32sdi")
+NONCE = struct.Struct("<Q")
+# Difficulty is a count of leading zero bits of a 256 bit digest.
+MAX_DIFFICULTY = 256
+
+# Set in each pool worker by _init_worker.
+_stop_event = None
+
+
+def header_prefix(
+    index: int,
+    previous_digest: bytes,
+    merkle_root: bytes,
+    time: float,
+    difficulty: int
+) -> bytes:
+    """The block header up to the nonce, see Block._calculate_digest."""
+    return HEADER_PREFIX.pack(index, previous_digest, merkle_root, time, difficulty)
+
+
+def is_valid_difficulty(difficulty: int) -> bool:
+    """
+    Difficulties are checked before anything is computed from them, the
+    work of a block grows exponentially with its difficulty.
+    """
+    return type(difficulty) == int and 0 <= difficulty <= MAX_DIFFICULTY
+
+
+def difficulty_target(difficulty: int) -> Optional[bytes]:
+    """
+    A digest satisfies `difficulty` (that many leading zero bits) exactly when
+    it is below 2**(256 - difficulty). The target is kept as 32 big-endian
+    bytes so raw digests can be compared to it without any conversion. None
+    means every digest is accepted, and no digest is below the target of a
+    difficulty past MAX_DIFFICULTY.
+    """
+    if difficulty <= 0:
+        return None
+    if difficulty > MAX_DIFFICULTY:
+        return bytes(32)
+    return (1 << (256 - difficulty)).to_bytes(32, "big")
+
+
+class MiningKernel:
+    """
+    Nonce search for a single block header. The header only commits to the
+    transactions through their merkle root, so an attempt costs the same
+    however many transactions the block has. The part of the header before
+    the nonce is hashed once and each attempt copies that sha256 state, adds
+    the nonce and compares the raw digest with the target, so no Block is
+    built until a valid nonce has been found.
+    """
+    def __init__(
+        self,
+        index: int,
+        merkle_root: bytes,
+        previous_digest: bytes,
+        difficulty: int,
+        time: float
+    ):
+        self.prefix: bytes = header_prefix(
+            index, previous_digest, merkle_root, time, difficulty
+        )
+        self.target: Optional[bytes] = difficulty_target(difficulty)
+
+    def search(self, start: int = 0, step: int = 1, stop_event=None) -> Optional[int]:
+        """
+        Try nonces start, start + step, ... and return the first valid one, or
+        None once `stop_event` is set.
+        """
+        if self.target is None:
+            return start
+        midstate = sha256(self.prefix)
+        pack_nonce = NONCE.pack
+        target = self.target
+        nonce = start
+        while True:
+            if stop_event is not None and stop_event.is_set():
+                return None
+            for nonce in range(nonce, nonce + STOP_CHECK_INTERVAL * step, step):
+                attempt = midstate.copy()
+                attempt.update(pack_nonce(nonce))
+                if attempt.digest() < target:
+                    return nonce
+            nonce += step
+
+
+def _init_worker(stop_event):
+    global _stop_event
+    _stop_event = stop_event
+
+
+def _search_nonces(
+    job: Tuple[int, bytes, bytes, int, float, int, int]
+) -> Optional[int]:
+    """Pool worker, see parallel_nonce_search."""
+    index, merkle_root, previous_digest, difficulty, time, start, step = job
+    kernel = MiningKernel(index, merkle_root, previous_digest, difficulty, time)
+    nonce = kernel.search(start, step, _stop_event)
+    if nonce is not None:
+        _stop_event.set()
+    return nonce
+
+
+def parallel_nonce_search(
+    index: int,
+    merkle_root: bytes,
+    previous_digest: bytes,
+    difficulty: int,
+    time: float,
+    workers: int,
+    cancel_event=None
+) -> Optional[int]:
+    """
+    Split the nonce space across `workers` processes, worker i trying nonces
+    i, i + workers, i + 2 * workers, ... Every worker stops as soon as one of
+    them finds a valid nonce, which is returned, or once `cancel_event` (a
+    threading.Event of the caller's) is set, in which case it is None.
+    """
+    assert workers > 0
+    stop_event = multiprocessing.Event()
+    jobs = [
+        (index, merkle_root, previous_digest, difficulty, time, start, workers)
+        for start in range(workers)
+    ]
+    pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(stop_event,))
+    try:
+        results = pool.imap_unordered(_search_nonces, jobs)
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            try:
+                nonce = results.next(timeout=CANCEL_POLL_INTERVAL)
+            except multiprocessing.TimeoutError:
+                continue
+            except StopIteration:
+                break
+            if nonce is not None:
+                return nonce
+    finally:
+        # Every worker returns once the event is set, so the pool winds down
+        # on its own. terminate() could kill a worker while it holds the
+        # result queue's lock and then hang waiting for the pool's threads.
+        stop_event.set()
+        pool.close()
+        pool.join()
+    raise RuntimeError("Nonce search finished without a result.")
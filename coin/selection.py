@@ -0,0 +1,163 @@
+"""
+Coin selection: which of a wallet's unspent outputs a new transaction
+spends. Every strategy takes the amount to pay and the wallet's outputs as
+an AmountIndex (sorted by amount) and returns the outputs to spend, raising
+ValueError when they don't add up to the amount.
+"""
+from typing import Callable, Dict, List, Optional
+
+from coin.transaction import AMOUNT_TOLERANCE, AmountIndex, UnspentTxOut
+
+
+CoinSelector = Callable[[float, AmountIndex], List[UnspentTxOut]]
+
+# Nodes of the search tree branch_and_bound visits before giving up.
+BNB_MAX_TRIES = 100_000
+# Largest outputs (no bigger than the amount) branch_and_bound searches over.
+BNB_MAX_CANDIDATES = 256
+# Most inputs a consolidating selection or transaction spends.
+CONSOLIDATION_MAX_INPUTS = 100
+
+
+def _insufficient_funds():
+    return ValueError("Insufficeint funds")
+
+
+def first_fit(amount: float, outputs: AmountIndex) -> List[UnspentTxOut]:
+    """Outputs in the order they were received until they cover the amount."""
+    selected: List[UnspentTxOut] = []
+    total = 0.
+    for u_tx_out in outputs:
+        selected.append(u_tx_out)
+        total += u_tx_out.amount
+        if total >= amount:
+            return selected
+    raise _insufficient_funds()
+
+
+def largest_first(amount: float, outputs: AmountIndex) -> List[UnspentTxOut]:
+    """
+    Largest outputs first, which covers the amount with as few inputs as any
+    selection can.
+    """
+    if outputs.total < amount - AMOUNT_TOLERANCE:
+        raise _insufficient_funds()
+    selected: List[UnspentTxOut] = []
+    total = 0.
+    for u_tx_out in outputs.largest():
+        selected.append(u_tx_out)
+        total += u_tx_out.amount
+        if total >= amount - AMOUNT_TOLERANCE:
+            return selected
+    raise _insufficient_funds()
+
+
+def branch_and_bound(
+    amount: float,
+    outputs: AmountIndex,
+    max_inputs: Optional[int] = None,
+    max_tries: int = BNB_MAX_TRIES
+) -> Optional[List[UnspentTxOut]]:
+    """
+    Fewest outputs (and no more than `max_inputs`) adding up to exactly the
+    amount, to AMOUNT_TOLERANCE, so the transaction needs no change output. A
+    depth first search over the BNB_MAX_CANDIDATES largest outputs no bigger
+    than the amount, including the larger one first and pruning branches
+    that overshoot, can no longer reach the amount or can't beat the best
+    match so far. Outputs of equal amount are interchangeable, so only the
+    first of them is ever left out. None when there is no such match or none
+    was found within `max_tries`.
+    """
+    candidates: List[UnspentTxOut] = []
+    for u_tx_out in outputs.at_most(amount + AMOUNT_TOLERANCE):
+        candidates.append(u_tx_out)
+        if len(candidates) == BNB_MAX_CANDIDATES:
+            break
+    # remaining[i] is what candidates[i:] add up to.
+    remaining = [0.] * (len(candidates) + 1)
+    for i in range(len(candidates) - 1, -1, -1):
+        remaining[i] = remaining[i + 1] + candidates[i].amount
+    if remaining[0] < amount - AMOUNT_TOLERANCE:
+        return None
+    # next_amount[i] is the first candidate after i worth less, leaving out
+    # one output means leaving out the ones of the same amount after it too.
+    next_amount = [len(candidates)] * len(candidates)
+    for i in range(len(candidates) - 2, -1, -1):
+        if candidates[i + 1].amount == candidates[i].amount:
+            next_amount[i] = next_amount[i + 1]
+        else:
+            next_amount[i] = i + 1
+
+    best = None
+    best_count = len(candidates) + 1 if max_inputs is None else max_inputs + 1
+    tries = 0
+    # (next candidate, total so far, how many are selected, the selected
+    # candidates as a linked list of (position, rest) pairs).
+    stack = [(0, 0., 0, None)]
+    while stack and tries < max_tries:
+        tries += 1
+        i, total, count, chosen = stack.pop()
+        if total >= amount - AMOUNT_TOLERANCE:
+            if total <= amount + AMOUNT_TOLERANCE and count < best_count:
+                best, best_count = chosen, count
+            continue
+        if (
+            i == len(candidates)
+            or count + 1 >= best_count
+            or total + remaining[i] < amount - AMOUNT_TOLERANCE
+            # Candidates only get smaller, so the inputs still allowed fall short.
+            or total + (best_count - 1 - count) * candidates[i].amount
+            < amount - AMOUNT_TOLERANCE
+        ):
+            continue
+        # Exclusion is pushed first so inclusion is searched first.
+        stack.append((next_amount[i], total, count, chosen))
+        stack.append((i + 1, total + candidates[i].amount, count + 1, (i, chosen)))
+    if best is None:
+        return None
+    selected: List[UnspentTxOut] = []
+    while best is not None:
+        selected.append(candidates[best[0]])
+        best = best[1]
+    return selected[::-1]
+
+
+def fewest_inputs(amount: float, outputs: AmountIndex) -> List[UnspentTxOut]:
+    """
+    The default. The smallest single output that covers the amount, else the
+    outputs largest_first would pick, unless branch_and_bound finds no more
+    of them adding up to exactly the amount, which saves the change output.
+    """
+    single = outputs.smallest_at_least(amount - AMOUNT_TOLERANCE)
+    if single is not None:
+        return [single]
+    selected = largest_first(amount, outputs)
+    exact = branch_and_bound(amount, outputs, max_inputs=len(selected))
+    return selected if exact is None else exact
+
+
+def consolidating(amount: float, outputs: AmountIndex) -> List[UnspentTxOut]:
+    """
+    Smallest outputs first, for when the network is quiet: the payment
+    sweeps up to CONSOLIDATION_MAX_INPUTS small outputs into its change so
+    later transactions need fewer inputs. Falls back to largest_first when
+    that many small outputs don't cover the amount.
+    """
+    selected: List[UnspentTxOut] = []
+    total = 0.
+    for u_tx_out in outputs.smallest():
+        if len(selected) == CONSOLIDATION_MAX_INPUTS:
+            break
+        selected.append(u_tx_out)
+        total += u_tx_out.amount
+        if total >= amount - AMOUNT_TOLERANCE:
+            return selected
+    return largest_first(amount, outputs)
+
+
+COIN_SELECTORS: Dict[str, CoinSelector] = {
+    "first_fit": first_fit,
+    "largest_first": largest_first,
+    "fewest_inputs": fewest_inputs,
+    "consolidating": consolidating,
+}
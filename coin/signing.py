@@ -0,0 +1,79 @@
+"""
+In process ECDSA (secp256k1) signing and verification. Kept apart from the
+wallet so coin.transaction can sign and verify inputs without importing it.
+"""
+import base64
+from functools import lru_cache
+from typing import Iterable, List
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from coin import metrics
+
+
+SIGNATURES_CREATED = metrics.Counter("coin_signatures_created_total", "ECDSA signatures made.")
+SIGNING_SECONDS = metrics.Histogram(
+    "coin_signing_seconds", "Time to sign each batch of transaction inputs."
+)
+
+
+class Signer:
+    """
+    In process ECDSA (secp256k1) signer. The private key is parsed once, and
+    signatures are DER encoded and base64'd, the same format as
+    `openssl dgst -sha1 -sign` piped through base64.
+    """
+    def __init__(self, private_key: str):
+        # private_key is the base64 body of the PEM, as returned by
+        # get_private_from_wallet.
+        self._key = serialization.load_der_private_key(
+            base64.b64decode(private_key), password=None
+        )
+        public_der: bytes = self._key.public_key().public_bytes(
+            serialization.Encoding.DER,
+            serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        # Same string as get_public_from_wallet, ie; our address.
+        self.public_key: str = base64.b64encode(public_der).decode()
+
+    def sign(self, data: str) -> str:
+        signature: bytes = self._key.sign(data.encode(), ec.ECDSA(hashes.SHA1()))
+        return base64.b64encode(signature).decode()
+
+    def sign_many(self, data: Iterable[str]) -> List[str]:
+        """Sign a batch, signing each distinct piece of data only once."""
+        signatures = {}
+        result = []
+        with SIGNING_SECONDS.time():
+            for d in data:
+                if d not in signatures:
+                    signatures[d] = self.sign(d)
+                result.append(signatures[d])
+        SIGNATURES_CREATED.inc(len(signatures))
+        return result
+
+
+@lru_cache(maxsize=8)
+def get_signer(private_key: str) -> Signer:
+    """Signers are cached so each key is only loaded once."""
+    return Signer(private_key)
+
+
+@lru_cache(maxsize=1024)
+def _load_public_key(address: str):
+    return serialization.load_der_public_key(base64.b64decode(address))
+
+
+def verify_signature(address: str, data: str, signature: str) -> bool:
+    """Check a signature made by Signer.sign against the signer's address."""
+    try:
+        _load_public_key(address).verify(
+            base64.b64decode(signature), data.encode(), ec.ECDSA(hashes.SHA1())
+        )
+    except (ValueError, TypeError, InvalidSignature):
+        # Also covers addresses that are not public keys and malformed
+        # base64 or DER.
+        return False
+    return True
@@ -0,0 +1,179 @@
+"""
+Snapshots of the unspent outputs at a block, so a restarting node loads its
+unspent outputs instead of replaying every transaction since genesis.
+
+A snapshot file is a fixed size header (height and hash of the block it was
+taken at, counts and the sha256 of the rest of the file), the table of
+distinct addresses, length prefixed, and then one fixed size record per
+output referring to its address by position. The records are unpacked in
+bulk straight out of a memory map.
+"""
+from hashlib import sha256
+import mmap
+import os
+import struct
+from typing import List, Optional, Tuple
+
+from coin import metrics
+from coin.transaction import UnspentTxOutSet
+
+
+SNAPSHOT_MAGIC = b"CSNP"
+SNAPSHOT_VERSION = 1
+# magic, version, height, block hash, addresses, outputs, sha256 of the body.
+SNAPSHOT_HEADER = struct.Struct("<4sIQ32sQQ32s")
+# tx_out_digest, tx_out_index, address position, amount.
+SNAPSHOT_RECORD = struct.Struct("<32sIId")
+_ADDRESS_LENGTH = struct.Struct("<I")
+
+SNAPSHOT_DIRECTORY = "snapshots"
+# Blocks between the snapshots a store backed chain writes.
+SNAPSHOT_INTERVAL = 1000
+# Snapshots kept, older ones are deleted as new ones are written.
+SNAPSHOTS_KEPT = 2
+
+SNAPSHOT_SECONDS = metrics.Histogram(
+    "coin_snapshot_write_seconds", "Time to write each unspent outputs snapshot."
+)
+SNAPSHOT_LOAD_SECONDS = metrics.Histogram(
+    "coin_snapshot_load_seconds", "Time to load an unspent outputs snapshot on startup."
+)
+
+
+def write_snapshot(
+    path: str,
+    height: int,
+    block_digest: bytes,
+    unspent_tx_outs: UnspentTxOutSet
+):
+    """Write the snapshot to `path`, replacing it only once it is complete."""
+    with SNAPSHOT_SECONDS.time():
+        positions = {}
+        addresses: List[bytes] = []
+        records: List[bytes] = []
+        pack_record = SNAPSHOT_RECORD.pack
+        for u_tx_out in unspent_tx_outs:
+            position = positions.get(u_tx_out.address)
+            if position is None:
+                position = positions[u_tx_out.address] = len(addresses)
+                raw = u_tx_out.address.encode()
+                addresses.append(_ADDRESS_LENGTH.pack(len(raw)) + raw)
+            records.append(pack_record(
+                u_tx_out.tx_out_digest, u_tx_out.tx_out_index, position, u_tx_out.amount
+            ))
+        body = b"".join(addresses) + b"".join(records)
+        header = SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC,
+            SNAPSHOT_VERSION,
+            height,
+            block_digest,
+            len(addresses),
+            len(records),
+            sha256(body).digest()
+        )
+        with open(path + ".tmp", "wb") as f:
+            f.write(header)
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+
+def read_snapshot_header(path: str) -> Tuple[int, bytes]:
+    """(height, block hash) of the snapshot, without reading the outputs."""
+    with open(path, "rb") as f:
+        header = f.read(SNAPSHOT_HEADER.size)
+    if len(header) != SNAPSHOT_HEADER.size:
+        raise ValueError(f"{path} is truncated.")
+    magic, version, height, block_digest = SNAPSHOT_HEADER.unpack(header)[:4]
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError(f"{path} is not a version {SNAPSHOT_VERSION} snapshot.")
+    return height, block_digest
+
+
+def read_snapshot(path: str) -> Tuple[int, bytes, UnspentTxOutSet]:
+    """
+    (height, block hash, unspent outputs) of the snapshot. Raises ValueError
+    when the file is not a snapshot or doesn't match its checksum.
+    """
+    with SNAPSHOT_LOAD_SECONDS.time(), open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < SNAPSHOT_HEADER.size:
+            raise ValueError(f"{path} is truncated.")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                return _read_mapped(path, view)
+            finally:
+                view.release()
+
+
+def _read_mapped(path: str, view: memoryview) -> Tuple[int, bytes, UnspentTxOutSet]:
+    (
+        magic, version, height, block_digest, address_count, record_count, checksum
+    ) = SNAPSHOT_HEADER.unpack_from(view)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError(f"{path} is not a version {SNAPSHOT_VERSION} snapshot.")
+    if sha256(view[SNAPSHOT_HEADER.size:]).digest() != checksum:
+        raise ValueError(f"{path} does not match its checksum.")
+    offset = SNAPSHOT_HEADER.size
+    addresses: List[str] = []
+    try:
+        for _ in range(address_count):
+            length, = _ADDRESS_LENGTH.unpack_from(view, offset)
+            offset += _ADDRESS_LENGTH.size
+            addresses.append(str(view[offset:offset + length], "utf-8"))
+            offset += length
+        # Released on the way out, the map can't be closed while a view of
+        # it is alive.
+        with view[offset:offset + record_count * SNAPSHOT_RECORD.size] as records:
+            if len(records) != record_count * SNAPSHOT_RECORD.size:
+                raise ValueError(f"{path} is truncated.")
+            unspent_tx_outs = UnspentTxOutSet.from_rows(
+                (tx_out_digest, tx_out_index, addresses[position], amount)
+                for tx_out_digest, tx_out_index, position, amount
+                in SNAPSHOT_RECORD.iter_unpack(records)
+            )
+    except (IndexError, struct.error) as e:
+        raise ValueError(f"{path} is truncated.") from e
+    return height, block_digest, unspent_tx_outs
+
+
+class SnapshotStore:
+    """Snapshot files in `directory`, named by height, the newest SNAPSHOTS_KEPT kept."""
+    def __init__(self, directory: str, kept: int = SNAPSHOTS_KEPT):
+        os.makedirs(directory, exist_ok=True)
+        self.directory: str = directory
+        self.kept: int = kept
+
+    def _path(self, height: int) -> str:
+        return os.path.join(self.directory, f"snapshot-{height:010d}.dat")
+
+    def heights(self) -> List[int]:
+        """Heights with a snapshot, newest first."""
+        return sorted(
+            (
+                int(name[len("snapshot-"):-len(".dat")])
+                for name in os.listdir(self.directory)
+                if name.startswith("snapshot-") and name.endswith(".dat")
+            ),
+            reverse=True
+        )
+
+    def write(self, height: int, block_digest: bytes, unspent_tx_outs: UnspentTxOutSet):
+        write_snapshot(self._path(height), height, block_digest, unspent_tx_outs)
+        for old in self.heights()[self.kept:]:
+            os.remove(self._path(old))
+
+    def header(self, height: int) -> Optional[Tuple[int, bytes]]:
+        try:
+            return read_snapshot_header(self._path(height))
+        except (OSError, ValueError):
+            return None
+
+    def load(self, height: int) -> Optional[Tuple[int, bytes, UnspentTxOutSet]]:
+        """The snapshot at `height`, None if it is missing or damaged."""
+        try:
+            return read_snapshot(self._path(height))
+        except (OSError, ValueError):
+            return None
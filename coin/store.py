@@ -0,0 +1,326 @@
+from collections import OrderedDict
+import mmap
+import os
+import struct
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from coin.block import Block, block_work
+from coin.codec import decode_block, decode_block_undo, encode_block, encode_block_undo
+from coin.transaction import BlockUndo
+
+
+INDEX_NAME = "index.dat"
+INDEX_MAGIC = b"CIDX"
+INDEX_VERSION = 4
+# magic, version, number of blocks.
+INDEX_HEADER = struct.Struct("<4sIQ")
+# segment, offset, length, block hash, cumulative work up to the block, block
+# time and difficulty.
+INDEX_ENTRY = struct.Struct("<IQI32s32sdi")
+INITIAL_INDEX_CAPACITY = 1024
+# Records in the segment files are prefixed with their length.
+RECORD_LENGTH = struct.Struct("<I")
+SEGMENT_SIZE = 64 * 1024 * 1024
+UNDO_DIRECTORY = "undo"
+# Blocks below the tip whose undo data is kept, ie; the deepest reorg that
+# doesn't need the unspent outputs rebuilt from genesis.
+UNDO_RETENTION = 1000
+
+
+def _segment_name(segment: int) -> str:
+    return f"blocks-{segment:05d}.dat"
+
+
+class BlockStore:
+    """
+    Disk backed, append only block storage.
+
+    Serialized blocks are appended to segment files (a new one is started
+    every SEGMENT_SIZE bytes). A memory mapped index holds one fixed size
+    entry per height with the block's segment, offset, hash, cumulative work,
+    time and difficulty, so opening the store and reading any block by height is O(1) no
+    matter how long the chain is. A block is synced to disk before the
+    index counts it; close (or flush) syncs the index.
+    """
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory: str = directory
+        self._readers: Dict[int, int] = {}
+        self._open_index()
+        self._recover_segments()
+
+    def _open_index(self):
+        path = os.path.join(self.directory, INDEX_NAME)
+        new_index = not os.path.isfile(path)
+        self._index_file = open(path, "a+b")
+        if new_index:
+            self._index_file.truncate(
+                INDEX_HEADER.size + INITIAL_INDEX_CAPACITY * INDEX_ENTRY.size
+            )
+        self._index = mmap.mmap(self._index_file.fileno(), 0)
+        if new_index:
+            INDEX_HEADER.pack_into(self._index, 0, INDEX_MAGIC, INDEX_VERSION, 0)
+        magic, version, self._length = INDEX_HEADER.unpack_from(self._index, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"{path} is not a version {INDEX_VERSION} block index.")
+        self._capacity: int = (len(self._index) - INDEX_HEADER.size) // INDEX_ENTRY.size
+
+    def _recover_segments(self):
+        """
+        Drop anything written after the last indexed block, ie; a block whose
+        append was interrupted before its index entry was written.
+        """
+        if self._length:
+            segment, offset, length = self._entry(self._length - 1)[:3]
+            end = offset + RECORD_LENGTH.size + length
+        else:
+            segment, end = 0, 0
+        path = os.path.join(self.directory, _segment_name(segment))
+        with open(path, "ab") as f:
+            f.truncate(end)
+        later = segment + 1
+        while os.path.isfile(os.path.join(self.directory, _segment_name(later))):
+            os.remove(os.path.join(self.directory, _segment_name(later)))
+            later += 1
+        self._segment: int = segment
+        self._writer = open(path, "ab")
+
+    def _entry(self, height: int):
+        return INDEX_ENTRY.unpack_from(
+            self._index, INDEX_HEADER.size + height * INDEX_ENTRY.size
+        )
+
+    def _set_length(self, length: int):
+        self._length = length
+        INDEX_HEADER.pack_into(self._index, 0, INDEX_MAGIC, INDEX_VERSION, length)
+
+    def _grow_index(self):
+        self._index.close()
+        self._capacity *= 2
+        self._index_file.truncate(INDEX_HEADER.size + self._capacity * INDEX_ENTRY.size)
+        self._index = mmap.mmap(self._index_file.fileno(), 0)
+
+    def _reader(self, segment: int) -> int:
+        if segment not in self._readers:
+            path = os.path.join(self.directory, _segment_name(segment))
+            self._readers[segment] = os.open(path, os.O_RDONLY)
+        return self._readers[segment]
+
+    def append(self, block: Block) -> int:
+        """Write the block at the next height and return that height."""
+        assert block.index == self._length
+        payload: bytes = encode_block(block)
+        if self._writer.tell() and self._writer.tell() + len(payload) > SEGMENT_SIZE:
+            self._writer.close()
+            self._segment += 1
+            self._writer = open(
+                os.path.join(self.directory, _segment_name(self._segment)), "ab"
+            )
+        offset: int = self._writer.tell()
+        self._writer.write(RECORD_LENGTH.pack(len(payload)) + payload)
+        # The block must be on disk before the index points at it.
+        self._writer.flush()
+        os.fsync(self._writer.fileno())
+        if self._length:
+            work = self.work_at(self._length - 1) + block_work(block.difficulty)
+        else:
+            work = 0
+        if self._length == self._capacity:
+            self._grow_index()
+        self._index[
+            INDEX_HEADER.size + self._length * INDEX_ENTRY.size:
+            INDEX_HEADER.size + (self._length + 1) * INDEX_ENTRY.size
+        ] = INDEX_ENTRY.pack(
+            self._segment,
+            offset,
+            len(payload),
+            block.hash_digest,
+            work.to_bytes(32, "big"),
+            block.time,
+            block.difficulty
+        )
+        self._set_length(self._length + 1)
+        return self._length - 1
+
+    def read_raw(self, height: int) -> bytes:
+        """The serialized block at `height`."""
+        segment, offset, length = self._entry(self._check_height(height))[:3]
+        return os.pread(self._reader(segment), length, offset + RECORD_LENGTH.size)
+
+    def read(self, height: int) -> Block:
+        return decode_block(self.read_raw(height))
+
+    def work_at(self, height: int) -> int:
+        """Cumulative work (see block_work) of the chain up to `height`."""
+        return int.from_bytes(self._entry(self._check_height(height))[4], "big")
+
+    def summaries(self) -> Iterator[Tuple[int, float, int]]:
+        """
+        (cumulative work, time, difficulty) of every block by height, straight
+        from the index. BlockChain.open builds its index from these.
+        """
+        for entry in INDEX_ENTRY.iter_unpack(
+            self._index[INDEX_HEADER.size:INDEX_HEADER.size + self._length * INDEX_ENTRY.size]
+        ):
+            yield int.from_bytes(entry[4], "big"), entry[5], entry[6]
+
+    def truncate(self, length: int):
+        """Drop every block from height `length` onwards."""
+        assert 0 < length <= self._length
+        if length == self._length:
+            return
+        self._set_length(length)
+        self._writer.close()
+        for fd in self._readers.values():
+            os.close(fd)
+        self._readers = {}
+        # Cuts the segments back to the new last block.
+        self._recover_segments()
+
+    def _check_height(self, height: int) -> int:
+        if not 0 <= height < self._length:
+            raise IndexError("BlockStore height out of range")
+        return height
+
+    def flush(self):
+        self._writer.flush()
+        os.fsync(self._writer.fileno())
+        self._index.flush()
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+        for fd in self._readers.values():
+            os.close(fd)
+        self._readers = {}
+        self._index.close()
+        self._index_file.close()
+
+    def __len__(self) -> int:
+        return self._length
+
+
+class StoredChain:
+    """
+    List like view of the blocks in a BlockStore, used as BlockChain.chain.
+    Blocks are read from disk on access and the most recently used ones are
+    kept in memory. Appending writes through to the store and deleting a
+    tail slice truncates it.
+    """
+    def __init__(self, store: BlockStore, cache_size: int = 1024):
+        self.store: BlockStore = store
+        self.cache_size: int = cache_size
+        self._cache: "OrderedDict[int, Block]" = OrderedDict()
+
+    def _get(self, height: int) -> Block:
+        block = self._cache.get(height)
+        if block is None:
+            block = self.store.read(height)
+            self._cache[height] = block
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(height)
+        return block
+
+    def __getitem__(self, item: Union[int, slice]):
+        if isinstance(item, slice):
+            return [self._get(height) for height in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("StoredChain index out of range")
+        return self._get(item)
+
+    def __delitem__(self, item: slice):
+        start, stop, step = item.indices(len(self))
+        # Only the tail can go, the store is append only.
+        assert stop == len(self) and step == 1
+        self.store.truncate(start)
+        for height in [h for h in self._cache if h >= start]:
+            del self._cache[height]
+
+    def append(self, block: Block):
+        self.store.append(block)
+
+    def extend(self, blocks: Iterable[Block]):
+        for block in blocks:
+            self.append(block)
+
+    def close(self):
+        self.store.close()
+
+    def __iter__(self) -> Iterator[Block]:
+        for height in range(len(self)):
+            yield self._get(height)
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+
+class UndoJournal:
+    """
+    Undo data (see UnspentTxOutSet.apply_transactions) of the latest
+    `retention` blocks by height, each with the hash of its block so an entry
+    left behind by a replaced block is never used. Kept in memory, or with a
+    `directory` as one file per height there, written whole and renamed into
+    place so a crash never leaves half an entry.
+    """
+    def __init__(self, directory: Optional[str] = None, retention: int = UNDO_RETENTION):
+        self.directory: Optional[str] = directory
+        self.retention: int = retention
+        self._entries: Dict[int, Tuple[bytes, BlockUndo]] = {}
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, height: int) -> str:
+        return os.path.join(self.directory, f"undo-{height:010d}.dat")
+
+    def record(self, height: int, block_digest: bytes, undo: BlockUndo):
+        """Keep `undo` for the block at `height`, dropping what is now too old."""
+        if self.directory is None:
+            self._entries[height] = (block_digest, undo)
+        else:
+            path = self._path(height)
+            with open(path + ".tmp", "wb") as f:
+                f.write(encode_block_undo(block_digest, undo))
+            os.replace(path + ".tmp", path)
+        self.discard(height - self.retention)
+
+    def get(self, height: int, block_digest: bytes) -> Optional[BlockUndo]:
+        """Undo data of the block at `height` if kept and it is that block's."""
+        if self.directory is None:
+            entry = self._entries.get(height)
+        else:
+            try:
+                with open(self._path(height), "rb") as f:
+                    entry = decode_block_undo(f.read())
+            except (FileNotFoundError, ValueError):
+                entry = None
+        if entry is None or entry[0] != block_digest:
+            return None
+        return entry[1]
+
+    def discard(self, height: int):
+        if self.directory is None:
+            self._entries.pop(height, None)
+            return
+        try:
+            os.remove(self._path(height))
+        except FileNotFoundError:
+            pass
+
+    def truncate(self, length: int):
+        """Discard everything from height `length` onwards."""
+        for height in self._heights():
+            if height >= length:
+                self.discard(height)
+
+    def _heights(self) -> List[int]:
+        if self.directory is None:
+            return list(self._entries)
+        return [
+            int(name[len("undo-"):-len(".dat")])
+            for name in os.listdir(self.directory)
+            if name.startswith("undo-") and name.endswith(".dat")
+        ]
@@ -0,0 +1,223 @@
+"""
+Headers first delta sync between two peers.
+
+Both sides open by announcing their tip: height, hash and cumulative
+difficulty. A side that sees more work on the other end sends a locator of
+its own block hashes and gets back the headers after the fork point. Once
+those link up and carry more work than its own blocks after the fork point,
+it fetches only the missing blocks, in batches, and connects them as they
+arrive instead of swapping in a whole new chain. Each side sends "done" when
+it has nothing left to ask for, and the session ends once both have.
+
+Control messages are JSON text frames, blocks travel as binary block lists
+(see coin.codec).
+"""
+import asyncio
+from concurrent.futures import Executor
+import json
+from typing import List, Optional, Tuple, Union
+
+from coin import codec
+from coin.block import Block, BlockChain, block_work
+
+
+MAX_HEADERS = 2000
+BLOCK_BATCH = 500
+
+
+class LocalNode:
+    """
+    What a sync session needs from the chain it syncs. Other nodes (eg; one
+    reached over HTTP) just need the same methods.
+    """
+    def __init__(self, block_chain: BlockChain):
+        self.block_chain: BlockChain = block_chain
+
+    def tip(self) -> dict:
+        latest_block = self.block_chain.latest_block
+        return {
+            "height": latest_block.index,
+            "hash": latest_block.hashed_data,
+            "cumulative_difficulty": self.block_chain.cummulative_difficulty,
+        }
+
+    def locator(self) -> List[Tuple[int, str]]:
+        return self.block_chain.get_locator()
+
+    def headers(self, locator: List[Tuple[int, str]], count: int) -> dict:
+        fork_point = self.block_chain.find_locator_fork(locator)
+        headers = []
+        if fork_point >= 0:
+            headers = self.block_chain.get_headers(fork_point + 1, min(count, MAX_HEADERS))
+        return {"fork_point": fork_point, "headers": headers}
+
+    def blocks(self, start: int, count: int) -> bytes:
+        stop = min(start + min(count, BLOCK_BATCH), self.block_chain.length)
+        return codec.encode_block_list(self.block_chain.chain[start:stop])
+
+    def work_after(self, height: int) -> int:
+        return self.block_chain.work_after(height)
+
+    def connect(self, fork_point: int, blocks: List[Block]) -> Optional[str]:
+        return self.block_chain.connect_blocks(fork_point, blocks)
+
+
+class SyncSession:
+    """
+    One sync conversation over a websocket like object (send/recv). When an
+    `executor` is given every call to the node runs on it, the executor
+    changing the chain, so reading blocks never races with a reorg and
+    validating them does not stall the event loop.
+    """
+    def __init__(self, node, websocket, executor: Optional[Executor] = None):
+        self.node = node
+        self.websocket = websocket
+        self.executor: Optional[Executor] = executor
+        self._done_sent: bool = False
+        self._done_received: bool = False
+        self._locator: dict = {}
+        self._fork_point: int = -1
+        self._headers: List[dict] = []
+        self._headers_full: bool = False
+        self._requested: List[dict] = []
+        self._pending: List[Block] = []
+        # Number of blocks connected, for callers that want to react.
+        self.connected: int = 0
+
+    async def run(self, first_message: Optional[Union[str, bytes]] = None):
+        """
+        `first_message` is for a session the peer started, ie; its tip was
+        already read off the socket.
+        """
+        await self._send({"type": "tip", **await self._call(self.node.tip)})
+        if first_message is not None:
+            await self._handle(first_message)
+        while not (self._done_sent and self._done_received):
+            await self._handle(await self.websocket.recv())
+
+    async def _handle(self, message: Union[str, bytes]):
+        if isinstance(message, bytes):
+            await self._on_blocks(message)
+            return
+        request = json.loads(message)
+        handler = getattr(self, "_on_" + str(request.get("type")), None)
+        if handler is None:
+            # Nothing sensible to say to a peer we don't understand.
+            self._done_received = True
+            await self._done()
+            return
+        await handler(request)
+
+    async def _call(self, function, *args):
+        if self.executor is None:
+            return function(*args)
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, function, *args
+        )
+
+    async def _send(self, message: dict):
+        await self.websocket.send(json.dumps(message))
+
+    async def _done(self):
+        if not self._done_sent:
+            self._done_sent = True
+            self._pending = []
+            await self._send({"type": "done"})
+
+    async def _request_headers(self, locator: List[Tuple[int, str]]):
+        self._locator = dict(locator)
+        await self._send({"type": "get_headers", "locator": locator, "count": MAX_HEADERS})
+
+    # Requests from the peer.
+
+    async def _on_get_headers(self, request: dict):
+        locator = [(height, hashed_data) for height, hashed_data in request["locator"]]
+        headers = await self._call(self.node.headers, locator, request["count"])
+        await self._send({"type": "headers", **headers})
+
+    async def _on_get_blocks(self, request: dict):
+        await self.websocket.send(
+            await self._call(self.node.blocks, request["from"], request["count"])
+        )
+
+    async def _on_done(self, request: dict):
+        self._done_received = True
+
+    # Our side of the sync.
+
+    async def _on_tip(self, request: dict):
+        tip = await self._call(self.node.tip)
+        if request["cumulative_difficulty"] > tip["cumulative_difficulty"]:
+            await self._request_headers(await self._call(self.node.locator))
+        else:
+            await self._done()
+
+    async def _on_headers(self, response: dict):
+        fork_point: int = response["fork_point"]
+        headers: List[dict] = response["headers"]
+        if fork_point not in self._locator or not headers:
+            await self._done()
+            return
+        previous_hash = self._locator[fork_point]
+        for height, header in enumerate(headers, fork_point + 1):
+            # Headers commit to everything in the block, so their proof of
+            # work can be checked without it. Blocks are fully validated
+            # when they are connected.
+            if (
+                header["index"] != height
+                or header["previous_hash"] != previous_hash
+                or Block.header_digest(header).hex() != header["hashed_data"]
+                or not BlockChain.hash_matches_difficulty(
+                    header["hashed_data"], header["difficulty"]
+                )
+            ):
+                await self._done()
+                return
+            previous_hash = header["hashed_data"]
+        if not self._pending:
+            self._fork_point = fork_point
+        self._headers = headers
+        self._headers_full = len(headers) >= MAX_HEADERS
+        await self._request_blocks()
+
+    async def _request_blocks(self):
+        if self._headers:
+            self._requested = self._headers[:BLOCK_BATCH]
+            self._headers = self._headers[BLOCK_BATCH:]
+            await self._send({
+                "type": "get_blocks",
+                "from": self._requested[0]["index"],
+                "count": len(self._requested),
+            })
+        elif self._headers_full:
+            # The peer has more, continue from the last header we got.
+            last = self._requested[-1]
+            await self._request_headers(
+                [(last["index"], last["hashed_data"])] + await self._call(self.node.locator)
+            )
+        else:
+            await self._done()
+
+    async def _on_blocks(self, message: bytes):
+        try:
+            blocks: List[Block] = codec.decode_block_list(message)
+        except ValueError:
+            await self._done()
+            return
+        expected = [header["hashed_data"] for header in self._requested]
+        if [block.hashed_data for block in blocks] != expected:
+            await self._done()
+            return
+        self._pending += blocks
+        # Blocks extending our tip are connected batch by batch. For a fork
+        # below it we wait until the branch outweighs what it replaces.
+        pending_work = sum(block_work(block.difficulty) for block in self._pending)
+        if pending_work > await self._call(self.node.work_after, self._fork_point):
+            error = await self._call(self.node.connect, self._fork_point, self._pending)
+            if error:
+                await self._done()
+                return
+            self.connected += len(self._pending)
+            self._fork_point += len(self._pending)
+            self._pending = []
+        await self._request_blocks()
@@ -0,0 +1,75 @@
+from typing import Callable, List
+
+import pytest
+
+from coin.block import Block, BlockChain
+from coin.mining import MiningKernel
+from coin.transaction import Transaction, get_coinbase_transaction
+from coin.signing import get_signer
+from coin.wallet import private_key_from_seed
+
+
+# Milliseconds, well in the past so every timestamp is valid.
+CHAIN_START_TIME = 1_600_000_000_000.
+
+
+def make_block(block_chain: BlockChain, transactions: List[Transaction]) -> Block:
+    """
+    The block of `transactions` following the chain's tip, not appended. Blocks
+    are spaced block_generation_interval apart so the difficulty never
+    retargets.
+    """
+    previous = block_chain.latest_block
+    index = previous.index + 1
+    block_time = CHAIN_START_TIME + index * block_chain.block_generation_interval
+    difficulty = block_chain.get_difficulty()
+    block = Block(index, transactions, previous.hashed_data, difficulty, 0, time=block_time)
+    block.nonce = MiningKernel(
+        index, block.merkle_root, previous.hash_digest, difficulty, block_time
+    ).search()
+    block.hash_digest = block._calculate_digest()
+    return block
+
+
+def add_blocks(block_chain: BlockChain, count: int, address: str = "miner") -> List[Block]:
+    """Append `count` blocks holding just a coinbase to `address`."""
+    blocks = []
+    for _ in range(count):
+        block = make_block(block_chain, [get_coinbase_transaction(address, block_chain.length)])
+        error = block_chain.add_block(block)
+        assert error is None, error
+        blocks.append(block)
+    return blocks
+
+
+@pytest.fixture(scope="session")
+def private_key() -> str:
+    return private_key_from_seed(1)
+
+
+@pytest.fixture(scope="session")
+def address(private_key: str) -> str:
+    return get_signer(private_key).public_key
+
+
+@pytest.fixture(scope="session")
+def other_private_key() -> str:
+    return private_key_from_seed(2)
+
+
+@pytest.fixture
+def next_block() -> Callable[[BlockChain, List[Transaction]], Block]:
+    return make_block
+
+
+@pytest.fixture
+def grow() -> Callable[..., List[Block]]:
+    return add_blocks
+
+
+@pytest.fixture
+def funded_chain(address: str) -> BlockChain:
+    """Genesis and three blocks whose coinbases pay `address`."""
+    block_chain = BlockChain()
+    add_blocks(block_chain, 3, address)
+    return block_chain
@@ -0,0 +1,230 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import importlib
+import json
+import os
+import threading
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+import pytest
+
+from coin import codec
+from coin.block import BlockChain
+from coin.mempool import Mempool
+from coin.sync import LocalNode
+from coin.wallet import create_transaction
+
+
+API_DIRECTORY = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "api")
+BINARY = {"Accept": codec.MIME_TYPE}
+
+
+@pytest.fixture
+def api(monkeypatch, grow, address):
+    """The api module serving a fresh chain of a few blocks paying `address`."""
+    monkeypatch.syspath_prepend(API_DIRECTORY)
+    api = importlib.import_module("api")
+    block_chain = BlockChain()
+    grow(block_chain, 3, address)
+    monkeypatch.setattr(api, "block_chain", block_chain)
+    monkeypatch.setattr(api, "block_cache", api.BlockCache(api.BLOCK_CACHE_SIZE))
+    return api
+
+
+@pytest.fixture
+def node_app(api, monkeypatch) -> web.Application:
+    """
+    The whole node (make_app) wired up as api.py does, with its own executor
+    and jobs so each test can start and stop one.
+    """
+    block_chain = api.block_chain
+    chain_executor = ThreadPoolExecutor(max_workers=1)
+    mempool = Mempool(block_chain)
+    block_chain.listeners.append(mempool.chain_changed)
+    node = LocalNode(block_chain)
+    peers = api.PeerPool(node, executor=chain_executor)
+    mining_jobs = api.MiningJobs(block_chain, chain_executor)
+    mining_jobs.listeners.append(lambda block: peers.announce())
+    peers.listeners.append(lambda connection: mining_jobs.tip_changed())
+    for name, value in [
+        ("chain_executor", chain_executor),
+        ("mempool", mempool),
+        ("node", node),
+        ("peers", peers),
+        ("mining_jobs", mining_jobs),
+        ("PEERS", []),
+    ]:
+        monkeypatch.setattr(api, name, value)
+    return api.make_app()
+
+
+def serve(app: web.Application, scenario):
+    """Run `scenario` with a client of `app`."""
+    async def run():
+        async with TestClient(TestServer(app)) as client:
+            await scenario(client)
+    asyncio.run(run())
+
+
+def routes_app(api) -> web.Application:
+    """The routes only, without starting mining or peers."""
+    app = web.Application()
+    app.add_routes(api.routes)
+    return app
+
+
+def test_whole_chain_in_either_format(api):
+    async def scenario(client):
+        response = await client.get("/blocks")
+        assert response.status == 200
+        assert json.loads(await response.read()) == api.block_chain.to_dict()
+        response = await client.get("/blocks", headers=BINARY)
+        assert response.content_type == codec.MIME_TYPE
+        decoded = codec.decode_block_chain(await response.read())
+        assert decoded.latest_block.hash_digest == api.block_chain.latest_block.hash_digest
+    serve(routes_app(api), scenario)
+
+
+def test_block_ranges(api):
+    blocks = [block.to_dict() for block in api.block_chain.chain]
+
+    async def scenario(client):
+        response = await client.get("/blocks", params={"from": 1, "to": 2})
+        assert await response.json() == blocks[1:3]
+        response = await client.get("/blocks", params={"from": 2})
+        assert await response.json() == blocks[2:]
+        response = await client.get("/blocks", params={"to": 1}, headers=BINARY)
+        decoded = codec.decode_block_list(await response.read())
+        assert [block.to_dict() for block in decoded] == blocks[:2]
+        for params in ({"from": 3, "to": 1}, {"from": -1}, {"from": "one"}):
+            assert (await client.get("/blocks", params=params)).status == 400
+    serve(routes_app(api), scenario)
+
+
+def test_etags_follow_the_tip(api, grow):
+    async def scenario(client):
+        response = await client.get("/blocks", params={"from": 1})
+        etag = response.headers["ETag"]
+        response = await client.get(
+            "/blocks", params={"from": 1}, headers={"If-None-Match": etag}
+        )
+        assert response.status == 304
+        binary = await client.get(
+            "/blocks", params={"from": 1}, headers={**BINARY, "If-None-Match": etag}
+        )
+        assert binary.status == 200
+        assert binary.headers["ETag"] != etag
+        grow(api.block_chain, 1)
+        response = await client.get(
+            "/blocks", params={"from": 1}, headers={"If-None-Match": etag}
+        )
+        assert response.status == 200
+        assert len(await response.json()) == 4
+    serve(routes_app(api), scenario)
+
+
+def test_single_blocks(api):
+    latest_block = api.block_chain.latest_block
+
+    async def scenario(client):
+        response = await client.get("/blocks/latest", headers=BINARY)
+        assert codec.decode_block(await response.read()).to_dict() == latest_block.to_dict()
+        etag = response.headers["ETag"]
+        response = await client.get(
+            "/blocks/latest", headers={**BINARY, "If-None-Match": etag}
+        )
+        assert response.status == 304
+        response = await client.get("/blocks/1")
+        assert await response.json() == api.block_chain.chain[1].to_dict()
+        assert (await client.get("/blocks/99")).status == 404
+    serve(routes_app(api), scenario)
+
+
+async def finished_job(client, job: dict) -> dict:
+    for _ in range(200):
+        job = await (await client.get(f"/jobs/{job['job_id']}")).json()
+        if job["status"] in ("done", "failed"):
+            return job
+        await asyncio.sleep(.05)
+    raise AssertionError(f"Job {job['job_id']} never finished.")
+
+
+def test_node_mines_submitted_transactions(api, node_app, private_key, address):
+    payment = create_transaction("receiver", 20., private_key, api.block_chain.unspent_tx_outs)
+
+    async def scenario(client):
+        body = {"transactions": [payment.to_dict()]}
+        response = await client.post("/transactions", json=body)
+        assert response.status == 201
+        assert (await response.json())["transaction_ids"] == [payment.transaction_id]
+        response = await client.post("/transactions", json=body)
+        assert response.status == 400
+        response = await client.post("/make_blocks", json={"coinbase_address": "miner"})
+        assert response.status == 202
+        job = await finished_job(client, await response.json())
+        assert (job["status"], job["height"]) == ("done", 4)
+        tip = await (await client.get("/tip")).json()
+        assert tip["height"] == 4
+        latest_block = await (await client.get("/blocks/latest")).json()
+        assert [t["transaction_id"] for t in latest_block["transactions"]][1:] == [payment.transaction_id]
+    serve(node_app, scenario)
+    assert api.block_chain.unspent_tx_outs.balance("receiver") == 20.
+    assert len(api.mempool) == 0
+
+
+def test_node_rejects_bad_requests_and_serves_metrics(api, node_app):
+    async def scenario(client):
+        assert (await client.post("/make_blocks", data="x")).status == 400
+        assert (await client.post("/make_blocks", json={"coinbase_address": 1})).status == 400
+        response = await client.post("/make_blocks", json={"transactions": []})
+        job = await finished_job(client, await response.json())
+        assert job["status"] == "done"
+        assert (await client.get("/jobs/unknown")).status == 404
+        text = await (await client.get("/metrics")).text()
+        assert "coin_chain_height 4" in text
+    serve(node_app, scenario)
+
+
+def test_replace_chain_rejects_out_of_range_difficulty(api):
+    data = api.block_chain.to_dict()
+    data["chain"][-1]["difficulty"] = 2 ** 31 - 1
+
+    async def scenario(client):
+        response = await client.post("/replace_chain", json=data)
+        assert response.status == 400
+        # Rejected while loading, not by replace_chain.
+        assert await response.text() == "400: Bad Request"
+        assert api.block_chain.length == 4
+    serve(routes_app(api), scenario)
+
+
+def test_reorg_cuts_a_streamed_response_short(api, grow, monkeypatch):
+    """A response never mixes blocks of two branches."""
+    monkeypatch.setattr(api, "STREAM_CHUNK_SIZE", 1)
+    fork = BlockChain()
+    for block in api.block_chain.chain[1:2]:
+        assert fork.add_block(block) is None
+    grow(fork, 4, "fork")
+    serialize_blocks = api.serialize_blocks
+    threads = set()
+
+    def reorg_after_first_chunk(start, stop, binary, last_digest):
+        threads.add(threading.current_thread())
+        chunk = serialize_blocks(start, stop, binary, last_digest)
+        if api.block_chain.length == 4:
+            assert api.block_chain.connect_blocks(1, fork.chain[2:]) is None
+        return chunk
+    monkeypatch.setattr(api, "serialize_blocks", reorg_after_first_chunk)
+
+    async def scenario(client):
+        response = await client.get("/blocks")
+        assert response.status == 200
+        with pytest.raises(aiohttp.ClientPayloadError):
+            await response.read()
+        response = await client.get("/blocks")
+        assert json.loads(await response.read()) == api.block_chain.to_dict()
+    serve(routes_app(api), scenario)
+    assert api.block_chain.latest_block.hash_digest == fork.latest_block.hash_digest
+    assert threading.main_thread() not in threads
@@ -0,0 +1,52 @@
+from itertools import count, islice
+
+import pytest
+
+from coin.transaction import get_coinbase_transaction, validate_transactions
+from coin.wallet import create_batch_transactions, stream_batch_transactions
+
+
+def _paid(transactions):
+    return [
+        (tx_out.address, tx_out.amount)
+        for transaction in transactions
+        for tx_out in transaction.tx_outs
+    ]
+
+
+def test_batch_pays_everyone_in_one_block(funded_chain, private_key, address, next_block):
+    payments = [(f"receiver-{i}", 1.5) for i in range(30)]
+    transactions = create_batch_transactions(
+        payments, private_key, funded_chain.unspent_tx_outs, max_outputs=20
+    )
+    assert [len(t.tx_outs) for t in transactions] == [21, 11]
+    paid = _paid(transactions)
+    assert [p for p in paid if p[0] != address] == payments
+    assert [amount for receiver, amount in paid if receiver == address] == [20., 35.]
+    assert validate_transactions(transactions, funded_chain.unspent_tx_outs, cache=None) is None
+    coinbase = get_coinbase_transaction("miner", funded_chain.length)
+    assert funded_chain.add_block(next_block(funded_chain, [coinbase] + transactions)) is None
+    assert funded_chain.unspent_tx_outs.balance("receiver-29") == 1.5
+    assert funded_chain.unspent_tx_outs.balance(address) == 105.
+
+
+def test_batch_needs_funds_for_every_payment(funded_chain, private_key):
+    payments = [("receiver", 40.)] * 4
+    with pytest.raises(ValueError):
+        create_batch_transactions(
+            payments, private_key, funded_chain.unspent_tx_outs, max_outputs=1
+        )
+
+
+def test_streamed_transactions_never_share_an_output(funded_chain, private_key):
+    payments = ((f"receiver-{i}", 10.) for i in count())
+    stream = stream_batch_transactions(
+        payments, private_key, funded_chain.unspent_tx_outs, max_outputs=2
+    )
+    transactions = list(islice(stream, 3))
+    outpoints = [(i.tx_out_id, i.tx_out_index) for t in transactions for i in t.tx_ins]
+    assert len(set(outpoints)) == len(outpoints) == 3
+    assert validate_transactions(transactions, funded_chain.unspent_tx_outs, cache=None) is None
+    # Each coinbase pays two of them, the stream has nothing left for more.
+    with pytest.raises(ValueError):
+        next(stream)
@@ -0,0 +1,54 @@
+import importlib
+import os
+
+import pytest
+
+
+BENCHMARKS_DIRECTORY = os.path.join(
+    os.path.dirname(__file__), os.pardir, os.pardir, "benchmarks"
+)
+
+
+@pytest.fixture
+def bench(monkeypatch):
+    monkeypatch.syspath_prepend(BENCHMARKS_DIRECTORY)
+    return importlib.import_module("run")
+
+
+def _report(bench, *results):
+    return {"results": [bench.result(name, seconds, 100, size=1) for name, seconds in results]}
+
+
+def test_compare_flags_slowdowns_past_the_tolerance(bench):
+    baseline = _report(bench, ("a", 1.), ("b", 1.), ("c", 1.), ("d", 0.))
+    report = _report(bench, ("a", 2.), ("b", 1.05), ("c", 0.), ("d", 1.), ("e", 1.))
+    assert bench.compare(report, baseline, .1) == ["a"]
+    changes = {r["name"]: r["change"] for r in report["results"]}
+    assert changes["a"] == pytest.approx(-.5)
+    assert changes["b"] == pytest.approx(1 / 1.05 - 1)
+    # Untimed on either side, or not in the baseline.
+    assert changes["c"] is changes["d"] is changes["e"] is None
+
+
+def test_compare_skips_benchmarks_run_with_other_params(bench):
+    baseline = {"results": [bench.result("a", 1., 100, size=1)]}
+    report = {"results": [bench.result("a", 10., 100, size=2)]}
+    assert bench.compare(report, baseline, .1) == []
+    assert report["results"][0]["change"] is None
+
+
+def test_report_prints_untimed_results(bench, capsys):
+    report = _report(bench, ("a", 2.), ("c", 0.))
+    bench.compare(report, _report(bench, ("a", 1.), ("c", 1.)), .1)
+    bench.print_report(report, ["a"])
+    lines = capsys.readouterr().out.splitlines()
+    assert "REGRESSION" in lines[1] and "-50.0%" in lines[1]
+    assert lines[2].split() == ["c", "0.0000"]
+
+
+def test_runs_do_the_same_work(bench):
+    first = bench.make_valid_chain(5)
+    assert [b.hash_digest for b in bench.make_valid_chain(5).chain] == [
+        b.hash_digest for b in first.chain
+    ]
+    assert bench.bench_mining(True)[0]["operations"] == bench.bench_mining(True)[0]["operations"]
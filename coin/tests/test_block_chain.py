@@ -0,0 +1,132 @@
+from typing import List
+
+import pytest
+
+from coin import codec
+from coin.block import Block, BlockChain, block_work
+from coin.mining import MAX_DIFFICULTY
+
+
+def _copy(block_chain: BlockChain) -> BlockChain:
+    """A chain holding the same blocks as `block_chain`."""
+    copy = BlockChain()
+    for block in block_chain.chain[1:]:
+        assert copy.add_block(block) is None
+    return copy
+
+
+def _unspent(block_chain: BlockChain):
+    return sorted(tuple(u.to_dict().values()) for u in block_chain.unspent_tx_outs)
+
+
+def test_find_fork_point(grow):
+    ours = BlockChain()
+    grow(ours, 3)
+    theirs = _copy(ours)
+    grow(theirs, 2, "them")
+    assert ours.find_fork_point(theirs.chain) == 3
+    grow(ours, 1, "us")
+    assert ours.find_fork_point(theirs.chain) == 3
+    assert ours.find_fork_point(theirs.chain[:2]) == 1
+    other_genesis = Block(0, [], None, 5, 1)
+    assert ours.find_fork_point([other_genesis] + theirs.chain[1:]) == -1
+
+
+def test_replace_chain_only_validates_the_new_suffix(grow, monkeypatch):
+    ours = BlockChain()
+    grow(ours, 3)
+    theirs = _copy(ours)
+    grow(theirs, 3, "them")
+    validated: List[int] = []
+    validate_block = BlockChain._validate_block
+
+    def record(self, new_block, previous_block, difficulty):
+        validated.append(new_block.index)
+        return validate_block(self, new_block, previous_block, difficulty)
+    monkeypatch.setattr(BlockChain, "_validate_block", record)
+    assert ours.replace_chain(theirs.chain) is None
+    assert validated == [4, 5, 6]
+    assert ours.latest_block is theirs.latest_block
+    assert _unspent(ours) == _unspent(theirs)
+
+
+def test_invalid_suffix_is_rejected(grow):
+    ours = BlockChain()
+    grow(ours, 2)
+    theirs = _copy(ours)
+    grow(theirs, 2, "them")
+    theirs.chain[-1].nonce += 1
+    before = (ours.length, ours.latest_block, _unspent(ours))
+    assert "hash does not match" in ours.replace_chain(theirs.chain)
+    assert (ours.length, ours.latest_block, _unspent(ours)) == before
+
+
+def test_chain_without_more_work_is_rejected(grow):
+    ours = BlockChain()
+    grow(ours, 2)
+    theirs = _copy(ours)
+    grow(ours, 2, "us")
+    grow(theirs, 1, "them")
+    assert ours.replace_chain(theirs.chain) == "Blocks do not add work to the chain."
+    assert ours.replace_chain([Block(0, [], None, 5, 1)]) == "Genesis block does not match."
+
+
+def test_work_index_is_a_prefix_sum(grow):
+    block_chain = BlockChain()
+    grow(block_chain, 4)
+    works = [block_work(block.difficulty) for block in block_chain.chain]
+    assert [block_chain.work_at(h) for h in range(5)] == [
+        sum(works[1:h + 1]) for h in range(5)
+    ]
+    assert block_chain.work_after(1) == sum(works[2:])
+    assert block_chain.cummulative_difficulty == block_chain.work_at(4)
+    rebuilt = BlockChain(json=block_chain.to_dict())
+    assert [rebuilt.work_at(h) for h in range(5)] == [block_chain.work_at(h) for h in range(5)]
+    block_chain.reindex()
+    assert block_chain.work_after(0) == sum(works[1:])
+
+
+def test_fork_choice_follows_work(grow):
+    ours = BlockChain()
+    grow(ours, 2)
+    theirs = _copy(ours)
+    grow(ours, 2, "us")
+    grow(theirs, 2, "them")
+    assert ours.connect_blocks(2, theirs.chain[3:]) == "Blocks do not add work to the chain."
+    grow(theirs, 1, "them")
+    assert ours.connect_blocks(2, theirs.chain[3:]) is None
+    assert [ours.work_at(h) for h in range(6)] == [theirs.work_at(h) for h in range(6)]
+    assert ours.work_after(2) == theirs.work_after(2)
+    assert ours.connect_blocks(9, []) == "Unknown fork point 9."
+
+
+def test_out_of_range_difficulty_is_rejected_before_summing_work(grow):
+    ours = BlockChain()
+    grow(ours, 2)
+    theirs = _copy(ours)
+    grow(theirs, 1, "them")
+    # Summing 2 ** difficulty for this would take seconds.
+    theirs.chain[-1].difficulty = 2 ** 31 - 1
+    assert ours.connect_blocks(2, theirs.chain[3:]) == "Block 3 has invalid difficulty."
+    data = theirs.to_dict()
+    with pytest.raises(ValueError, match="invalid difficulty"):
+        BlockChain(json=data)
+    with pytest.raises(ValueError, match="invalid difficulty"):
+        Block.from_dict(data["chain"][3])
+    with pytest.raises(ValueError, match="invalid difficulty"):
+        codec.decode_block(codec.encode_block(theirs.chain[3]))
+    with pytest.raises(ValueError, match="invalid difficulty"):
+        codec.decode_block_chain(codec.encode_block_chain(theirs))
+    data["chain"][3]["difficulty"] = -1
+    with pytest.raises(ValueError, match="invalid difficulty"):
+        BlockChain(json=data)
+
+
+def test_retargeting_stays_in_range():
+    block_chain = BlockChain()
+    height = block_chain.difficulty_adjustment_interval + 1
+    slow = 3. * block_chain.block_generation_interval
+    assert block_chain._adjusted_difficulty(lambda h: h * slow, lambda h: 0, height) == 0
+    assert block_chain._adjusted_difficulty(
+        lambda h: 0., lambda h: MAX_DIFFICULTY, height
+    ) == MAX_DIFFICULTY
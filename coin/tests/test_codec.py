@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+from coin import codec
+from coin.block import BlockChain
+from coin.transaction import UnspentTxOut, get_coinbase_transaction
+from coin.wallet import create_transaction
+
+
+@pytest.fixture
+def spent_chain(funded_chain, private_key, next_block) -> BlockChain:
+    """funded_chain with a block holding a signed payment on top."""
+    payment = create_transaction("receiver", 20., private_key, funded_chain.unspent_tx_outs)
+    coinbase = get_coinbase_transaction("miner", funded_chain.length)
+    assert funded_chain.add_block(next_block(funded_chain, [coinbase, payment])) is None
+    return funded_chain
+
+
+def _dicts(blocks):
+    return [block.to_dict() for block in blocks]
+
+
+def test_blocks_round_trip(spent_chain):
+    for block in spent_chain.chain:
+        assert codec.decode_block(codec.encode_block(block)).to_dict() == block.to_dict()
+    blocks = spent_chain.chain[1:]
+    assert _dicts(codec.decode_block_list(codec.encode_block_list(blocks))) == _dicts(blocks)
+
+
+def test_chains_round_trip(spent_chain):
+    data = codec.encode_block_chain(spent_chain)
+    decoded = codec.decode_block_chain(data)
+    assert _dicts(decoded.chain) == _dicts(spent_chain.chain)
+    assert decoded.cummulative_difficulty == spent_chain.cummulative_difficulty
+    lazy = BlockChain(json=codec.decode_block_chain_dict(data))
+    assert lazy.latest_block.hash_digest == spent_chain.latest_block.hash_digest
+
+
+def test_transactions_and_outputs_round_trip(spent_chain):
+    payment = spent_chain.latest_block.transactions[1]
+    assert codec.decode_transaction(codec.encode_transaction(payment)).to_dict() == (
+        payment.to_dict()
+    )
+    tx_in, tx_out = payment.tx_ins[0], payment.tx_outs[0]
+    assert codec.decode_tx_in(codec.encode_tx_in(tx_in)).to_dict() == tx_in.to_dict()
+    assert codec.decode_tx_out(codec.encode_tx_out(tx_out)).to_dict() == tx_out.to_dict()
+    u_tx_out = UnspentTxOut("ab" * 32, 3, "owner", 5.)
+    assert codec.decode_unspent_tx_out(codec.encode_unspent_tx_out(u_tx_out)).to_dict() == (
+        u_tx_out.to_dict()
+    )
+
+
+def test_undo_round_trips(funded_chain, private_key):
+    unspent_tx_outs = funded_chain.unspent_tx_outs.copy()
+    payment = create_transaction("receiver", 20., private_key, unspent_tx_outs)
+    undo = unspent_tx_outs.apply_transactions([payment])
+    block_digest, decoded = codec.decode_block_undo(codec.encode_block_undo(b"\1" * 32, undo))
+    assert block_digest == b"\1" * 32
+    assert [u.to_dict() for u in decoded.spent] == [u.to_dict() for u in undo.spent]
+    assert decoded.created == undo.created
+
+
+def test_truncated_or_corrupt_blocks_raise_value_error(spent_chain):
+    data = codec.encode_block(spent_chain.latest_block)
+    for cut in range(len(data)):
+        with pytest.raises(ValueError):
+            codec.decode_block(data[:cut])
+    with pytest.raises(ValueError):
+        codec.decode_block(data + b"\0")
+    rng = random.Random(1)
+    for _ in range(500):
+        corrupt = bytearray(data)
+        corrupt[rng.randrange(len(corrupt))] ^= 1 << rng.randrange(8)
+        try:
+            codec.decode_block(bytes(corrupt))
+        except ValueError:
+            pass
+
+
+def test_wrong_kind_and_tampered_id_are_rejected(spent_chain):
+    payment = spent_chain.latest_block.transactions[1]
+    data = codec.encode_transaction(payment)
+    with pytest.raises(ValueError, match="kind"):
+        codec.decode_block(data)
+    tampered = data[:-1] + bytes([data[-1] ^ 1])
+    with pytest.raises(ValueError, match="does not match"):
+        codec.decode_transaction(tampered)
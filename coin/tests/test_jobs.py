@@ -0,0 +1,135 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import importlib
+import os
+
+import pytest
+
+from coin.block import BlockChain
+from coin.transaction import get_coinbase_transaction
+
+
+API_DIRECTORY = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "api")
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    monkeypatch.syspath_prepend(API_DIRECTORY)
+    return importlib.import_module("jobs")
+
+
+async def finished(job):
+    for _ in range(200):
+        if job.status not in ("queued", "mining"):
+            return job
+        await asyncio.sleep(.05)
+    raise AssertionError(f"Job {job.job_id} never finished.")
+
+
+def run_jobs(jobs, block_chain: BlockChain, scenario):
+    async def run():
+        mining_jobs = jobs.MiningJobs(block_chain, ThreadPoolExecutor(max_workers=1))
+        mining_jobs.start()
+        try:
+            await scenario(mining_jobs)
+        finally:
+            await mining_jobs.close()
+    asyncio.run(run())
+
+
+def test_job_mines_a_block(jobs):
+    block_chain = BlockChain()
+    mined = []
+
+    async def scenario(mining_jobs):
+        mining_jobs.listeners.append(mined.append)
+        job = await finished(mining_jobs.submit([get_coinbase_transaction("miner", 1)]))
+        assert (job.status, job.height) == ("done", 1)
+        assert job.hashed_data == block_chain.latest_block.hashed_data
+    run_jobs(jobs, block_chain, scenario)
+    assert mined == [block_chain.latest_block]
+
+
+def test_invalid_job_fails_before_mining(jobs, monkeypatch):
+    block_chain = BlockChain()
+
+    def mine_block(*args):
+        raise AssertionError("mined an invalid block")
+    monkeypatch.setattr(block_chain, "mine_block", mine_block)
+
+    async def scenario(mining_jobs):
+        job = await finished(mining_jobs.submit([get_coinbase_transaction("miner", 7)]))
+        assert job.status == "failed"
+        assert "is not for block 1" in job.error
+    run_jobs(jobs, block_chain, scenario)
+    assert block_chain.length == 1
+
+
+def test_queue_survives_a_job_raising(jobs, monkeypatch):
+    block_chain = BlockChain()
+    mine_block = block_chain.mine_block
+
+    def broken(*args):
+        raise RuntimeError("boom")
+
+    async def scenario(mining_jobs):
+        monkeypatch.setattr(block_chain, "mine_block", broken)
+        job = await finished(mining_jobs.submit([get_coinbase_transaction("miner", 1)]))
+        assert (job.status, job.error) == ("failed", "RuntimeError: boom")
+        monkeypatch.setattr(block_chain, "mine_block", mine_block)
+        job = await finished(mining_jobs.submit([get_coinbase_transaction("miner", 1)]))
+        assert job.status == "done"
+    run_jobs(jobs, block_chain, scenario)
+
+
+def test_search_restarts_when_the_tip_changes(jobs, monkeypatch):
+    block_chain = BlockChain()
+    mine_block = block_chain.mine_block
+    searching = []
+
+    def stale_first(transactions, workers, stop_event):
+        if not searching:
+            searching.append(True)
+            # Until tip_changed stops it, like a search that finds nothing.
+            assert stop_event.wait(10)
+            return None
+        return mine_block(transactions, workers, stop_event)
+    monkeypatch.setattr(block_chain, "mine_block", stale_first)
+
+    async def scenario(mining_jobs):
+        job = mining_jobs.submit([get_coinbase_transaction("miner", 1)])
+        while not searching:
+            await asyncio.sleep(.01)
+        mining_jobs.tip_changed()
+        job = await finished(job)
+        assert (job.status, job.restarts) == ("done", 1)
+    run_jobs(jobs, block_chain, scenario)
+
+
+def test_block_found_on_an_old_tip_is_mined_again(jobs, monkeypatch):
+    block_chain = BlockChain()
+    mine_block = block_chain.mine_block
+    chain_executor = ThreadPoolExecutor(max_workers=1)
+
+    def overtaken_first(transactions, workers, stop_event):
+        block = mine_block(transactions, workers, stop_event)
+        if block_chain.length == 1:
+            # Another block lands on chain_executor while the nonce is found.
+            competitor = mine_block([get_coinbase_transaction("peer", 1)])
+            assert chain_executor.submit(block_chain.add_block, competitor).result() is None
+        return block
+    monkeypatch.setattr(block_chain, "mine_block", overtaken_first)
+
+    def template():
+        return [get_coinbase_transaction("miner", block_chain.length)]
+
+    async def run():
+        mining_jobs = jobs.MiningJobs(block_chain, chain_executor)
+        mining_jobs.start()
+        try:
+            job = await finished(mining_jobs.submit([], template))
+        finally:
+            await mining_jobs.close()
+        assert (job.status, job.height, job.restarts) == ("done", 2, 1)
+    asyncio.run(run())
+    assert block_chain.unspent_tx_outs.balance("miner") == 50.
@@ -0,0 +1,77 @@
+from typing import List
+
+import pytest
+
+from coin.block import Block, BlockChain, LazyChain
+
+
+def _decoded(chain: LazyChain) -> List[int]:
+    return [height for height, block in enumerate(chain._blocks) if block is not None]
+
+
+def _unspent(block_chain: BlockChain):
+    return sorted(tuple(u.to_dict().values()) for u in block_chain.unspent_tx_outs)
+
+
+def test_loaded_chain_only_decodes_what_is_read(grow):
+    source = BlockChain()
+    grow(source, 6)
+    loaded = BlockChain(json=source.to_dict())
+    assert isinstance(loaded.chain, LazyChain)
+    assert _decoded(loaded.chain) == []
+    assert loaded.length == 7
+    assert loaded.cummulative_difficulty == source.cummulative_difficulty
+    assert loaded.latest_block.hashed_data == source.latest_block.hashed_data
+    assert _decoded(loaded.chain) == [6]
+    # The unspent outputs are replayed, from every block, once needed.
+    assert loaded._unspent_tx_outs is None
+    assert _unspent(loaded) == _unspent(source)
+    assert _decoded(loaded.chain) == list(range(7))
+    assert [b.hashed_data for b in loaded.chain] == [b.hashed_data for b in source.chain]
+
+
+def test_replacing_with_a_loaded_chain_decodes_few_blocks(grow):
+    ours = BlockChain()
+    grow(ours, 8)
+    theirs = BlockChain(json=ours.to_dict())
+    grow(theirs, 2, "them")
+    decodes: List[int] = []
+
+    def decode(raw: dict) -> Block:
+        decodes.append(raw["index"])
+        return Block.from_dict(raw)
+
+    raw_blocks = theirs.to_dict()["chain"]
+    assert ours.replace_chain(LazyChain(raw_blocks, decode)) is None
+    assert ours.length == 11
+    assert ours.latest_block.hashed_data == theirs.latest_block.hashed_data
+    assert sorted(decodes) == sorted(set(decodes))
+    assert {9, 10} <= set(decodes)
+    assert len(decodes) < len(raw_blocks)
+
+
+def test_malformed_block_is_only_reported_when_read(grow):
+    source = BlockChain()
+    grow(source, 3)
+    data = source.to_dict()
+    del data["chain"][2]["transactions"]
+    loaded = BlockChain(json=data)
+    assert loaded.latest_block.hashed_data == source.latest_block.hashed_data
+    with pytest.raises(ValueError, match="Block 2 is malformed."):
+        loaded.chain[2]
+    with pytest.raises(IndexError):
+        loaded.chain[4]
+
+
+def test_lazy_chain_behaves_like_a_list(grow):
+    source = BlockChain()
+    grow(source, 4)
+    chain = LazyChain(source.to_dict()["chain"])
+    assert [b.index for b in chain[1:3]] == [1, 2]
+    assert chain[-1].index == 4
+    del chain[3:]
+    block = source.chain[3]
+    chain.append(block)
+    assert len(chain) == 4
+    assert chain[3] is block
+    assert chain.summaries()[3] == (block.time, block.difficulty)
@@ -0,0 +1,87 @@
+import pytest
+
+from coin.block import BlockChain
+from coin.mempool import Mempool
+from coin.transaction import Transaction, TxIn, TxOut, UnspentTxOut, get_coinbase_transaction
+from coin.wallet import create_transaction, get_signature
+
+
+def _pay(u_tx_out: UnspentTxOut, fee: float, private_key: str) -> Transaction:
+    """Spend `u_tx_out` to a receiver, leaving `fee` to the miner."""
+    transaction = Transaction(
+        [TxIn(u_tx_out.tx_out_id, u_tx_out.tx_out_index, None)],
+        [TxOut("receiver", u_tx_out.amount - fee)]
+    )
+    transaction.tx_ins[0].signature = get_signature(transaction.transaction_id, private_key)
+    return transaction
+
+
+@pytest.fixture
+def mempool(funded_chain) -> Mempool:
+    mempool = Mempool(funded_chain)
+    funded_chain.listeners.append(mempool.chain_changed)
+    return mempool
+
+
+def test_duplicates_conflicts_and_coinbases_are_rejected(mempool, private_key, address):
+    u_tx_out = mempool.unspent_tx_outs.for_address(address)[0]
+    first = _pay(u_tx_out, 1., private_key)
+    assert mempool.add(first) is None
+    assert "already pending" in mempool.add(first)
+    assert "conflicts with pending" in mempool.add(_pay(u_tx_out, 2., private_key))
+    assert "can't be relayed" in mempool.add(get_coinbase_transaction(address, 4))
+    assert len(mempool) == 1
+    assert mempool.get(first.transaction_id) is first
+    assert mempool.remove(first.transaction_id) is first
+    assert mempool.add(_pay(u_tx_out, 2., private_key)) is None
+
+
+def test_template_puts_the_best_fee_rate_first(mempool, private_key, address):
+    transactions = [
+        _pay(u_tx_out, fee, private_key)
+        for u_tx_out, fee in zip(mempool.unspent_tx_outs.for_address(address), [1., 5., 3.])
+    ]
+    for transaction in transactions:
+        assert mempool.add(transaction) is None
+    template = mempool.block_template("miner", 4)
+    assert template[0].tx_ins[0].tx_out_index == 4
+    assert template[1:] == [transactions[1], transactions[2], transactions[0]]
+    assert mempool.block_template("miner", 4, max_transactions=1)[1:] == [transactions[1]]
+
+
+def test_lowest_fee_rate_is_evicted_when_full(funded_chain, private_key, address):
+    u_tx_outs = funded_chain.unspent_tx_outs.for_address(address)
+    transactions = [_pay(u, fee, private_key) for u, fee in zip(u_tx_outs, [2., 1., 3.])]
+    mempool = Mempool(funded_chain)
+    assert mempool.add(transactions[0]) is None
+    # Room for two, signatures vary in length by a few bytes.
+    mempool.max_bytes = 2 * mempool.size_bytes + 8
+    assert mempool.add(transactions[1]) is None
+    assert mempool.add(transactions[2]) is None
+    assert transactions[1].transaction_id not in mempool
+    assert len(mempool) == 2
+    low = _pay(u_tx_outs[1], .5, private_key)
+    assert "pays too little" in mempool.add(low)
+
+
+def test_mined_transactions_leave_and_reorged_ones_return(
+    funded_chain, mempool, private_key, address, next_block, grow
+):
+    fork_point = funded_chain.length - 1
+    other = BlockChain()
+    for block in funded_chain.chain[1:]:
+        assert other.add_block(block) is None
+    payment = create_transaction("receiver", 20., private_key, funded_chain.unspent_tx_outs)
+    assert mempool.add(payment) is None
+    template = mempool.block_template("miner", funded_chain.length)
+    assert funded_chain.add_block(next_block(funded_chain, template)) is None
+    assert len(mempool) == 0
+
+    grow(other, 2, "peer")
+    assert funded_chain.connect_blocks(fork_point, other.chain[fork_point + 1:]) is None
+    assert payment.transaction_id in mempool
+    template = mempool.block_template("miner", funded_chain.length)
+    assert template[1:] == [payment]
+    assert funded_chain.add_block(next_block(funded_chain, template)) is None
+    assert len(mempool) == 0
+    assert mempool.unspent_tx_outs is funded_chain.unspent_tx_outs
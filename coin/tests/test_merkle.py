@@ -0,0 +1,57 @@
+from hashlib import sha256
+from typing import List
+
+from coin.merkle import EMPTY_ROOT, MerkleTree, merkle_root
+from coin.transaction import get_coinbase_transaction
+
+
+def _reference_root(leaves: List[bytes]) -> bytes:
+    """Level by level, pairing the last node of an odd level with itself."""
+    if not leaves:
+        return EMPTY_ROOT
+    level = list(leaves)
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+    return level[0]
+
+
+def _leaves(count: int) -> List[bytes]:
+    return [sha256(bytes([i])).digest() for i in range(count)]
+
+
+def test_roots_match_the_reference_for_every_size():
+    leaves = _leaves(40)
+    tree = MerkleTree()
+    for count in range(len(leaves) + 1):
+        expected = _reference_root(leaves[:count])
+        assert merkle_root(leaves[:count]) == expected
+        assert MerkleTree(leaves[:count]).root() == expected
+        # Grown one leaf at a time.
+        assert len(tree) == count
+        assert tree.root() == expected
+        if count < len(leaves):
+            tree.append(leaves[count])
+
+
+def test_single_leaf_and_empty_roots():
+    leaf = sha256(b"leaf").digest()
+    assert merkle_root([leaf]) == leaf
+    assert merkle_root([]) == EMPTY_ROOT == MerkleTree().root()
+
+
+def test_copies_grow_independently():
+    tree = MerkleTree(_leaves(5))
+    copy = tree.copy()
+    copy.append(sha256(b"more").digest())
+    assert tree.root() == _reference_root(_leaves(5))
+    assert copy.root() == _reference_root(_leaves(5) + [sha256(b"more").digest()])
+
+
+def test_blocks_commit_to_their_transactions(funded_chain, next_block):
+    coinbase = get_coinbase_transaction("miner", funded_chain.length)
+    block = next_block(funded_chain, [coinbase])
+    assert block.merkle_root == merkle_root([coinbase.transaction_digest])
+    block.transactions = [get_coinbase_transaction("thief", funded_chain.length)]
+    assert "merkle root does not match" in funded_chain.add_block(block)
@@ -0,0 +1,103 @@
+import threading
+
+import pytest
+
+from coin import metrics
+from coin import transaction as transaction_module
+from coin.transaction import get_coinbase_transaction, validate_transactions
+from coin.wallet import create_transaction
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """An empty registry, with metrics on."""
+    monkeypatch.setattr(metrics, "REGISTRY", {})
+    monkeypatch.setattr(metrics, "_enabled", True)
+    return metrics.REGISTRY
+
+
+def test_counters_and_gauges_render(registry):
+    counter = metrics.Counter("test_things_total", "Things.")
+    counter.inc()
+    counter.inc(2)
+    metrics.Gauge("test_level", "Level.", function=lambda: 1.5)
+    assert metrics.render() == (
+        "# HELP test_things_total Things.\n"
+        "# TYPE test_things_total counter\n"
+        "test_things_total 3\n"
+        "# HELP test_level Level.\n"
+        "# TYPE test_level gauge\n"
+        "test_level 1.5\n"
+    )
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    histogram = metrics.Histogram("test_seconds", "Seconds.", buckets=(1., .1))
+    for value in (.05, .5, .5, 5.):
+        histogram.observe(value)
+    with histogram.time():
+        pass
+    assert histogram.samples() == [
+        'test_seconds_bucket{le="0.1"} 2',
+        'test_seconds_bucket{le="1"} 4',
+        'test_seconds_bucket{le="+Inf"} 5',
+        f"test_seconds_sum {metrics._format(histogram.sum)}",
+        "test_seconds_count 5",
+    ]
+
+
+def test_nothing_is_recorded_while_disabled(registry):
+    counter = metrics.Counter("test_things_total", "Things.")
+    histogram = metrics.Histogram("test_seconds", "Seconds.")
+    metrics.disable()
+    assert not metrics.is_enabled()
+    counter.inc()
+    with histogram.time():
+        pass
+    metrics.enable()
+    assert counter.value == 0
+    assert histogram.count == 0
+
+
+def test_validation_is_counted(funded_chain, next_block):
+    validated = metrics.REGISTRY["coin_transactions_validated_total"]
+    before = validated.value
+    block = next_block(funded_chain, [get_coinbase_transaction("miner", funded_chain.length)])
+    assert funded_chain.add_block(block) is None
+    assert validated.value == before + 1
+    assert "coin_utxo_set_size 4" in metrics.render()
+
+
+def test_profiler_samples_other_threads():
+    stop = threading.Event()
+
+    def busy_loop():
+        while not stop.is_set():
+            sum(range(1000))
+    thread = threading.Thread(target=busy_loop)
+    thread.start()
+    try:
+        profiler = metrics.profile(.2, interval=.01)
+    finally:
+        stop.set()
+        thread.join()
+    assert profiler.samples > 0
+    assert "test_metrics.py:busy_loop" in profiler.collapsed()
+
+
+def test_signature_cache_counters_survive_clearing(funded_chain, private_key):
+    hits = metrics.REGISTRY["coin_signature_cache_hits_total"]
+    misses = metrics.REGISTRY["coin_signature_cache_misses_total"]
+    cache = transaction_module.SignatureCache()
+    payment = create_transaction("receiver", 20., private_key, funded_chain.unspent_tx_outs)
+    before = (hits.value, misses.value)
+    for _ in range(2):
+        assert validate_transactions([payment], funded_chain.unspent_tx_outs, cache=cache) is None
+    assert (hits.value, misses.value) == (before[0] + 1, before[1] + 1)
+    cache.clear()
+    assert (hits.value, misses.value) == (before[0] + 1, before[1] + 1)
+
+
+def test_metrics_must_render_samples(registry):
+    with pytest.raises(TypeError):
+        metrics._Metric("test_untyped", "Untyped.")
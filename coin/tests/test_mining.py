@@ -0,0 +1,66 @@
+import threading
+
+from coin.block import BlockChain
+from coin.mining import MAX_DIFFICULTY, MiningKernel, difficulty_target, parallel_nonce_search
+from coin.transaction import get_coinbase_transaction
+
+
+def test_parallel_search_finds_a_valid_nonce():
+    kernel = MiningKernel(1, bytes(32), bytes(32), 8, 1000.)
+    nonce = parallel_nonce_search(1, bytes(32), bytes(32), 8, 1000., workers=2)
+    assert nonce is not None
+    assert kernel.search(start=nonce) == nonce
+
+
+def test_mine_block_across_workers_is_accepted():
+    block_chain = BlockChain()
+    block = block_chain.mine_block([get_coinbase_transaction("miner", 1)], workers=2)
+    assert block_chain.add_block(block) is None
+    assert block_chain.latest_block is block
+
+
+def test_mine_block_stops_when_asked():
+    block_chain = BlockChain()
+    stop_event = threading.Event()
+    stop_event.set()
+    block = block_chain.mine_block([get_coinbase_transaction("miner", 1)], stop_event=stop_event)
+    assert block is None
+    assert block_chain.length == 1
+
+
+def test_kernel_nonce_hashes_below_the_target():
+    block_chain = BlockChain()
+    block = block_chain.mine_block([get_coinbase_transaction("miner", 1)])
+    kernel = MiningKernel(
+        block.index, block.merkle_root, block.previous_digest, 12, block.time
+    )
+    nonce = kernel.search()
+    block.difficulty = 12
+    block.nonce = nonce
+    digest = block._calculate_digest()
+    assert digest < difficulty_target(12)
+    # The first one, every nonce before it misses.
+    for earlier in range(nonce):
+        block.nonce = earlier
+        assert block._calculate_digest() >= difficulty_target(12)
+
+
+def test_kernel_search_steps_through_its_share_of_nonces():
+    kernel = MiningKernel(1, bytes(32), bytes(32), 6, 1000.)
+    nonce = kernel.search(start=3, step=4)
+    assert nonce % 4 == 3
+    assert kernel.search(start=nonce, step=4) == nonce
+
+
+def test_no_target_without_difficulty():
+    assert difficulty_target(0) is None
+    assert MiningKernel(1, bytes(32), bytes(32), 0, 1000.).search(start=7) == 7
+
+
+def test_out_of_range_difficulty_matches_nothing():
+    digest = bytes(32).hex()
+    assert BlockChain.hash_matches_difficulty(digest, 256)
+    for difficulty in (257, 2 ** 31 - 1, -1, 8.):
+        assert not BlockChain.hash_matches_difficulty(digest, difficulty)
+    assert difficulty_target(MAX_DIFFICULTY + 1) == bytes(32)
+    assert not bytes(32) < difficulty_target(300)
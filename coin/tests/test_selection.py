@@ -0,0 +1,89 @@
+from typing import List
+
+import pytest
+
+from coin import selection
+from coin.selection import (
+    COIN_SELECTORS,
+    branch_and_bound,
+    consolidating,
+    fewest_inputs,
+    largest_first,
+)
+from coin.transaction import AmountIndex, UnspentTxOut, UnspentTxOutSet, validate_transactions
+from coin.wallet import create_consolidation_transaction, create_transaction, get_amount_index
+
+
+def _index(*amounts: float, address: str = "owner") -> AmountIndex:
+    return AmountIndex(
+        UnspentTxOut("%064x" % (i + 1), 0, address, float(amount))
+        for i, amount in enumerate(amounts)
+    )
+
+
+def _amounts(selected: List[UnspentTxOut]) -> List[float]:
+    return sorted(u_tx_out.amount for u_tx_out in selected)
+
+
+def test_amount_index_follows_the_set():
+    outputs = [UnspentTxOut("%064x" % (i + 1), 0, "me", float(i + 1)) for i in range(5)]
+    unspent_tx_outs = UnspentTxOutSet(outputs)
+    amount_index = get_amount_index("me", unspent_tx_outs)
+    assert [u.amount for u in amount_index.largest()] == [5., 4., 3., 2., 1.]
+    unspent_tx_outs.spend(outputs[4].tx_out_id, 0)
+    unspent_tx_outs.add(UnspentTxOut("%064x" % 100, 0, "me", 2.5))
+    assert [u.amount for u in amount_index.smallest()] == [1., 2., 2.5, 3., 4.]
+    assert amount_index.total == 12.5
+    assert amount_index.smallest_at_least(2.1).amount == 2.5
+    assert amount_index.smallest_at_least(4.1) is None
+    assert [u.amount for u in amount_index.at_most(3.)] == [3., 2.5, 2., 1.]
+
+
+@pytest.mark.parametrize("name", sorted(COIN_SELECTORS))
+def test_every_strategy_covers_the_amount(name):
+    outputs = _index(8, 5, 4, 3, 1, 1)
+    for amount in (1., 6., 13., 22.):
+        assert sum(_amounts(COIN_SELECTORS[name](amount, outputs))) >= amount
+    with pytest.raises(ValueError):
+        COIN_SELECTORS[name](22.5, outputs)
+
+
+def test_largest_first_uses_the_largest_outputs():
+    assert _amounts(largest_first(10., _index(8, 5, 4, 3, 1))) == [5., 8.]
+
+
+def test_branch_and_bound_finds_exact_matches():
+    outputs = _index(8, 6, 4, 3, 1)
+    assert _amounts(branch_and_bound(12., outputs)) == [4., 8.]
+    assert _amounts(branch_and_bound(18., outputs)) == [4., 6., 8.]
+    assert branch_and_bound(18., outputs, max_inputs=2) is None
+    assert branch_and_bound(23., outputs) is None
+
+
+def test_fewest_inputs_prefers_a_single_output_then_an_exact_match():
+    outputs = _index(8, 6, 4, 3, 1)
+    assert _amounts(fewest_inputs(5., outputs)) == [6.]
+    # largest_first would take 8 and 6 and need change.
+    assert _amounts(fewest_inputs(10., outputs)) == [4., 6.]
+    assert _amounts(fewest_inputs(13.5, outputs)) == [6., 8.]
+
+
+def test_consolidating_sweeps_up_small_outputs(monkeypatch):
+    outputs = _index(8, 1, 2, 1, 3)
+    assert _amounts(consolidating(3.5, outputs)) == [1., 1., 2.]
+    monkeypatch.setattr(selection, "CONSOLIDATION_MAX_INPUTS", 2)
+    assert _amounts(consolidating(3.5, outputs)) == [8.]
+
+
+def test_exact_selection_needs_no_change(private_key, address):
+    unspent_tx_outs = UnspentTxOutSet(
+        UnspentTxOut("%064x" % (i + 1), 0, address, amount)
+        for i, amount in enumerate([8., 6., 4., 3.])
+    )
+    transaction = create_transaction("receiver", 10., private_key, unspent_tx_outs)
+    assert [(t.address, t.amount) for t in transaction.tx_outs] == [("receiver", 10.)]
+    assert len(transaction.tx_ins) == 2
+    assert validate_transactions([transaction], unspent_tx_outs, cache=None) is None
+    merged = create_consolidation_transaction(private_key, unspent_tx_outs, max_inputs=3)
+    assert [(t.address, t.amount) for t in merged.tx_outs] == [(address, 13.)]
+    assert validate_transactions([merged], unspent_tx_outs, cache=None) is None
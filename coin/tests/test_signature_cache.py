@@ -0,0 +1,46 @@
+from coin import transaction as transaction_module
+from coin.transaction import SignatureCache, validate_transactions
+from coin.wallet import create_transaction, get_signature
+
+
+def test_cached_signatures_are_not_verified_again(funded_chain, private_key, monkeypatch):
+    payment = create_transaction("receiver", 20., private_key, funded_chain.unspent_tx_outs)
+    cache = SignatureCache()
+    assert validate_transactions([payment], funded_chain.unspent_tx_outs, cache=cache) is None
+    assert (cache.hits, cache.misses, len(cache)) == (0, 1, 1)
+
+    def verify_nothing(checks, workers=1):
+        assert checks == []
+        return []
+    monkeypatch.setattr(transaction_module, "verify_signatures", verify_nothing)
+    assert validate_transactions([payment], funded_chain.unspent_tx_outs, cache=cache) is None
+    assert cache.hits == 1
+
+
+def test_signing_fills_the_shared_cache(funded_chain, private_key):
+    transaction_module.signature_cache.clear()
+    payment = create_transaction("receiver", 20., private_key, funded_chain.unspent_tx_outs)
+    assert validate_transactions([payment], funded_chain.unspent_tx_outs) is None
+    assert transaction_module.signature_cache.hits == 1
+
+
+def test_a_different_signature_misses(funded_chain, private_key, other_private_key):
+    payment = create_transaction("receiver", 20., private_key, funded_chain.unspent_tx_outs)
+    cache = SignatureCache()
+    assert validate_transactions([payment], funded_chain.unspent_tx_outs, cache=cache) is None
+    payment.tx_ins[0].signature = get_signature(payment.transaction_id, other_private_key)
+    error = validate_transactions([payment], funded_chain.unspent_tx_outs, cache=cache)
+    assert "invalid signature" in error
+    assert cache.hits == 0
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = SignatureCache(maxsize=2)
+    cache.add("a", 0, "key", "sig-a")
+    cache.add("b", 0, "key", "sig-b")
+    assert cache.contains("a", 0, "key", "sig-a")
+    cache.add("c", 0, "key", "sig-c")
+    assert len(cache) == 2
+    assert not cache.contains("b", 0, "key", "sig-b")
+    assert cache.contains("a", 0, "key", "sig-a")
+    assert cache.contains("c", 0, "key", "sig-c")
@@ -0,0 +1,42 @@
+import copy
+import pickle
+
+import pytest
+
+from coin.transaction import BlockUndo, Transaction, TxIn, TxOut, UnspentTxOut
+
+
+def test_chain_objects_have_no_instance_dict(funded_chain):
+    block = funded_chain.latest_block
+    transaction = block.transactions[0]
+    u_tx_out = funded_chain.unspent_tx_outs[0]
+    for value in [
+        block, transaction, transaction.tx_ins[0], transaction.tx_outs[0], u_tx_out,
+        BlockUndo([], [])
+    ]:
+        assert not hasattr(value, "__dict__")
+    with pytest.raises(AttributeError):
+        block.extra = 1
+    with pytest.raises(AttributeError):
+        transaction.tx_outs[0].extra = 1
+
+
+def test_unspent_outputs_are_immutable():
+    u_tx_out = UnspentTxOut("ab" * 32, 1, "owner", 5.)
+    with pytest.raises(AttributeError):
+        u_tx_out.amount = 6.
+    with pytest.raises(AttributeError):
+        del u_tx_out.address
+    assert u_tx_out.amount == 5.
+
+
+def test_slotted_objects_pickle_and_copy(funded_chain):
+    u_tx_out = UnspentTxOut("ab" * 32, 1, "owner", 5.)
+    for value in [u_tx_out, copy.copy(u_tx_out), copy.deepcopy(u_tx_out)]:
+        assert pickle.loads(pickle.dumps(value)).to_dict() == u_tx_out.to_dict()
+    block = funded_chain.latest_block
+    assert pickle.loads(pickle.dumps(block)).to_dict() == block.to_dict()
+    transaction = Transaction([TxIn("cd" * 32, 0, "signature")], [TxOut("receiver", 1.)])
+    unpickled = pickle.loads(pickle.dumps(transaction))
+    assert unpickled.transaction_id == transaction.transaction_id
+    assert unpickled.to_dict() == transaction.to_dict()
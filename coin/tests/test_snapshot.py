@@ -0,0 +1,126 @@
+import os
+
+import pytest
+
+from coin import block as block_module
+from coin.block import BlockChain
+from coin.snapshot import (
+    SNAPSHOT_DIRECTORY,
+    SnapshotStore,
+    read_snapshot,
+    read_snapshot_header,
+    write_snapshot,
+)
+from coin.transaction import UnspentTxOut, UnspentTxOutSet, get_coinbase_transaction
+from coin.wallet import create_transaction
+
+
+def _unspent(unspent_tx_outs):
+    return sorted(tuple(u.to_dict().values()) for u in unspent_tx_outs)
+
+
+def _replayed(block_chain: BlockChain):
+    unspent_tx_outs = UnspentTxOutSet()
+    for block in block_chain.chain:
+        unspent_tx_outs.apply_transactions(block.transactions)
+    return _unspent(unspent_tx_outs)
+
+
+def _outputs() -> UnspentTxOutSet:
+    return UnspentTxOutSet(
+        UnspentTxOut("%064x" % i, i % 3, f"owner-{i % 4}", float(i)) for i in range(1, 20)
+    )
+
+
+def test_snapshots_round_trip(tmp_path):
+    path = str(tmp_path / "snapshot.dat")
+    write_snapshot(path, 7, b"\1" * 32, _outputs())
+    assert read_snapshot_header(path) == (7, b"\1" * 32)
+    height, block_digest, unspent_tx_outs = read_snapshot(path)
+    assert (height, block_digest) == (7, b"\1" * 32)
+    assert _unspent(unspent_tx_outs) == _unspent(_outputs())
+    assert unspent_tx_outs.balance("owner-1") == _outputs().balance("owner-1")
+    write_snapshot(path, 8, b"\2" * 32, UnspentTxOutSet())
+    assert len(read_snapshot(path)[2]) == 0
+
+
+def test_damaged_snapshots_are_rejected(tmp_path):
+    path = str(tmp_path / "snapshot.dat")
+    write_snapshot(path, 7, b"\1" * 32, _outputs())
+    with open(path, "rb") as f:
+        data = f.read()
+    for damaged in [data[:-1], data[:20], data[:-1] + bytes([data[-1] ^ 1]), b"XXXX" + data[4:]]:
+        with open(path, "wb") as f:
+            f.write(damaged)
+        with pytest.raises(ValueError):
+            read_snapshot(path)
+    store = SnapshotStore(str(tmp_path))
+    assert store.load(3) is None
+    assert store.header(3) is None
+
+
+def test_store_keeps_the_newest(tmp_path):
+    store = SnapshotStore(str(tmp_path), kept=2)
+    for height in (1, 2, 3):
+        store.write(height, bytes([height]) * 32, _outputs())
+    assert store.heights() == [3, 2]
+    assert store.load(3)[:2] == (3, b"\3" * 32)
+
+
+def _fill(block_chain: BlockChain, blocks: int, address, private_key, next_block):
+    """Blocks paying `address`, spending its earlier coinbases along the way."""
+    for i in range(blocks):
+        transactions = [get_coinbase_transaction(address, block_chain.length)]
+        if block_chain.unspent_tx_outs.balance(address) > 10.:
+            transactions.append(create_transaction(
+                f"receiver-{i}", 2., private_key, block_chain.unspent_tx_outs
+            ))
+        assert block_chain.add_block(next_block(block_chain, transactions)) is None
+
+
+def test_open_starts_from_the_newest_snapshot(
+    tmp_path, address, private_key, next_block, monkeypatch
+):
+    monkeypatch.setattr(block_module, "SNAPSHOT_INTERVAL", 3)
+    block_chain = BlockChain.open(str(tmp_path))
+    _fill(block_chain, 7, address, private_key, next_block)
+    expected = _unspent(block_chain.unspent_tx_outs)
+    block_chain.close()
+    snapshots = os.path.join(str(tmp_path), SNAPSHOT_DIRECTORY)
+    assert SnapshotStore(snapshots).heights() == [6, 3]
+
+    block_chain = BlockChain.open(str(tmp_path))
+    assert block_chain._snapshot_height == 6
+    assert _unspent(block_chain.unspent_tx_outs) == expected == _replayed(block_chain)
+    block_chain.close()
+
+    # A damaged newest snapshot falls back to the one before.
+    path = os.path.join(snapshots, sorted(os.listdir(snapshots))[-1])
+    with open(path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 1]))
+    block_chain = BlockChain.open(str(tmp_path))
+    assert block_chain._snapshot_height == 3
+    assert _unspent(block_chain.unspent_tx_outs) == expected
+    block_chain.close()
+
+
+def test_snapshot_of_a_replaced_block_is_not_used(
+    tmp_path, address, private_key, next_block, grow
+):
+    block_chain = BlockChain.open(str(tmp_path))
+    _fill(block_chain, 3, address, private_key, next_block)
+    theirs = BlockChain()
+    for block in block_chain.chain[1:3]:
+        assert theirs.add_block(block) is None
+    grow(theirs, 3, "peer")
+    _fill(block_chain, 1, address, private_key, next_block)
+    block_chain.write_snapshot()
+    assert block_chain.connect_blocks(2, theirs.chain[3:]) is None
+    block_chain.close()
+    block_chain = BlockChain.open(str(tmp_path))
+    assert block_chain._snapshot_height == 0
+    assert _unspent(block_chain.unspent_tx_outs) == _replayed(theirs)
+    block_chain.close()
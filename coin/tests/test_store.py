@@ -0,0 +1,73 @@
+import os
+
+from coin import store as store_module
+from coin.block import BlockChain
+from coin.store import BlockStore, _segment_name
+
+
+def _blocks(grow, count: int):
+    block_chain = BlockChain()
+    grow(block_chain, count)
+    return block_chain
+
+
+def test_blocks_read_back_after_reopening(tmp_path, grow, monkeypatch):
+    monkeypatch.setattr(store_module, "INITIAL_INDEX_CAPACITY", 2)
+    block_chain = _blocks(grow, 4)
+    store = BlockStore(str(tmp_path))
+    for block in block_chain.chain:
+        store.append(block)
+    store.close()
+    store = BlockStore(str(tmp_path))
+    assert len(store) == 5
+    assert [store.read(h).to_dict() for h in range(5)] == [
+        block.to_dict() for block in block_chain.chain
+    ]
+    assert [work for work, _, _ in store.summaries()] == [
+        block_chain.work_at(h) for h in range(5)
+    ]
+    store.close()
+
+
+def test_truncate_drops_the_tail(tmp_path, grow):
+    block_chain = _blocks(grow, 3)
+    store = BlockStore(str(tmp_path))
+    for block in block_chain.chain:
+        store.append(block)
+    store.truncate(2)
+    assert len(store) == 2
+    assert store.append(block_chain.chain[2]) == 2
+    assert store.read(2).hash_digest == block_chain.chain[2].hash_digest
+    store.close()
+    assert len(BlockStore(str(tmp_path))) == 3
+
+
+def test_partial_trailing_write_is_dropped(tmp_path, grow):
+    block_chain = _blocks(grow, 2)
+    store = BlockStore(str(tmp_path))
+    for block in block_chain.chain[:2]:
+        store.append(block)
+    store.close()
+    segment = os.path.join(str(tmp_path), _segment_name(0))
+    size = os.path.getsize(segment)
+    with open(segment, "ab") as f:
+        f.write(b"\x40\x00\x00\x00half a block")
+    store = BlockStore(str(tmp_path))
+    assert len(store) == 2
+    assert os.path.getsize(segment) == size
+    store.append(block_chain.chain[2])
+    assert store.read(2).hash_digest == block_chain.chain[2].hash_digest
+    store.close()
+
+
+def test_opened_chain_survives_a_restart(tmp_path, address, grow):
+    block_chain = BlockChain.open(str(tmp_path))
+    grow(block_chain, 3, address)
+    tip = block_chain.latest_block.hash_digest
+    block_chain.close()
+    block_chain = BlockChain.open(str(tmp_path))
+    assert block_chain.length == 4
+    assert block_chain.latest_block.hash_digest == tip
+    assert block_chain.unspent_tx_outs.balance(address) == 150.
+    grow(block_chain, 1)
+    block_chain.close()
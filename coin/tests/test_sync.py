@@ -0,0 +1,155 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from typing import Tuple
+
+from coin import sync as sync_module
+from coin.block import Block, BlockChain
+from coin.sync import LocalNode, SyncSession
+
+
+class QueueSocket:
+    """One end of an in memory websocket."""
+    def __init__(self, incoming: asyncio.Queue, outgoing: asyncio.Queue):
+        self.incoming = incoming
+        self.outgoing = outgoing
+        self.block_messages: int = 0
+
+    async def send(self, message):
+        if isinstance(message, bytes):
+            self.block_messages += 1
+        await self.outgoing.put(message)
+
+    async def recv(self):
+        return await self.incoming.get()
+
+
+def sync(a: BlockChain, b: BlockChain) -> Tuple[SyncSession, SyncSession]:
+    async def run():
+        a_to_b, b_to_a = asyncio.Queue(), asyncio.Queue()
+        session_a = SyncSession(LocalNode(a), QueueSocket(b_to_a, a_to_b))
+        session_b = SyncSession(LocalNode(b), QueueSocket(a_to_b, b_to_a))
+        await asyncio.wait_for(asyncio.gather(session_a.run(), session_b.run()), 10)
+        return session_a, session_b
+    return asyncio.run(run())
+
+
+def _copy(block_chain: BlockChain) -> BlockChain:
+    copy = BlockChain()
+    for block in block_chain.chain[1:]:
+        assert copy.add_block(block) is None
+    return copy
+
+
+def test_behind_peer_fetches_only_the_missing_blocks(grow):
+    a = BlockChain()
+    grow(a, 5)
+    b = _copy(a)
+    grow(a, 3, "a")
+    session_a, session_b = sync(a, b)
+    assert (session_a.connected, session_b.connected) == (0, 3)
+    assert b.latest_block.hash_digest == a.latest_block.hash_digest
+    assert session_a.websocket.block_messages == 1
+
+
+def test_heavier_fork_replaces_ours(grow):
+    a = BlockChain()
+    grow(a, 5)
+    b = _copy(a)
+    grow(b, 2, "b")
+    grow(a, 4, "a")
+    session_a, session_b = sync(a, b)
+    assert session_b.connected == 4
+    assert b.latest_block.hash_digest == a.latest_block.hash_digest
+    assert b.cummulative_difficulty == a.cummulative_difficulty
+    assert b.unspent_tx_outs.balance("b") == 0.
+
+
+def test_headers_and_blocks_come_in_batches(grow, monkeypatch):
+    monkeypatch.setattr(sync_module, "MAX_HEADERS", 7)
+    monkeypatch.setattr(sync_module, "BLOCK_BATCH", 3)
+    a = BlockChain()
+    grow(a, 2)
+    b = _copy(a)
+    grow(a, 20, "a")
+    session_b, session_a = sync(b, a)
+    assert session_b.connected == 20
+    assert b.latest_block.hash_digest == a.latest_block.hash_digest
+    # Three rounds of headers (7, 7 and 6), each fetched 3 blocks at a time.
+    assert session_a.websocket.block_messages == 8
+
+
+def test_nothing_moves_without_more_work(grow):
+    a = BlockChain()
+    grow(a, 3)
+    b = _copy(a)
+    grow(b, 1, "b")
+    grow(a, 2, "a")
+    tip = a.latest_block.hash_digest
+    session_a, session_b = sync(a, b)
+    assert (session_a.connected, session_b.connected) == (0, 2)
+    assert a.latest_block.hash_digest == tip
+    session_a, session_b = sync(a, b)
+    assert (session_a.connected, session_b.connected) == (0, 0)
+    assert session_a.websocket.block_messages == session_b.websocket.block_messages == 0
+
+
+class OutOfRangeNode(LocalNode):
+    """Serves headers whose difficulty is past MAX_DIFFICULTY."""
+    def headers(self, locator, count):
+        response = super().headers(locator, count)
+        for header in response["headers"]:
+            header["difficulty"] = 300
+            header["hashed_data"] = Block.header_digest(header).hex()
+        return response
+
+
+def test_out_of_range_header_difficulty_ends_the_session(grow):
+    a = BlockChain()
+    grow(a, 3)
+    b = _copy(a)
+    grow(a, 2, "a")
+
+    async def run():
+        a_to_b, b_to_a = asyncio.Queue(), asyncio.Queue()
+        session_a = SyncSession(OutOfRangeNode(a), QueueSocket(b_to_a, a_to_b))
+        session_b = SyncSession(LocalNode(b), QueueSocket(a_to_b, b_to_a))
+        await asyncio.wait_for(asyncio.gather(session_a.run(), session_b.run()), 10)
+        return session_b
+    assert asyncio.run(run()).connected == 0
+    assert b.length == 4
+
+
+class ThreadRecordingNode(LocalNode):
+    """Notes the thread each call to the chain is made on."""
+    def __init__(self, block_chain: BlockChain):
+        super().__init__(block_chain)
+        self.threads = set()
+        for name in ("tip", "locator", "headers", "blocks", "work_after", "connect"):
+            setattr(self, name, self._recording(getattr(self, name)))
+
+    def _recording(self, method):
+        def record(*args):
+            self.threads.add(threading.current_thread())
+            return method(*args)
+        return record
+
+
+def test_node_is_only_called_on_the_executor(grow):
+    a = BlockChain()
+    grow(a, 3)
+    b = _copy(a)
+    grow(a, 4, "a")
+    executor = ThreadPoolExecutor(max_workers=1)
+    nodes = [ThreadRecordingNode(a), ThreadRecordingNode(b)]
+
+    async def run():
+        a_to_b, b_to_a = asyncio.Queue(), asyncio.Queue()
+        session_a = SyncSession(nodes[0], QueueSocket(b_to_a, a_to_b), executor)
+        session_b = SyncSession(nodes[1], QueueSocket(a_to_b, b_to_a), executor)
+        await asyncio.wait_for(asyncio.gather(session_a.run(), session_b.run()), 10)
+        return session_b
+    assert asyncio.run(run()).connected == 4
+    executor.shutdown()
+    assert b.latest_block.hash_digest == a.latest_block.hash_digest
+    assert threading.main_thread() not in nodes[0].threads | nodes[1].threads
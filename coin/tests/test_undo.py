@@ -0,0 +1,121 @@
+import pytest
+
+from coin import block as block_module
+from coin.block import BlockChain
+from coin.store import BlockStore
+from coin.transaction import (
+    Transaction,
+    TxIn,
+    TxOut,
+    UnspentTxOutSet,
+    get_coinbase_transaction,
+)
+from coin.wallet import create_transaction
+
+
+def _unspent(unspent_tx_outs):
+    return sorted(tuple(u.to_dict().values()) for u in unspent_tx_outs)
+
+
+def _replayed(block_chain: BlockChain):
+    unspent_tx_outs = UnspentTxOutSet()
+    for block in block_chain.chain:
+        unspent_tx_outs.apply_transactions(block.transactions)
+    return _unspent(unspent_tx_outs)
+
+
+def _copy(block_chain: BlockChain) -> BlockChain:
+    copy = BlockChain()
+    for block in block_chain.chain[1:]:
+        assert copy.add_block(block) is None
+    return copy
+
+
+def _pay(block_chain: BlockChain, receiver: str, private_key: str, next_block):
+    """Append a block paying `receiver` out of private_key's coinbases."""
+    payment = create_transaction(receiver, 20., private_key, block_chain.unspent_tx_outs)
+    coinbase = get_coinbase_transaction("miner", block_chain.length)
+    assert block_chain.add_block(next_block(block_chain, [coinbase, payment])) is None
+
+
+@pytest.fixture
+def rebuilds(monkeypatch):
+    """Count of unspent output rebuilds from genesis during the test."""
+    monkeypatch.setattr(block_module.UNSPENT_REBUILDS, "value", 0)
+    return block_module.UNSPENT_REBUILDS
+
+
+def test_reorg_rolls_back_with_the_journal(funded_chain, private_key, next_block, grow, rebuilds):
+    fork_point = funded_chain.length - 1
+    theirs = _copy(funded_chain)
+    _pay(funded_chain, "ours", private_key, next_block)
+    _pay(theirs, "theirs", private_key, next_block)
+    grow(theirs, 1, "peer")
+    assert funded_chain.connect_blocks(fork_point, theirs.chain[fork_point + 1:]) is None
+    assert _unspent(funded_chain.unspent_tx_outs) == _replayed(funded_chain)
+    assert _unspent(funded_chain.unspent_tx_outs) == _unspent(theirs.unspent_tx_outs)
+    assert funded_chain.unspent_tx_outs.balance("ours") == 0.
+    assert rebuilds.value == 0
+
+
+def test_invalid_branch_puts_everything_back(funded_chain, private_key, next_block, grow):
+    fork_point = funded_chain.length - 1
+    theirs = _copy(funded_chain)
+    _pay(funded_chain, "ours", private_key, next_block)
+    grow(theirs, 1, "peer")
+    missing = Transaction([TxIn("ab" * 32, 0, "signature")], [TxOut("thief", 1.)])
+    coinbase = get_coinbase_transaction("peer", theirs.length)
+    branch = theirs.chain[fork_point + 1:] + [next_block(theirs, [coinbase, missing])]
+    tip = funded_chain.latest_block
+    before = _unspent(funded_chain.unspent_tx_outs)
+    assert "spends missing output" in funded_chain.connect_blocks(fork_point, branch)
+    assert funded_chain.latest_block is tip
+    assert _unspent(funded_chain.unspent_tx_outs) == before == _replayed(funded_chain)
+    # And the journal still undoes our branch.
+    grow(theirs, 2, "peer")
+    assert funded_chain.connect_blocks(fork_point, theirs.chain[fork_point + 1:]) is None
+    assert _unspent(funded_chain.unspent_tx_outs) == _replayed(theirs)
+
+
+def test_reorg_deeper_than_the_journal_rebuilds(funded_chain, grow, rebuilds):
+    theirs = _copy(funded_chain)
+    funded_chain._undo.retention = 1
+    grow(funded_chain, 3, "ours")
+    grow(theirs, 4, "peer")
+    assert funded_chain.connect_blocks(3, theirs.chain[4:]) is None
+    assert rebuilds.value == 1
+    assert _unspent(funded_chain.unspent_tx_outs) == _replayed(theirs)
+
+
+def test_failed_store_write_leaves_the_chain_as_it_was(
+    tmp_path, address, private_key, next_block, grow, monkeypatch
+):
+    block_chain = BlockChain.open(str(tmp_path))
+    grow(block_chain, 3, address)
+    theirs = _copy(block_chain)
+    _pay(block_chain, "ours", private_key, next_block)
+    grow(theirs, 3, "peer")
+    tip = block_chain.latest_block.hash_digest
+    before = _unspent(block_chain.unspent_tx_outs)
+    append = BlockStore.append
+
+    def fail_past_height_4(store, block):
+        if block.index > 4:
+            raise OSError("disk full")
+        return append(store, block)
+    monkeypatch.setattr(BlockStore, "append", fail_past_height_4)
+    with pytest.raises(OSError):
+        block_chain.connect_blocks(3, theirs.chain[4:])
+    assert block_chain.latest_block.hash_digest == tip
+    assert _unspent(block_chain.unspent_tx_outs) == before == _replayed(block_chain)
+    with pytest.raises(OSError):
+        block_chain.add_block(next_block(block_chain, [get_coinbase_transaction("x", 5)]))
+    assert _unspent(block_chain.unspent_tx_outs) == before
+
+    monkeypatch.setattr(BlockStore, "append", append)
+    block_chain.close()
+    block_chain = BlockChain.open(str(tmp_path))
+    assert block_chain.latest_block.hash_digest == tip
+    assert block_chain.connect_blocks(3, theirs.chain[4:]) is None
+    assert _unspent(block_chain.unspent_tx_outs) == _replayed(theirs)
+    block_chain.close()
@@ -0,0 +1,80 @@
+from coin.transaction import (
+    Transaction,
+    TxIn,
+    TxOut,
+    UnspentTxOut,
+    UnspentTxOutSet,
+    get_coinbase_transaction,
+    update_unspent_tx_outs,
+)
+from coin.wallet import get_balance, get_unspent_tx_outs_for_address
+
+
+def _outputs(count: int, address: str = "owner"):
+    return [UnspentTxOut("%064x" % (i + 1), 0, address, float(i + 1)) for i in range(count)]
+
+
+def test_find_add_and_spend():
+    outputs = _outputs(3)
+    unspent_tx_outs = UnspentTxOutSet(outputs)
+    assert len(unspent_tx_outs) == 3
+    assert unspent_tx_outs.find(outputs[1].tx_out_id, 0) is outputs[1]
+    assert unspent_tx_outs.find(outputs[1].tx_out_id, 1) is None
+    assert unspent_tx_outs.find("not hex", 0) is None
+    assert unspent_tx_outs.spend(outputs[1].tx_out_id, 0) is outputs[1]
+    assert unspent_tx_outs.spend(outputs[1].tx_out_id, 0) is None
+    assert outputs[1] not in unspent_tx_outs
+    assert list(unspent_tx_outs) == [outputs[0], outputs[2]]
+
+
+def test_list_interface_follows_insertion_order():
+    outputs = _outputs(4)
+    unspent_tx_outs = UnspentTxOutSet()
+    unspent_tx_outs.extend(outputs)
+    assert unspent_tx_outs[0] is outputs[0]
+    assert unspent_tx_outs[-1] is outputs[3]
+    assert unspent_tx_outs[1:3] == outputs[1:3]
+
+
+def test_apply_and_undo_transactions():
+    coinbase = get_coinbase_transaction("owner", 1)
+    unspent_tx_outs = UnspentTxOutSet()
+    unspent_tx_outs.apply_transactions([coinbase])
+    before = sorted(tuple(u.to_dict().values()) for u in unspent_tx_outs)
+    spend = Transaction(
+        [TxIn(coinbase.transaction_id, 0, None)],
+        [TxOut("receiver", 20.), TxOut("owner", 30.)]
+    )
+    undo = unspent_tx_outs.apply_transactions([spend])
+    assert unspent_tx_outs.find(coinbase.transaction_id, 0) is None
+    assert unspent_tx_outs.find(spend.transaction_id, 1).amount == 30.
+    unspent_tx_outs.undo_transactions(undo)
+    assert sorted(tuple(u.to_dict().values()) for u in unspent_tx_outs) == before
+
+
+def test_update_leaves_the_given_set_untouched():
+    coinbase = get_coinbase_transaction("owner", 1)
+    unspent_tx_outs = UnspentTxOutSet()
+    updated = update_unspent_tx_outs([coinbase], unspent_tx_outs)
+    assert len(unspent_tx_outs) == 0
+    assert len(updated) == 1
+    copy = updated.copy()
+    copy.spend(coinbase.transaction_id, 0)
+    assert len(updated) == 1
+
+
+def test_address_index_and_balances():
+    mine = _outputs(3, "me")
+    theirs = [UnspentTxOut("%064x" % 100, 0, "them", 5.)]
+    unspent_tx_outs = UnspentTxOutSet(mine + theirs)
+    assert unspent_tx_outs.balance("me") == 6.
+    assert unspent_tx_outs.balance("nobody") == 0.
+    assert unspent_tx_outs.for_address("me") == mine
+    assert get_balance("me", unspent_tx_outs) == get_balance("me", list(unspent_tx_outs))
+    unspent_tx_outs.spend(mine[0].tx_out_id, 0)
+    assert unspent_tx_outs.balance("me") == 5.
+    assert get_unspent_tx_outs_for_address("me", unspent_tx_outs) == mine[1:]
+    for u_tx_out in mine[1:]:
+        unspent_tx_outs.spend(u_tx_out.tx_out_id, 0)
+    assert unspent_tx_outs.balance("me") == 0.
+    assert unspent_tx_outs.for_address("me") == []
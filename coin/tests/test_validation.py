@@ -0,0 +1,148 @@
+import pytest
+
+from coin import codec
+from coin import transaction as transaction_module
+from coin.block import BlockChain
+from coin.transaction import (
+    SignatureCache,
+    Transaction,
+    TxIn,
+    TxOut,
+    get_coinbase_transaction,
+    validate_transactions,
+)
+from coin.wallet import create_transaction, get_signature
+
+
+def _state(block_chain: BlockChain):
+    return (
+        block_chain.length,
+        block_chain.latest_block.hashed_data,
+        sorted(tuple(u.to_dict().values()) for u in block_chain.unspent_tx_outs),
+    )
+
+
+def test_block_spending_our_outputs_is_accepted(funded_chain, private_key, next_block):
+    payment = create_transaction("receiver", 20., private_key, funded_chain.unspent_tx_outs)
+    coinbase = get_coinbase_transaction("miner", funded_chain.length)
+    assert funded_chain.add_block(next_block(funded_chain, [coinbase, payment])) is None
+    assert funded_chain.unspent_tx_outs.balance("receiver") == 20.
+
+
+def test_double_spend_in_one_block_is_rejected(funded_chain, private_key):
+    unspent_tx_outs = funded_chain.unspent_tx_outs
+    first = create_transaction("receiver", 50., private_key, unspent_tx_outs)
+    second = create_transaction("someone else", 50., private_key, unspent_tx_outs)
+    assert first.tx_ins[0].tx_out_id == second.tx_ins[0].tx_out_id
+    error = validate_transactions([first, second], unspent_tx_outs)
+    assert "double spends" in error
+
+
+def test_signature_of_another_key_is_rejected(funded_chain, private_key, other_private_key):
+    payment = create_transaction("receiver", 20., private_key, funded_chain.unspent_tx_outs)
+    payment.tx_ins[0].signature = get_signature(payment.transaction_id, other_private_key)
+    error = validate_transactions([payment], funded_chain.unspent_tx_outs, cache=None)
+    assert "invalid signature" in error
+
+
+def test_outputs_may_not_exceed_inputs(funded_chain, private_key):
+    payment = create_transaction("receiver", 20., private_key, funded_chain.unspent_tx_outs)
+    inflated = Transaction(
+        [TxIn(payment.tx_ins[0].tx_out_id, payment.tx_ins[0].tx_out_index, None)],
+        [TxOut("receiver", 60.)]
+    )
+    inflated.tx_ins[0].signature = get_signature(inflated.transaction_id, private_key)
+    error = validate_transactions([inflated], funded_chain.unspent_tx_outs)
+    assert "exceed" in error
+
+
+@pytest.mark.parametrize("make_coinbase, message", [
+    (lambda height: get_coinbase_transaction("miner", -1), "can't be encoded"),
+    (lambda height: get_coinbase_transaction("miner", height + 1), "is not for block"),
+    (
+        lambda height: Transaction([TxIn("", height, "")], [TxOut("miner", 51.)]),
+        "invalid outputs"
+    ),
+])
+def test_malformed_coinbase_is_rejected(funded_chain, next_block, make_coinbase, message):
+    before = _state(funded_chain)
+    block = next_block(funded_chain, [make_coinbase(funded_chain.length)])
+    error = funded_chain.add_block(block)
+    assert message in error
+    assert _state(funded_chain) == before
+
+
+def test_coinbase_must_come_first(funded_chain, private_key, next_block):
+    payment = create_transaction("receiver", 20., private_key, funded_chain.unspent_tx_outs)
+    coinbase = get_coinbase_transaction("miner", funded_chain.length)
+    error = funded_chain.add_block(next_block(funded_chain, [payment, coinbase]))
+    assert "is not first" in error
+
+
+def test_malformed_header_is_rejected(funded_chain, next_block):
+    block = next_block(funded_chain, [get_coinbase_transaction("miner", funded_chain.length)])
+    block.nonce = 1 << 64
+    assert "malformed header" in funded_chain.add_block(block)
+
+
+def test_validation_across_workers_matches_serial(
+    funded_chain, private_key, monkeypatch
+):
+    monkeypatch.setattr(transaction_module, "MIN_PARALLEL_SIGNATURES", 1)
+    # Each payment spends a different coinbase.
+    unspent_tx_outs = funded_chain.unspent_tx_outs.copy()
+    payments = []
+    for i in range(3):
+        payment = create_transaction(f"receiver-{i}", 10., private_key, unspent_tx_outs)
+        unspent_tx_outs.spend(payment.tx_ins[0].tx_out_id, payment.tx_ins[0].tx_out_index)
+        payments.append(payment)
+    unspent_tx_outs = funded_chain.unspent_tx_outs
+    for workers in (1, 2):
+        assert validate_transactions(payments, unspent_tx_outs, workers, cache=None) is None
+    payments[1].tx_ins[0].signature = payments[0].tx_ins[0].signature
+    for workers in (1, 2):
+        error = validate_transactions(payments, unspent_tx_outs, workers, cache=SignatureCache())
+        assert "invalid signature" in error
+
+
+def test_chain_verifies_blocks_across_validation_workers(
+    address, private_key, grow, next_block, monkeypatch
+):
+    monkeypatch.setattr(transaction_module, "MIN_PARALLEL_SIGNATURES", 1)
+    block_chain = BlockChain(validation_workers=2)
+    grow(block_chain, 2, address)
+    payment = create_transaction("receiver", 20., private_key, block_chain.unspent_tx_outs)
+    coinbase = get_coinbase_transaction("miner", block_chain.length)
+    transaction_module.signature_cache.clear()
+    assert block_chain.add_block(next_block(block_chain, [coinbase, payment])) is None
+
+
+@pytest.mark.parametrize("amount", [float("nan"), float("inf"), -1.])
+def test_outputs_must_have_finite_amounts(funded_chain, private_key, next_block, amount):
+    payment = create_transaction("receiver", 20., private_key, funded_chain.unspent_tx_outs)
+    broken = Transaction(
+        [TxIn(payment.tx_ins[0].tx_out_id, payment.tx_ins[0].tx_out_index, None)],
+        [TxOut("receiver", amount)]
+    )
+    broken.tx_ins[0].signature = get_signature(broken.transaction_id, private_key)
+    error = validate_transactions([broken], funded_chain.unspent_tx_outs)
+    assert "invalid output amount" in error
+    coinbase = get_coinbase_transaction("miner", funded_chain.length)
+    before = _state(funded_chain)
+    assert "invalid output amount" in funded_chain.add_block(
+        next_block(funded_chain, [coinbase, broken])
+    )
+    assert _state(funded_chain) == before
+
+
+@pytest.mark.parametrize("amount", [float("nan"), float("inf"), float("-inf")])
+def test_decoding_rejects_non_finite_amounts(private_key, funded_chain, amount):
+    payment = create_transaction("receiver", 20., private_key, funded_chain.unspent_tx_outs)
+    payment.tx_outs[0] = TxOut("receiver", amount)
+    payment.transaction_digest = payment._get_transaction_digest()
+    with pytest.raises(ValueError, match="Invalid output amount"):
+        Transaction.from_dict(payment.to_dict())
+    with pytest.raises(ValueError, match="Invalid output amount"):
+        codec.decode_transaction(codec.encode_transaction(payment))
+    with pytest.raises(ValueError, match="Invalid output amount"):
+        codec.decode_tx_out(codec.encode_tx_out(payment.tx_outs[0]))
@@ -0,0 +1,46 @@
+from coin.signing import get_signer, verify_signature
+from coin.transaction import UnspentTxOutSet, get_coinbase_transaction, validate_transactions
+from coin.wallet import create_transaction, get_signature, private_key_from_seed
+
+
+def test_signature_round_trip(private_key, address):
+    signature = get_signature("some data", private_key)
+    assert verify_signature(address, "some data", signature)
+    assert not verify_signature(address, "other data", signature)
+
+
+def test_signature_of_another_key_is_rejected(private_key, other_private_key):
+    signature = get_signature("some data", private_key)
+    assert not verify_signature(get_signer(other_private_key).public_key, "some data", signature)
+
+
+def test_malformed_signatures_and_addresses_are_rejected(private_key, address):
+    signature = get_signature("some data", private_key)
+    assert not verify_signature(address, "some data", "not base64!")
+    assert not verify_signature(address, "some data", signature[:-8])
+    assert not verify_signature("not an address", "some data", signature)
+
+
+def test_sign_many_signs_each_distinct_piece_once(private_key, address):
+    signatures = get_signer(private_key).sign_many(["a", "b", "a"])
+    assert signatures[0] == signatures[2]
+    assert all(
+        verify_signature(address, data, signature)
+        for data, signature in zip(["a", "b", "a"], signatures)
+    )
+
+
+def test_created_transactions_validate(private_key, address):
+    unspent_tx_outs = UnspentTxOutSet()
+    unspent_tx_outs.apply_transactions([get_coinbase_transaction(address, 1)])
+    transaction = create_transaction("receiver", 20., private_key, unspent_tx_outs)
+    assert [(t.address, t.amount) for t in transaction.tx_outs] == [
+        ("receiver", 20.), (address, 30.)
+    ]
+    assert validate_transactions([transaction], unspent_tx_outs, cache=None) is None
+
+
+def test_keys_from_a_seed_are_fixed(private_key, address):
+    assert private_key_from_seed(1) == private_key
+    assert private_key_from_seed(2) != private_key
+    assert get_signer(private_key_from_seed(1)).public_key == address
@@ -1,12 +1,32 @@
-from typing import List, Optional, Union
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from itertools import islice
+import json
+import math
+import multiprocessing
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from hashlib import sha256
 
+from coin import metrics
+from coin.signing import get_signer, verify_signature
+
 
 COINBASE_AMOUNT = 50.
+# Slack allowed when comparing float amounts of inputs and outputs.
+AMOUNT_TOLERANCE = 1e-9
+# Below this many signatures the pool's overhead outweighs the fan out.
+MIN_PARALLEL_SIGNATURES = 64
+SIGNATURE_CACHE_SIZE = 100_000
 
 
 class UnspentTxOut:
-    """Class for unspent transactions."""
+    """
+    Class for unspent transactions. There is one of these per unspent output,
+    so they are slotted and keep the raw 32 byte tx_out_digest; tx_out_id is
+    its hex. Immutable once created.
+    """
+    __slots__ = ("tx_out_digest", "tx_out_index", "address", "amount")
+
     def __init__(
         self,
         tx_out_id: str,
@@ -18,16 +38,416 @@ class UnspentTxOut:
         assert type(tx_out_index) == int
         assert type(address) == str
         assert type(amount) == float
-        self.tx_out_id = tx_out_id
-        self.tx_out_index = tx_out_index
-        self.address = address
-        self.amount = amount
+        set_attribute = object.__setattr__
+        set_attribute(self, "tx_out_digest", bytes.fromhex(tx_out_id))
+        set_attribute(self, "tx_out_index", tx_out_index)
+        set_attribute(self, "address", address)
+        set_attribute(self, "amount", amount)
+
+    @classmethod
+    def from_digest(
+        cls,
+        tx_out_digest: bytes,
+        tx_out_index: int,
+        address: str,
+        amount: float
+    ) -> "UnspentTxOut":
+        """Skips the hex round trip for outputs of a known transaction."""
+        u_tx_out = cls.__new__(cls)
+        # The slots' own setters, cheaper than object.__setattr__ by name.
+        _set_tx_out_digest(u_tx_out, tx_out_digest)
+        _set_tx_out_index(u_tx_out, tx_out_index)
+        _set_address(u_tx_out, address)
+        _set_amount(u_tx_out, amount)
+        return u_tx_out
+
+    @property
+    def tx_out_id(self) -> str:
+        return self.tx_out_digest.hex()
 
-    # TODO: Avoid setting attributes after creation.
+    def to_dict(self) -> dict:
+        return {
+            "tx_out_id": self.tx_out_id,
+            "tx_out_index": self.tx_out_index,
+            "address": self.address,
+            "amount": self.amount,
+        }
 
-    def __delattr__(self, key, value):
+    def __setattr__(self, key, value):
+        raise AttributeError("UnspentTxOut is immutable.")
+
+    def __delattr__(self, key):
         raise AttributeError("Cannot delete attributes.")
 
+    def __reduce__(self):
+        # Pickle through the constructor, slots can't be set afterwards.
+        return (
+            UnspentTxOut.from_digest,
+            (self.tx_out_digest, self.tx_out_index, self.address, self.amount)
+        )
+
+
+_set_tx_out_digest = UnspentTxOut.tx_out_digest.__set__
+_set_tx_out_index = UnspentTxOut.tx_out_index.__set__
+_set_address = UnspentTxOut.address.__set__
+_set_amount = UnspentTxOut.amount.__set__
+
+
+class UnspentTxOutSet:
+    """
+    Unspent transaction outputs keyed by (tx_out_id, tx_out_index), giving
+    O(1) lookup, add and spend. Iteration, len and integer indexing follow
+    insertion order, so the set can be passed wherever a List[UnspentTxOut]
+    used to be.
+
+    A secondary index from address to its outputs and a running balance is
+    kept up to date on every add and spend, so wallet queries only touch the
+    outputs of the address asked about. Addresses a wallet selects coins for
+    also get an AmountIndex (see amount_index), built on first use.
+    """
+    def __init__(self, unspent_tx_outs: Iterable[UnspentTxOut] = ()):
+        # Keyed by (tx_out_digest, tx_out_index), raw digests are half the
+        # size of hex ids.
+        self._unspent: Dict[Tuple[bytes, int], UnspentTxOut] = {}
+        self._by_address: Dict[str, Dict[Tuple[bytes, int], UnspentTxOut]] = {}
+        self._balances: Dict[str, float] = {}
+        # Not copied, a copy builds its own when asked.
+        self._amount_indexes: Dict[str, "AmountIndex"] = {}
+        if isinstance(unspent_tx_outs, UnspentTxOutSet):
+            self._unspent = unspent_tx_outs._unspent.copy()
+            self._by_address = {
+                address: u_tx_outs.copy()
+                for address, u_tx_outs in unspent_tx_outs._by_address.items()
+            }
+            self._balances = unspent_tx_outs._balances.copy()
+        else:
+            for u_tx_out in unspent_tx_outs:
+                self.add(u_tx_out)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[bytes, int, str, float]]) -> "UnspentTxOutSet":
+        """
+        Bulk load (tx_out_digest, tx_out_index, address, amount) rows of
+        distinct outpoints, eg; from a snapshot (see coin.snapshot).
+        """
+        unspent_tx_outs = cls()
+        unspent = unspent_tx_outs._unspent
+        by_address = unspent_tx_outs._by_address
+        balances = unspent_tx_outs._balances
+        from_digest = UnspentTxOut.from_digest
+        for tx_out_digest, tx_out_index, address, amount in rows:
+            key = (tx_out_digest, tx_out_index)
+            u_tx_out = from_digest(tx_out_digest, tx_out_index, address, amount)
+            unspent[key] = u_tx_out
+            address_tx_outs = by_address.get(address)
+            if address_tx_outs is None:
+                by_address[address] = {key: u_tx_out}
+                balances[address] = amount
+            else:
+                address_tx_outs[key] = u_tx_out
+                balances[address] += amount
+        return unspent_tx_outs
+
+    @staticmethod
+    def _key(tx_out_id: str, tx_out_index: int) -> Optional[Tuple[bytes, int]]:
+        try:
+            return (bytes.fromhex(tx_out_id), tx_out_index)
+        except (TypeError, ValueError):
+            # Not a transaction id, so not one of ours.
+            return None
+
+    def find(self, tx_out_id: str, tx_out_index: int) -> Optional[UnspentTxOut]:
+        return self._unspent.get(self._key(tx_out_id, tx_out_index))
+
+    def find_outpoint(self, tx_out_digest: bytes, tx_out_index: int) -> Optional[UnspentTxOut]:
+        """find, given the raw digest (eg; TxIn.tx_out_digest)."""
+        return self._unspent.get((tx_out_digest, tx_out_index))
+
+    def add(self, u_tx_out: UnspentTxOut):
+        key = (u_tx_out.tx_out_digest, u_tx_out.tx_out_index)
+        if key in self._unspent:
+            self._spend(key)
+        self._unspent[key] = u_tx_out
+        address = u_tx_out.address
+        self._by_address.setdefault(address, {})[key] = u_tx_out
+        self._balances[address] = self._balances.get(address, 0.) + u_tx_out.amount
+        amount_index = self._amount_indexes.get(address)
+        if amount_index is not None:
+            amount_index.add(u_tx_out)
+
+    def spend(self, tx_out_id: str, tx_out_index: int) -> Optional[UnspentTxOut]:
+        """Remove and return the output, None if it is not unspent."""
+        return self._spend(self._key(tx_out_id, tx_out_index))
+
+    def _spend(self, key: Optional[Tuple[bytes, int]]) -> Optional[UnspentTxOut]:
+        u_tx_out = self._unspent.pop(key, None)
+        if u_tx_out is None:
+            return None
+        address = u_tx_out.address
+        address_tx_outs = self._by_address[address]
+        del address_tx_outs[key]
+        amount_index = self._amount_indexes.get(address)
+        if amount_index is not None:
+            amount_index.remove(u_tx_out)
+        if address_tx_outs:
+            self._balances[address] -= u_tx_out.amount
+        else:
+            # Dropping empty addresses also resets any float drift in the
+            # running balance.
+            del self._by_address[address]
+            del self._balances[address]
+        return u_tx_out
+
+    def for_address(self, address: str) -> List[UnspentTxOut]:
+        """Unspent outputs belonging to `address`, in insertion order."""
+        return list(self._by_address.get(address, {}).values())
+
+    def balance(self, address: str) -> float:
+        return self._balances.get(address, 0.)
+
+    def amount_index(self, address: str) -> "AmountIndex":
+        """
+        The outputs of `address` sorted by amount, see coin.selection. Built
+        the first time an address is asked about and kept up to date from
+        then on, so only wallets pay for it.
+        """
+        amount_index = self._amount_indexes.get(address)
+        if amount_index is None:
+            amount_index = self._amount_indexes[address] = AmountIndex(
+                self._by_address.get(address, {}).values()
+            )
+        return amount_index
+
+    def apply_transactions(self, new_transactions: List["Transaction"]) -> "BlockUndo":
+        """
+        Spend every output consumed by `new_transactions` and add the outputs
+        they create, in place. Returns what undo_transactions needs to put
+        the set back as it was.
+        """
+        spent: List[UnspentTxOut] = []
+        for t in new_transactions:
+            for tx_in in t.tx_ins:
+                u_tx_out = self._spend((tx_in.tx_out_digest, tx_in.tx_out_index))
+                if u_tx_out is not None:
+                    spent.append(u_tx_out)
+        created: List[Tuple[bytes, int]] = []
+        for t in new_transactions:
+            for i, tx_out in enumerate(t.tx_outs):
+                key = (t.transaction_digest, i)
+                # An output replaced by one with the same outpoint is as
+                # good as spent.
+                replaced = self._spend(key)
+                if replaced is not None:
+                    spent.append(replaced)
+                self.add(UnspentTxOut.from_digest(
+                    t.transaction_digest, i, tx_out.address, tx_out.amount
+                ))
+                created.append(key)
+        return BlockUndo(spent, created)
+
+    def undo_transactions(self, undo: "BlockUndo"):
+        """Reverse the apply_transactions that returned `undo`, in place."""
+        for key in reversed(undo.created):
+            self._spend(key)
+        for u_tx_out in reversed(undo.spent):
+            self.add(u_tx_out)
+
+    def copy(self) -> "UnspentTxOutSet":
+        return UnspentTxOutSet(self)
+
+    # List compatible interface.
+
+    def append(self, u_tx_out: UnspentTxOut):
+        self.add(u_tx_out)
+
+    def extend(self, unspent_tx_outs: Iterable[UnspentTxOut]):
+        for u_tx_out in unspent_tx_outs:
+            self.add(u_tx_out)
+
+    def __getitem__(self, item: Union[int, slice]):
+        # O(n), only here so older callers indexing the list keep working.
+        if isinstance(item, slice):
+            return list(self)[item]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("UnspentTxOutSet index out of range")
+        return next(islice(self._unspent.values(), item, None))
+
+    def __contains__(self, u_tx_out: UnspentTxOut) -> bool:
+        return (u_tx_out.tx_out_digest, u_tx_out.tx_out_index) in self._unspent
+
+    def __iter__(self) -> Iterator[UnspentTxOut]:
+        return iter(self._unspent.values())
+
+    def __len__(self) -> int:
+        return len(self._unspent)
+
+
+class BlockUndo:
+    """
+    What applying a block's transactions changed: the unspent outputs they
+    spent and the outpoints (tx_out_digest, tx_out_index) they created. See
+    UnspentTxOutSet.apply_transactions.
+    """
+    __slots__ = ("spent", "created")
+
+    def __init__(self, spent: List[UnspentTxOut], created: List[Tuple[bytes, int]]):
+        self.spent: List[UnspentTxOut] = spent
+        self.created: List[Tuple[bytes, int]] = created
+
+
+class AmountIndex:
+    """
+    Unspent outputs sorted by amount, for coin selection. Lookups by amount
+    are a bisect, add and remove a bisect plus the list insert or delete.
+    Iterating gives the outputs in the order they were added.
+    """
+    def __init__(self, unspent_tx_outs: Iterable[UnspentTxOut] = ()):
+        self._outputs: Dict[Tuple[bytes, int], UnspentTxOut] = {
+            (u_tx_out.tx_out_digest, u_tx_out.tx_out_index): u_tx_out
+            for u_tx_out in unspent_tx_outs
+        }
+        # (amount, tx_out_digest, tx_out_index), ascending.
+        self._sorted: List[Tuple[float, bytes, int]] = sorted(
+            (u_tx_out.amount,) + key for key, u_tx_out in self._outputs.items()
+        )
+        self.total: float = sum(entry[0] for entry in self._sorted)
+
+    def add(self, u_tx_out: UnspentTxOut):
+        key = (u_tx_out.tx_out_digest, u_tx_out.tx_out_index)
+        if key in self._outputs:
+            self.remove(self._outputs[key])
+        self._outputs[key] = u_tx_out
+        insort(self._sorted, (u_tx_out.amount,) + key)
+        self.total += u_tx_out.amount
+
+    def remove(self, u_tx_out: UnspentTxOut):
+        key = (u_tx_out.tx_out_digest, u_tx_out.tx_out_index)
+        if self._outputs.pop(key, None) is None:
+            return
+        del self._sorted[bisect_left(self._sorted, (u_tx_out.amount,) + key)]
+        self.total -= u_tx_out.amount
+        if not self._outputs:
+            self.total = 0.
+
+    def copy(self) -> "AmountIndex":
+        amount_index = AmountIndex()
+        amount_index._outputs = self._outputs.copy()
+        amount_index._sorted = self._sorted.copy()
+        amount_index.total = self.total
+        return amount_index
+
+    def _output(self, entry: Tuple[float, bytes, int]) -> UnspentTxOut:
+        return self._outputs[entry[1:]]
+
+    def smallest_at_least(self, amount: float) -> Optional[UnspentTxOut]:
+        """The smallest output worth `amount` or more, None if there is none."""
+        position = bisect_left(self._sorted, (amount,))
+        if position == len(self._sorted):
+            return None
+        return self._output(self._sorted[position])
+
+    def at_most(self, amount: float) -> Iterator[UnspentTxOut]:
+        """Outputs worth `amount` or less, largest first."""
+        # Sorts after every key with this amount, digests are 32 bytes.
+        position = bisect_left(self._sorted, (amount, b"\xff" * 33))
+        for i in range(position - 1, -1, -1):
+            yield self._output(self._sorted[i])
+
+    def largest(self) -> Iterator[UnspentTxOut]:
+        for i in range(len(self._sorted) - 1, -1, -1):
+            yield self._output(self._sorted[i])
+
+    def smallest(self) -> Iterator[UnspentTxOut]:
+        for i in range(len(self._sorted)):
+            yield self._output(self._sorted[i])
+
+    def __iter__(self) -> Iterator[UnspentTxOut]:
+        return iter(list(self._outputs.values()))
+
+    def __len__(self) -> int:
+        return len(self._outputs)
+
+
+UnspentTxOuts = Union[List[UnspentTxOut], UnspentTxOutSet]
+
+
+class SignatureCache:
+    """
+    Bounded LRU of input signatures that are known to be valid, keyed by
+    (transaction_id, tx_in_index, pubkey). The transaction id does not cover
+    the signatures, so the verified signature is stored too and a lookup only
+    hits when it matches.
+    """
+    def __init__(self, maxsize: int = SIGNATURE_CACHE_SIZE):
+        self.maxsize: int = maxsize
+        self.hits: int = 0
+        self.misses: int = 0
+        self._verified: "OrderedDict[Tuple[str, int, str], str]" = OrderedDict()
+
+    def contains(
+        self,
+        transaction_id: str,
+        tx_in_index: int,
+        pubkey: str,
+        signature: str
+    ) -> bool:
+        key = (transaction_id, tx_in_index, pubkey)
+        if self._verified.get(key) == signature:
+            self._verified.move_to_end(key)
+            self.hits += 1
+            SIGNATURE_CACHE_HITS.inc()
+            return True
+        self.misses += 1
+        SIGNATURE_CACHE_MISSES.inc()
+        return False
+
+    def add(
+        self,
+        transaction_id: str,
+        tx_in_index: int,
+        pubkey: str,
+        signature: str
+    ):
+        key = (transaction_id, tx_in_index, pubkey)
+        self._verified[key] = signature
+        self._verified.move_to_end(key)
+        while len(self._verified) > self.maxsize:
+            self._verified.popitem(last=False)
+
+    def clear(self):
+        self._verified.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._verified)
+
+
+# Shared by signing and validation, so our own transactions and ones seen
+# before they arrive in a block skip the ECDSA work.
+signature_cache = SignatureCache()
+
+TRANSACTIONS_VALIDATED = metrics.Counter(
+    "coin_transactions_validated_total", "Transactions validated."
+)
+TRANSACTION_VALIDATION_SECONDS = metrics.Histogram(
+    "coin_transaction_validation_seconds", "Time to validate each batch of transactions."
+)
+SIGNATURE_VERIFICATIONS = metrics.Counter(
+    "coin_signature_verifications_total", "Input signatures verified with ECDSA."
+)
+SIGNATURE_CACHE_HITS = metrics.Counter(
+    "coin_signature_cache_hits_total", "Input signatures found in a signature cache."
+)
+SIGNATURE_CACHE_MISSES = metrics.Counter(
+    "coin_signature_cache_misses_total", "Input signatures not found in a signature cache."
+)
+UTXO_SET_SIZE = metrics.Gauge(
+    "coin_utxo_set_size", "Unspent outputs after the last update_unspent_tx_outs."
+)
+
 
 class TxIn:
     """
@@ -37,34 +457,100 @@ class TxIn:
     transactions that cover the transaction amount, the remaining unneeded
     coins go back to the sender as a transaction output.
     """
+    __slots__ = ("tx_out_digest", "tx_out_index", "signature")
+
     def __init__(self, tx_out_id: str, tx_out_index: int, signature: Optional[str]):
         assert type(tx_out_id) == str
         assert type(tx_out_index) == int
         assert type(signature) == str or signature is None
-        # This is the traansaction id and index of the tx out.
-        self.tx_out_id: str = tx_out_id
+        # This is the traansaction id and index of the tx out, the id kept
+        # as raw bytes (empty for a coinbase).
+        self.tx_out_digest: bytes = bytes.fromhex(tx_out_id)
         self.tx_out_index: int = tx_out_index
         self.signature: Optional[str] = signature  # Not the private key itself
 
+    @classmethod
+    def from_digest(
+        cls,
+        tx_out_digest: bytes,
+        tx_out_index: int,
+        signature: Optional[str]
+    ) -> "TxIn":
+        """Skips the hex round trip, eg; for inputs decoded by coin.codec."""
+        tx_in = cls.__new__(cls)
+        tx_in.tx_out_digest = tx_out_digest
+        tx_in.tx_out_index = tx_out_index
+        tx_in.signature = signature
+        return tx_in
+
+    @property
+    def tx_out_id(self) -> str:
+        return self.tx_out_digest.hex()
+
+    @tx_out_id.setter
+    def tx_out_id(self, tx_out_id: str):
+        self.tx_out_digest = bytes.fromhex(tx_out_id)
+
+    def to_dict(self) -> dict:
+        return {
+            "tx_out_id": self.tx_out_id,
+            "tx_out_index": self.tx_out_index,
+            "signature": self.signature,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "TxIn":
+        return cls(d["tx_out_id"], d["tx_out_index"], d["signature"])
+
 
 class TxOut:
     """Transaction output."""
+    __slots__ = ("address", "amount")
+
     def __init__(self, address: str, amount: float):
         assert type(address) == str
         assert type(amount) == float
         self.address: str = address
         self.amount: float = amount
 
+    def to_dict(self) -> dict:
+        return {"address": self.address, "amount": self.amount}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "TxOut":
+        """Raises ValueError when the amount is not valid, see is_valid_amount."""
+        amount = float(d["amount"])
+        if not is_valid_amount(amount):
+            raise ValueError(f"Invalid output amount {amount}.")
+        return cls(d["address"], amount)
+
+
+def is_valid_amount(amount: float) -> bool:
+    """
+    Outputs carry finite, non negative amounts. NaN compares false with
+    everything, so it would slip past any check written as a comparison.
+    """
+    return math.isfinite(amount) and amount >= 0
+
 
 class Transaction:
+    __slots__ = ("tx_ins", "tx_outs", "transaction_digest")
+
     def __init__(self, tx_ins: List[TxIn], tx_outs: List[TxOut]):
         for tx_in, tx_out in zip(tx_ins, tx_outs):
             assert isinstance(tx_in, TxIn) and isinstance(tx_out, TxOut)
         self.tx_ins: List[TxIn] = tx_ins
         self.tx_outs: List[TxOut] = tx_outs
-        self.transaction_id = self._get_transaction_id()
+        self.transaction_digest: bytes = self._get_transaction_digest()
+
+    @property
+    def transaction_id(self) -> str:
+        return self.transaction_digest.hex()
 
     def _get_transaction_id(self):
+        return self._get_transaction_digest().hex()
+
+    def _get_transaction_digest(self) -> bytes:
         tx_in_str: str = [
             tx_in.tx_out_id + str(tx_in.tx_out_index) for tx_in in self.tx_ins
         ]
@@ -72,11 +558,50 @@ class Transaction:
             tx_out.address + str(tx_out.amount) for tx_out in self.tx_outs
         ]
         unhashed_id: str = ''.join(tx_out_str) + ''.join(tx_in_str)
-        return sha256(unhashed_id.encode()).hexdigest()
+        return sha256(unhashed_id.encode()).digest()
+
+    def get_json(self):
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "tx_ins": [tx_in.to_dict() for tx_in in self.tx_ins],
+            "tx_outs": [tx_out.to_dict() for tx_out in self.tx_outs],
+            "transaction_id": self.transaction_id,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Transaction":
+        """Raises ValueError when the id does not match the contents."""
+        transaction = cls(
+            [TxIn.from_dict(tx_in) for tx_in in d["tx_ins"]],
+            [TxOut.from_dict(tx_out) for tx_out in d["tx_outs"]]
+        )
+        if d.get("transaction_id", transaction.transaction_id) != transaction.transaction_id:
+            raise ValueError("Transaction id does not match its contents.")
+        return transaction
+
+
+def transactions_to_json(transactions: List[Transaction]) -> str:
+    """A JSON list of transactions, see transactions_from_json."""
+    return json.dumps([transaction.to_dict() for transaction in transactions])
+
+
+def transactions_from_json(data: str) -> List[Transaction]:
+    """Raises ValueError when `data` does not hold a list of transactions."""
+    return transactions_from_dicts(json.loads(data))
+
+
+def transactions_from_dicts(dicts: List[dict]) -> List[Transaction]:
+    """Raises ValueError when `dicts` is not a list of transaction dicts."""
+    try:
+        return [Transaction.from_dict(d) for d in dicts]
+    except (KeyError, TypeError, AssertionError) as e:
+        raise ValueError("Not a list of transactions.") from e
 
 
 # TODO: Validations
-def get_tx_in_amount(tx_in: TxIn, a_unspent_tx_outs: List[UnspentTxOut]) -> float:
+def get_tx_in_amount(tx_in: TxIn, a_unspent_tx_outs: UnspentTxOuts) -> float:
     """Get amounts from unspent transactions."""
     u_tx_out = find_unspent_tx_out(
         tx_in.tx_out_id,
@@ -91,11 +616,13 @@ def get_tx_in_amount(tx_in: TxIn, a_unspent_tx_outs: List[UnspentTxOut]) -> floa
 def find_unspent_tx_out(
     transaction_id: str,
     index: int,
-    a_unspent_tx_outs: List[UnspentTxOut]
+    a_unspent_tx_outs: UnspentTxOuts
 ) -> Union[bool, UnspentTxOut]:
     """Lookup unspent transaction."""
-    # TODO: Would be good to do with sets/numpy.
     # Generally awkward to return Union[bool, UnspentTxOut]
+    if isinstance(a_unspent_tx_outs, UnspentTxOutSet):
+        u_tx_out = a_unspent_tx_outs.find(transaction_id, index)
+        return u_tx_out if u_tx_out else False
     for u_tx_out in a_unspent_tx_outs:
         if transaction_id == u_tx_out.tx_out_id and index == u_tx_out.tx_out_index:
             return u_tx_out
@@ -113,81 +640,236 @@ def sign_tx_in(
     transaction: Transaction,
     tx_in_index: int,
     private_key: str,
-    a_unspent_tx_outs: List[UnspentTxOut]
+    a_unspent_tx_outs: UnspentTxOuts
 ):
     """
     As the owner of unspent transactions, in order to spend the coins, you must
     prove that you own the coins by providing a signature. The signature shows
     that you have the private key that produced that public key (address).
     """
-    tx_in: TxIn = transaction.tx_ins[tx_in_index]
+    return sign_tx_ins(transaction, private_key, a_unspent_tx_outs, [tx_in_index])[0]
+
+
+def sign_tx_ins(
+    transaction: Transaction,
+    private_key: str,
+    a_unspent_tx_outs: UnspentTxOuts,
+    tx_in_indices: Optional[List[int]] = None
+) -> List[str]:
+    """
+    Batch version of sign_tx_in, signs the given inputs (all by default) with
+    a single loaded key.
+    """
+    signer = get_signer(private_key)
+    if tx_in_indices is None:
+        tx_in_indices = list(range(len(transaction.tx_ins)))
+    for tx_in_index in tx_in_indices:
+        tx_in: TxIn = transaction.tx_ins[tx_in_index]
+        referenced_unspent_tx_out: Union[bool, UnspentTxOut] = find_unspent_tx_out(
+            tx_in.tx_out_id, tx_in.tx_out_index, a_unspent_tx_outs
+        )
+        # TODO: Bit of a hack for now.
+        assert isinstance(referenced_unspent_tx_out, UnspentTxOut)
+        # Making sure that we are signing for a transaction (ie; trying to
+        # spend an unspent transaction) whose funds belong to our public key.
+        assert referenced_unspent_tx_out.address == signer.public_key
     data_to_sign: str = transaction.transaction_id
-    referenced_unspent_tx_out: Union[bool, UnspentTxOut] = find_unspent_tx_out(
-        tx_in.tx_out_id, tx_in.tx_out_index, a_unspent_tx_outs
+    signatures: List[str] = signer.sign_many(data_to_sign for _ in tx_in_indices)
+    for tx_in_index, signature in zip(tx_in_indices, signatures):
+        signature_cache.add(data_to_sign, tx_in_index, signer.public_key, signature)
+    return signatures
+
+
+def sign_transactions(
+    transactions: List[Transaction],
+    private_key: str,
+    a_unspent_tx_outs: UnspentTxOuts
+) -> List[List[str]]:
+    """
+    sign_tx_ins for every input of many transactions in a single signing
+    pass. Returns the signatures of each transaction's inputs.
+    """
+    signer = get_signer(private_key)
+    for transaction in transactions:
+        for tx_in in transaction.tx_ins:
+            referenced_unspent_tx_out: Union[bool, UnspentTxOut] = find_unspent_tx_out(
+                tx_in.tx_out_id, tx_in.tx_out_index, a_unspent_tx_outs
+            )
+            assert isinstance(referenced_unspent_tx_out, UnspentTxOut)
+            assert referenced_unspent_tx_out.address == signer.public_key
+    signatures: List[str] = signer.sign_many(
+        transaction.transaction_id for transaction in transactions
     )
-    # TODO: Hack to avoid circular dependency.
-    from coin.wallet import get_public_from_wallet, get_signature
-    # TODO: Bit of a hack for now.
-    assert isinstance(referenced_unspent_tx_out, UnspentTxOut)
-    referenced_address: str = referenced_unspent_tx_out.address
-    pubkey = get_public_from_wallet()
-    # Making sure that we are signing for a transaction (ie; trying to spend
-    # an unspent transaction) whoe funds belong to our public key.
-    assert referenced_address == pubkey
-    sig = get_signature(data_to_sign)
-    return sig
+    result: List[List[str]] = []
+    for transaction, signature in zip(transactions, signatures):
+        for tx_in_index in range(len(transaction.tx_ins)):
+            signature_cache.add(
+                transaction.transaction_id, tx_in_index, signer.public_key, signature
+            )
+        result.append([signature] * len(transaction.tx_ins))
+    return result
+
+
+def is_coinbase_transaction(transaction: Transaction) -> bool:
+    tx_ins = transaction.tx_ins
+    return len(tx_ins) == 1 and tx_ins[0].tx_out_digest == b""
+
+
+def _verify_signature(check: Tuple[str, str, str]) -> bool:
+    address, data, signature = check
+    return verify_signature(address, data, signature)
+
+
+_verification_pool = None
+_verification_pool_workers = 0
+
+
+def _get_verification_pool(workers: int):
+    """The pool is kept between calls so each block doesn't pay for a fork."""
+    global _verification_pool, _verification_pool_workers
+    if _verification_pool is None or _verification_pool_workers != workers:
+        if _verification_pool is not None:
+            _verification_pool.terminate()
+        _verification_pool = multiprocessing.Pool(workers)
+        _verification_pool_workers = workers
+    return _verification_pool
+
+
+def verify_signatures(
+    checks: List[Tuple[str, str, str]],
+    workers: int = 1
+) -> List[bool]:
+    """
+    Verify (address, data, signature) triples, fanned out across `workers`
+    processes when there are enough of them to be worth it.
+    """
+    SIGNATURE_VERIFICATIONS.inc(len(checks))
+    if workers > 1 and len(checks) >= MIN_PARALLEL_SIGNATURES:
+        pool = _get_verification_pool(workers)
+        chunksize = max(1, len(checks) // (workers * 4))
+        return pool.map(_verify_signature, checks, chunksize)
+    return [_verify_signature(check) for check in checks]
+
+
+def validate_transactions(
+    a_transactions: List[Transaction],
+    a_unspent_tx_outs: UnspentTxOuts,
+    workers: int = 1,
+    cache: Optional[SignatureCache] = signature_cache,
+    block_index: Optional[int] = None
+) -> Optional[str]:
+    """
+    Check a batch of transactions against the unspent outputs they are about
+    to be applied to: ids match their contents, every TxIn references an
+    existing unspent output that nothing else in the batch spends, inputs
+    cover outputs and every signature was made by the owner of the referenced
+    output. Only the first transaction may be a coinbase, and given the
+    `block_index` of the block the batch belongs to, its input must carry
+    that index (see get_coinbase_transaction). Returns an error message, None
+    when the batch is valid.
+
+    Signatures found in `cache` are not verified again, and newly verified
+    ones are added to it.
+    """
+    TRANSACTIONS_VALIDATED.inc(len(a_transactions))
+    with TRANSACTION_VALIDATION_SECONDS.time():
+        return _validate_transactions(
+            a_transactions, a_unspent_tx_outs, workers, cache, block_index
+        )
+
+
+def _validate_transactions(
+    a_transactions: List[Transaction],
+    a_unspent_tx_outs: UnspentTxOuts,
+    workers: int,
+    cache: Optional[SignatureCache],
+    block_index: Optional[int]
+) -> Optional[str]:
+    checks: List[Tuple[str, str, str]] = []
+    check_tx_in_indices: List[int] = []
+    spent: set = set()
+    for i, transaction in enumerate(a_transactions):
+        transaction_id: str = transaction.transaction_id
+        if transaction.transaction_digest != transaction._get_transaction_digest():
+            return f"Transaction {transaction_id} does not match its contents."
+        if not all(is_valid_amount(tx_out.amount) for tx_out in transaction.tx_outs):
+            return f"Transaction {transaction_id} has an invalid output amount."
+        if is_coinbase_transaction(transaction):
+            if i != 0:
+                return f"Coinbase transaction {transaction_id} is not first."
+            if (
+                len(transaction.tx_outs) != 1
+                or transaction.tx_outs[0].amount != COINBASE_AMOUNT
+            ):
+                return f"Coinbase transaction {transaction_id} has invalid outputs."
+            if block_index is not None and transaction.tx_ins[0].tx_out_index != block_index:
+                return f"Coinbase transaction {transaction_id} is not for block {block_index}."
+            continue
+        total_in = 0.
+        for tx_in_index, tx_in in enumerate(transaction.tx_ins):
+            outpoint = (tx_in.tx_out_id, tx_in.tx_out_index)
+            if outpoint in spent:
+                return f"Transaction {transaction_id} double spends {outpoint}."
+            spent.add(outpoint)
+            u_tx_out = find_unspent_tx_out(
+                tx_in.tx_out_id, tx_in.tx_out_index, a_unspent_tx_outs
+            )
+            if not u_tx_out:
+                return f"Transaction {transaction_id} spends missing output {outpoint}."
+            if tx_in.signature is None:
+                return f"Transaction {transaction_id} has an unsigned input."
+            total_in += u_tx_out.amount
+            if cache is not None and cache.contains(
+                transaction_id, tx_in_index, u_tx_out.address, tx_in.signature
+            ):
+                continue
+            checks.append((u_tx_out.address, transaction_id, tx_in.signature))
+            check_tx_in_indices.append(tx_in_index)
+        total_out = sum(tx_out.amount for tx_out in transaction.tx_outs)
+        if total_out > total_in + AMOUNT_TOLERANCE:
+            return f"Transaction {transaction_id} outputs exceed its inputs."
+    # All structural checks are done first so the expensive signature work is
+    # only spent on otherwise valid batches.
+    results: List[bool] = verify_signatures(checks, workers)
+    for check, tx_in_index, valid in zip(checks, check_tx_in_indices, results):
+        address, transaction_id, signature = check
+        if not valid:
+            return f"Transaction {transaction_id} has an invalid signature."
+        if cache is not None:
+            cache.add(transaction_id, tx_in_index, address, signature)
+    return None
 
 
 def process_transactions(
     a_transactions: List[Transaction],
-    a_unspent_transactions: List[UnspentTxOut]
-):
-    """Helper function for this."""
-    # TODO Validate on the receivers end. Rn I'm assuming they are benevolent
-    # and using this software to create transactions, which doesn't have to be
-    # the case.
+    a_unspent_transactions: UnspentTxOuts,
+    workers: int = 1
+) -> UnspentTxOutSet:
+    """
+    Validate the transactions (see validate_transactions) and apply them.
+    Raises ValueError on an invalid batch.
+    """
+    error: Optional[str] = validate_transactions(
+        a_transactions, a_unspent_transactions, workers
+    )
+    if error:
+        raise ValueError(error)
     return update_unspent_tx_outs(a_transactions, a_unspent_transactions)
 
 
 def update_unspent_tx_outs(
     new_transactions: List[Transaction],
-    a_unspent_tx_outs: List[UnspentTxOut]
-):
+    a_unspent_tx_outs: UnspentTxOuts
+) -> UnspentTxOutSet:
     """
-    After new_transactions come in, this function is used to update the list of
-    unspent transactions. That list is important to maintain to be able to
-    iterate through and see who has unspent transactions.
+    After new_transactions come in, this function is used to update the set of
+    unspent transactions. That set is important to maintain to be able to
+    see who has unspent transactions. The given outputs are left untouched,
+    use UnspentTxOutSet.apply_transactions to update a set in place.
     """
-    # TODO: Hack to avoid circular dependency.
-    from coin.wallet import get_public_from_wallet
     # In particular these would be the new ones from a new block
     # After that block had been validated.
-    # TODO: Not efficeint
-    # TODO: Wrap in UpdateUnspentTxOut
-    new_unspent_tx_outs: List[UnspentTxOut] = [
-        UnspentTxOut(
-            t.transaction_id,
-            i,
-            tx_out.address,
-            tx_out.amount
-        ) for t in new_transactions for i, tx_out in enumerate(t.tx_outs)
-    ]
-    consumed_tx_outs: List[UnspentTxOut] = [
-        UnspentTxOut(
-            tx_in.tx_out_id,
-            tx_in.tx_out_index,
-            "",
-            0.
-        ) for t in new_transactions for tx_in in t.tx_ins
-    ]
-    resulting_unspent_tx_outs: List[UnspentTxOut] = []
-    for u_tx_out in a_unspent_tx_outs:
-        found_tx_out: UnspentTxOut = find_unspent_tx_out(
-            u_tx_out.tx_out_id,
-            u_tx_out.tx_out_index,
-            consumed_tx_outs
-        )
-        if found_tx_out is False:
-            resulting_unspent_tx_outs.append(u_tx_out)
-    resulting_unspent_tx_outs += new_unspent_tx_outs
+    resulting_unspent_tx_outs = UnspentTxOutSet(a_unspent_tx_outs)
+    resulting_unspent_tx_outs.apply_transactions(new_transactions)
+    UTXO_SET_SIZE.set(len(resulting_unspent_tx_outs))
     return resulting_unspent_tx_outs
@@ -1,7 +1,17 @@
+import base64
+from itertools import islice
 import os
-from typing import List, Tuple
+import random
+from typing import Iterable, Iterator, List, Optional, Tuple
 
-from coin.transaction import UnspentTxOut, TxOut, Transaction, TxIn, sign_tx_in
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from coin import metrics
+from coin.selection import CONSOLIDATION_MAX_INPUTS, CoinSelector, fewest_inputs
+from coin.signing import get_signer
+from coin.transaction import AMOUNT_TOLERANCE, AmountIndex, UnspentTxOut, \
+    UnspentTxOuts, UnspentTxOutSet, TxOut, Transaction, TxIn, sign_transactions
 
 
 # TODO: Currently user creates this directory.
@@ -9,6 +19,21 @@ from coin.transaction import UnspentTxOut, TxOut, Transaction, TxIn, sign_tx_in
 PRIVATE_FILE_LOCATION = 'wallet/'
 PRIVATE_KEY_NAME = "keyo.pem"
 PUBLIC_KEY_NAME = "pubkeyo.pem"
+# Payments per transaction built by create_batch_transactions, not counting
+# the change output.
+MAX_BATCH_OUTPUTS = 100
+
+CREATE_TRANSACTION_SECONDS = metrics.Histogram(
+    "coin_create_transaction_seconds", "Time to build and sign each transaction."
+)
+CREATE_BATCH_SECONDS = metrics.Histogram(
+    "coin_create_batch_seconds", "Time to build and sign each batch of payments."
+)
+SELECTED_INPUTS = metrics.Histogram(
+    "coin_selected_inputs",
+    "Outputs spent by each transaction the wallet creates.",
+    buckets=(1, 2, 3, 5, 10, 25, 50, 100, 250)
+)
 
 
 def create_private_public_key():
@@ -52,17 +77,26 @@ def get_public_from_wallet():
     return public
 
 
-def get_signature(data: str):
-    """Produces signature from private key."""
-    data_loc = PRIVATE_FILE_LOCATION + "data"
-    os.system(f"echo -n {data} > {data_loc}")
-    priv_key = PRIVATE_FILE_LOCATION + PRIVATE_KEY_NAME
-    sig_file = PRIVATE_FILE_LOCATION + "sig.b64"
-    os.system(f"openssl dgst -sha1 -sign {priv_key} {data_loc} | base64 > {sig_file}")
-    with open(f"{sig_file}") as f:
-        content = f.read().splitlines()
-    signature = ''.join(content)
-    return signature
+def private_key_from_seed(seed: int) -> str:
+    """
+    A secp256k1 key that only depends on `seed`, in the format
+    get_private_from_wallet returns, so tests and benchmarks sign the same
+    way on every run. Anyone can derive it, never hold coins with it.
+    """
+    key = ec.derive_private_key(random.Random(seed).getrandbits(128) + 1, ec.SECP256K1())
+    der = key.private_bytes(
+        serialization.Encoding.DER,
+        serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption()
+    )
+    return base64.b64encode(der).decode()
+
+
+def get_signature(data: str, private_key: Optional[str] = None):
+    """Produces signature from private key, the wallet's by default."""
+    if private_key is None:
+        private_key = get_private_from_wallet()
+    return get_signer(private_key).sign(data)
 
 
 def init_wallet():
@@ -76,7 +110,9 @@ def init_wallet():
 
 
 #
-def get_balance(address: str, unspent_tx_outs: List[UnspentTxOut]) -> float:
+def get_balance(address: str, unspent_tx_outs: UnspentTxOuts) -> float:
+    if isinstance(unspent_tx_outs, UnspentTxOutSet):
+        return unspent_tx_outs.balance(address)
     amount = 0.
     for u_tx_out in unspent_tx_outs:
         if u_tx_out.address == address:
@@ -84,20 +120,24 @@ def get_balance(address: str, unspent_tx_outs: List[UnspentTxOut]) -> float:
     return amount
 
 
-#
-def find_tx_outs_for_amount(
-    amount: float,
-    my_unspent_tx_outs: List[UnspentTxOut]
-) -> Tuple[List[UnspentTxOut], float]:
-    current_amount = 0.
-    included_unspent_tx_outs: List[UnspentTxOut] = []
-    for my_unspent_tx_out in my_unspent_tx_outs:
-        included_unspent_tx_outs.append(my_unspent_tx_out)
-        current_amount += my_unspent_tx_out.amount
-        if current_amount >= amount:
-            left_over_amount = current_amount - amount
-            return included_unspent_tx_outs, left_over_amount
-    raise ValueError("Insufficeint funds")
+def get_unspent_tx_outs_for_address(
+    address: str,
+    unspent_tx_outs: UnspentTxOuts
+) -> List[UnspentTxOut]:
+    """Uses the address index when given an UnspentTxOutSet."""
+    if isinstance(unspent_tx_outs, UnspentTxOutSet):
+        return unspent_tx_outs.for_address(address)
+    return [u_tx_out for u_tx_out in unspent_tx_outs if u_tx_out.address == address]
+
+
+def get_amount_index(address: str, unspent_tx_outs: UnspentTxOuts) -> AmountIndex:
+    """
+    The outputs of `address` sorted by amount, kept up to date by the set
+    when given an UnspentTxOutSet and built on the spot otherwise.
+    """
+    if isinstance(unspent_tx_outs, UnspentTxOutSet):
+        return unspent_tx_outs.amount_index(address)
+    return AmountIndex(get_unspent_tx_outs_for_address(address, unspent_tx_outs))
 
 
 #
@@ -120,17 +160,155 @@ def create_transaction(
     receiver_address: str,
     amount: float,
     private_key: str,
-    unspent_tx_outs: List[UnspentTxOut]
+    unspent_tx_outs: UnspentTxOuts,
+    select_coins: CoinSelector = fewest_inputs
 ) -> Transaction:
-    """Helper function for creating transaction."""
-    my_address: str = get_public_from_wallet()
-    my_unspent_tx_outs: List[UnspentTxOut] = [
-        u_tx_out for u_tx_out in unspent_tx_outs if u_tx_out.address == my_address
-    ]
-    included_unspent_tx_outs, left_over_amount = find_tx_outs_for_amount(
-        amount,
-        my_unspent_tx_outs
+    """
+    Helper function for creating transaction. `select_coins` picks the
+    outputs it spends, see coin.selection.
+    """
+    with CREATE_TRANSACTION_SECONDS.time():
+        return _create_transaction(
+            receiver_address, amount, private_key, unspent_tx_outs, select_coins
+        )
+
+
+def _create_transaction(
+    receiver_address: str,
+    amount: float,
+    private_key: str,
+    unspent_tx_outs: UnspentTxOuts,
+    select_coins: CoinSelector
+) -> Transaction:
+    my_address: str = get_signer(private_key).public_key
+    included_unspent_tx_outs: List[UnspentTxOut] = select_coins(
+        amount, get_amount_index(my_address, unspent_tx_outs)
     )
+    tx = _unsigned_transaction(
+        included_unspent_tx_outs,
+        create_tx_outs(
+            receiver_address,
+            my_address,
+            amount,
+            _left_over_amount(included_unspent_tx_outs, amount)
+        )
+    )
+    _sign_transactions([tx], private_key, unspent_tx_outs)
+    return tx
+
+
+def create_batch_transactions(
+    payments: Iterable[Tuple[str, float]],
+    private_key: str,
+    unspent_tx_outs: UnspentTxOuts,
+    select_coins: CoinSelector = fewest_inputs,
+    max_outputs: int = MAX_BATCH_OUTPUTS
+) -> List[Transaction]:
+    """
+    Pay every (receiver_address, amount) in `payments` with as few
+    transactions as possible, each paying up to `max_outputs` of them plus
+    one change output. Coins are selected for all of them in one pass and
+    they are signed together. The transactions spend different outputs, so
+    they can all go in the same block. Raises ValueError if the wallet
+    can't cover every payment.
+    """
+    with CREATE_BATCH_SECONDS.time():
+        transactions: List[Transaction] = list(_unsigned_batch_transactions(
+            payments, private_key, unspent_tx_outs, select_coins, max_outputs
+        ))
+        _sign_transactions(transactions, private_key, unspent_tx_outs)
+        return transactions
+
+
+def stream_batch_transactions(
+    payments: Iterable[Tuple[str, float]],
+    private_key: str,
+    unspent_tx_outs: UnspentTxOuts,
+    select_coins: CoinSelector = fewest_inputs,
+    max_outputs: int = MAX_BATCH_OUTPUTS
+) -> Iterator[Transaction]:
+    """
+    create_batch_transactions, one signed transaction at a time, eg; for load
+    testing with an endless stream of payments. Every transaction is valid
+    against `unspent_tx_outs` and none spends an output an earlier one did.
+    Raises ValueError once the wallet runs out of outputs.
+    """
+    for tx in _unsigned_batch_transactions(
+        payments, private_key, unspent_tx_outs, select_coins, max_outputs
+    ):
+        _sign_transactions([tx], private_key, unspent_tx_outs)
+        yield tx
+
+
+def _unsigned_batch_transactions(
+    payments: Iterable[Tuple[str, float]],
+    private_key: str,
+    unspent_tx_outs: UnspentTxOuts,
+    select_coins: CoinSelector,
+    max_outputs: int
+) -> Iterator[Transaction]:
+    assert max_outputs > 0
+    my_address: str = get_signer(private_key).public_key
+    shared_outputs = outputs = get_amount_index(my_address, unspent_tx_outs)
+    payments = iter(payments)
+    while True:
+        batch: List[Tuple[str, float]] = list(islice(payments, max_outputs))
+        if not batch:
+            return
+        amount = sum(payment_amount for _, payment_amount in batch)
+        included_unspent_tx_outs: List[UnspentTxOut] = select_coins(amount, outputs)
+        tx_outs: List[TxOut] = [
+            TxOut(receiver_address, float(payment_amount))
+            for receiver_address, payment_amount in batch
+        ]
+        left_over_amount = _left_over_amount(included_unspent_tx_outs, amount)
+        if left_over_amount != 0:
+            tx_outs.append(TxOut(my_address, left_over_amount))
+        yield _unsigned_transaction(included_unspent_tx_outs, tx_outs)
+        # Later transactions select from what is left, the set's own index
+        # is left alone.
+        if outputs is shared_outputs:
+            outputs = shared_outputs.copy()
+        for u_tx_out in included_unspent_tx_outs:
+            outputs.remove(u_tx_out)
+
+
+def create_consolidation_transaction(
+    private_key: str,
+    unspent_tx_outs: UnspentTxOuts,
+    max_inputs: int = CONSOLIDATION_MAX_INPUTS
+) -> Optional[Transaction]:
+    """
+    Spend up to `max_inputs` of the wallet's smallest outputs back to itself
+    as a single output, eg; while the network is quiet, so later payments
+    need fewer inputs. None when there are fewer than two outputs to merge.
+    """
+    with CREATE_TRANSACTION_SECONDS.time():
+        my_address: str = get_signer(private_key).public_key
+        included_unspent_tx_outs: List[UnspentTxOut] = list(
+            islice(get_amount_index(my_address, unspent_tx_outs).smallest(), max_inputs)
+        )
+        if len(included_unspent_tx_outs) < 2:
+            return None
+        total = sum(u_tx_out.amount for u_tx_out in included_unspent_tx_outs)
+        tx = _unsigned_transaction(included_unspent_tx_outs, [TxOut(my_address, total)])
+        _sign_transactions([tx], private_key, unspent_tx_outs)
+        return tx
+
+
+def _left_over_amount(included_unspent_tx_outs: List[UnspentTxOut], amount: float) -> float:
+    left_over_amount = sum(u_tx_out.amount for u_tx_out in included_unspent_tx_outs) - amount
+    # No change output for float dust.
+    if abs(left_over_amount) <= AMOUNT_TOLERANCE:
+        return 0
+    return left_over_amount
+
+
+def _unsigned_transaction(
+    included_unspent_tx_outs: List[UnspentTxOut],
+    tx_outs: List[TxOut]
+) -> Transaction:
+    SELECTED_INPUTS.observe(len(included_unspent_tx_outs))
 
     def to_unsigned_tx_in(u_tx_out: UnspentTxOut):
         tx_in = TxIn(u_tx_out.tx_out_id, u_tx_out.tx_out_index, None)
@@ -141,10 +319,16 @@ def create_transaction(
         to_unsigned_tx_in(u_tx_out) for u_tx_out in included_unspent_tx_outs
     ]
     # TODO: Is it a problem that I make the tx id before signing?
-    tx = Transaction(
-        unsigned_tx_ins,
-        create_tx_outs(receiver_address, my_address, amount, left_over_amount)
-    )
-    for i, tx_in in enumerate(tx.tx_ins):
-        tx_in.signature = sign_tx_in(tx, i, private_key, unspent_tx_outs)
-    return tx
+    return Transaction(unsigned_tx_ins, tx_outs)
+
+
+def _sign_transactions(
+    transactions: List[Transaction],
+    private_key: str,
+    unspent_tx_outs: UnspentTxOuts
+):
+    for tx, signatures in zip(
+        transactions, sign_transactions(transactions, private_key, unspent_tx_outs)
+    ):
+        for tx_in, signature in zip(tx.tx_ins, signatures):
+            tx_in.signature = signature
@@ -1,6 +1,6 @@
-import setuptools
+import re
 
-import coin
+import setuptools
 
 
 def get_package_description() -> str:
@@ -10,9 +10,19 @@ def get_package_description() -> str:
     return readme
 
 
+def get_version() -> str:
+    """
+    Returns coin.__version__. Read from the source rather than imported, as
+    importing coin needs the requirements installed.
+    """
+    with open("coin/__init__.py", "r") as stream:
+        source: str = stream.read()
+    return re.search(r'^__version__ = "([^"]+)"', source, re.M).group(1)
+
+
 setuptools.setup(
     name="coin",
-    version=coin.__version__,
+    version=get_version(),
     author="Colin Manko",
     author_email="",
     description="",